@@ -14,7 +14,7 @@ from sqlalchemy.pool import NullPool
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 from app.db.base import Base  # import models metadata
-from app.models import product, location, inventory, partners, purchase  # noqa
+from app.models import product, location, inventory, partners, purchase, idempotency  # noqa
 from app.core.config import settings
 
 config = context.config
@@ -0,0 +1,69 @@
+"""inventory stripes for hot SKUs
+
+Revision ID: 1d551e8209f9
+Revises: 24cdd204c198
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "1d551e8209f9"
+down_revision = "24cdd204c198"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'product',
+        sa.Column('stock_stripes', sa.SmallInteger(), server_default=sa.text('1'), nullable=False)
+    )
+    op.create_table(
+        'inventory_item_stripe',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('product_id', sa.UUID(), nullable=False),
+        sa.Column('location_id', sa.UUID(), nullable=False),
+        sa.Column('stripe', sa.SmallInteger(), nullable=False),
+        sa.Column('on_hand', sa.Numeric(14, 4), nullable=False),
+        sa.Column('reserved', sa.Numeric(14, 4), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column(
+            'created_at',
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False
+        ),
+        sa.Column(
+            'updated_at',
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False
+        ),
+        sa.ForeignKeyConstraint(['location_id'], ['location.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint(
+            'product_id', 'location_id', 'stripe', name='uq_inventory_item_stripe_key'
+        )
+    )
+
+
+def downgrade() -> None:
+    # fold stripes back into their base rows so no stock is lost
+    op.execute(
+        """
+        UPDATE inventory_item i
+        SET on_hand = i.on_hand + s.on_hand, reserved = i.reserved + s.reserved
+        FROM (
+            SELECT product_id, location_id, sum(on_hand) AS on_hand, sum(reserved) AS reserved
+            FROM inventory_item_stripe
+            GROUP BY product_id, location_id
+        ) s
+        WHERE i.product_id = s.product_id AND i.location_id = s.location_id
+        """
+    )
+    op.drop_table('inventory_item_stripe')
+    op.drop_column('product', 'stock_stripes')
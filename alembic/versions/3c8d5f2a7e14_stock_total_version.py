@@ -0,0 +1,29 @@
+"""version counter on per-product stock totals
+
+Revision ID: 3c8d5f2a7e14
+Revises: b7e3c9a15d42
+Create Date: 2026-10-20 09:41:27.305118
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3c8d5f2a7e14"
+down_revision = "b7e3c9a15d42"
+branch_labels = None
+depends_on = None
+
+
+# Bumped by every compaction that folds deltas into the row: together with the pending
+# deltas it tells read coalescing whether two requests may share one result.
+def upgrade() -> None:
+    op.add_column(
+        'product_stock_total',
+        sa.Column('version', sa.BigInteger(), server_default=sa.text('1'), nullable=False)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('product_stock_total', 'version')
@@ -0,0 +1,51 @@
+"""change counter on product and location rows
+
+Revision ID: 5b1d9f3e8c27
+Revises: 9e4b7d2c6a18
+Create Date: 2026-10-20 13:52:09.118463
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5b1d9f3e8c27"
+down_revision = "9e4b7d2c6a18"
+branch_labels = None
+depends_on = None
+
+# The catalogue ETag summed count and max(updated_at). updated_at is now(), the start
+# of the writing transaction, so a long one (a product import) could commit without
+# moving the max and clients kept getting 304. The sum of per-row versions moves with
+# every committed update; a trigger bumps it, so Core UPDATEs and imports count too.
+BUMP_FUNCTION = """
+CREATE FUNCTION bump_row_version() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    RETURN NEW;
+END
+$$;
+"""
+
+TABLES = ("product", "location")
+
+
+def upgrade() -> None:
+    op.execute(BUMP_FUNCTION)
+    for table in TABLES:
+        op.add_column(
+            table,
+            sa.Column('version', sa.BigInteger(), server_default=sa.text('1'), nullable=False)
+        )
+        op.execute(
+            f"CREATE TRIGGER {table}_version BEFORE UPDATE ON {table} "
+            "FOR EACH ROW EXECUTE FUNCTION bump_row_version()"
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER {table}_version ON {table}")
+        op.drop_column(table, 'version')
+    op.execute("DROP FUNCTION bump_row_version()")
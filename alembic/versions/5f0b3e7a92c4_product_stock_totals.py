@@ -0,0 +1,100 @@
+"""per-product stock totals maintained by triggers
+
+Revision ID: 5f0b3e7a92c4
+Revises: e2a7d4c81f06
+Create Date: 2026-10-18 14:02:36.281547
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5f0b3e7a92c4"
+down_revision = "e2a7d4c81f06"
+branch_labels = None
+depends_on = None
+
+# Statement-level triggers fold each statement's net change per product into
+# product_stock_total: one upsert per affected (product, slot), however many rows the
+# statement touched. PostgreSQL allows transition tables only on single-event
+# triggers, hence one function per (table, event).
+TRIGGER_FUNCTION = """
+CREATE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO product_stock_total AS t (product_id, slot, on_hand, reserved)
+    SELECT d.product_id, d.slot, sum(d.on_hand), sum(d.reserved)
+    FROM ({delta}) d
+    -- rows removed by ON DELETE CASCADE of a product: nothing left to total
+    WHERE EXISTS (SELECT 1 FROM product p WHERE p.id = d.product_id)
+    GROUP BY d.product_id, d.slot
+    HAVING sum(d.on_hand) <> 0 OR sum(d.reserved) <> 0
+    ORDER BY d.product_id, d.slot
+    ON CONFLICT (product_id, slot) DO UPDATE
+        SET on_hand = t.on_hand + EXCLUDED.on_hand,
+            reserved = t.reserved + EXCLUDED.reserved;
+    RETURN NULL;
+END
+$$;
+"""
+
+NEW_ROWS = "SELECT product_id, {slot} AS slot, on_hand, reserved FROM new_rows"
+OLD_ROWS = (
+    "SELECT product_id, {slot} AS slot, -on_hand AS on_hand, -reserved AS reserved FROM old_rows"
+)
+
+EVENTS = (
+    # (suffix, event, REFERENCING clause, net change of the statement)
+    ("ins", "INSERT", "NEW TABLE AS new_rows", NEW_ROWS),
+    (
+        "upd",
+        "UPDATE",
+        "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+        f"{NEW_ROWS} UNION ALL {OLD_ROWS}",
+    ),
+    ("del", "DELETE", "OLD TABLE AS old_rows", OLD_ROWS),
+)
+
+SOURCES = (
+    # (table, slot expression): stripe 0 is the inventory_item row itself
+    ("inventory_item", "0"),
+    ("inventory_item_stripe", "stripe"),
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        'product_stock_total',
+        sa.Column('product_id', sa.UUID(), nullable=False),
+        sa.Column('slot', sa.SmallInteger(), nullable=False),
+        sa.Column('on_hand', sa.Numeric(18, 4), server_default=sa.text('0'), nullable=False),
+        sa.Column('reserved', sa.Numeric(18, 4), server_default=sa.text('0'), nullable=False),
+        sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('product_id', 'slot')
+    )
+    op.execute(
+        """
+        INSERT INTO product_stock_total (product_id, slot, on_hand, reserved)
+        SELECT product_id, 0, sum(on_hand), sum(reserved)
+        FROM inventory_item GROUP BY product_id
+        UNION ALL
+        SELECT product_id, stripe, sum(on_hand), sum(reserved)
+        FROM inventory_item_stripe GROUP BY product_id, stripe
+        """
+    )
+    for table, slot in SOURCES:
+        for suffix, event, referencing, delta in EVENTS:
+            name = f"{table}_total_{suffix}"
+            op.execute(TRIGGER_FUNCTION.format(name=name, delta=delta.format(slot=slot)))
+            op.execute(
+                f"CREATE TRIGGER {name} AFTER {event} ON {table} REFERENCING {referencing} "
+                f"FOR EACH STATEMENT EXECUTE FUNCTION {name}()"
+            )
+
+
+def downgrade() -> None:
+    for table, _slot in SOURCES:
+        for suffix, *_rest in EVENTS:
+            op.execute(f"DROP TRIGGER {table}_total_{suffix} ON {table}")
+            op.execute(f"DROP FUNCTION {table}_total_{suffix}()")
+    op.drop_table('product_stock_total')
@@ -0,0 +1,114 @@
+"""append-only deltas for per-product stock totals
+
+Revision ID: 6d2e8b4f1a39
+Revises: f3b9d2a6c571
+Create Date: 2026-10-19 10:12:44.508213
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "6d2e8b4f1a39"
+down_revision = "f3b9d2a6c571"
+branch_labels = None
+depends_on = None
+
+# The totals triggers used to upsert product_stock_total directly. That row lock is
+# taken in the order the statement touches items, not in canonical order, so two
+# transactions on disjoint items of the same products could deadlock, and every write
+# to a hot product queued on its total row. The triggers now only append the
+# statement's net change; readers add pending deltas, a periodic job folds them in.
+DELTA_FUNCTION = """
+CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO product_stock_delta (product_id, slot, on_hand, reserved)
+    SELECT d.product_id, d.slot, sum(d.on_hand), sum(d.reserved)
+    FROM ({delta}) d
+    -- rows removed by ON DELETE CASCADE of a product: nothing left to total
+    WHERE EXISTS (SELECT 1 FROM product p WHERE p.id = d.product_id)
+    GROUP BY d.product_id, d.slot
+    HAVING sum(d.on_hand) <> 0 OR sum(d.reserved) <> 0;
+    RETURN NULL;
+END
+$$;
+"""
+
+# previous body, for downgrade
+UPSERT_FUNCTION = """
+CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO product_stock_total AS t (product_id, slot, on_hand, reserved)
+    SELECT d.product_id, d.slot, sum(d.on_hand), sum(d.reserved)
+    FROM ({delta}) d
+    -- rows removed by ON DELETE CASCADE of a product: nothing left to total
+    WHERE EXISTS (SELECT 1 FROM product p WHERE p.id = d.product_id)
+    GROUP BY d.product_id, d.slot
+    HAVING sum(d.on_hand) <> 0 OR sum(d.reserved) <> 0
+    ORDER BY d.product_id, d.slot
+    ON CONFLICT (product_id, slot) DO UPDATE
+        SET on_hand = t.on_hand + EXCLUDED.on_hand,
+            reserved = t.reserved + EXCLUDED.reserved;
+    RETURN NULL;
+END
+$$;
+"""
+
+NEW_ROWS = "SELECT product_id, {slot} AS slot, on_hand, reserved FROM new_rows"
+OLD_ROWS = (
+    "SELECT product_id, {slot} AS slot, -on_hand AS on_hand, -reserved AS reserved FROM old_rows"
+)
+
+EVENTS = (
+    # (suffix, net change of the statement)
+    ("ins", NEW_ROWS),
+    ("upd", f"{NEW_ROWS} UNION ALL {OLD_ROWS}"),
+    ("del", OLD_ROWS),
+)
+
+SOURCES = (
+    # (table, slot expression): stripe 0 is the inventory_item row itself
+    ("inventory_item", "0"),
+    ("inventory_item_stripe", "stripe"),
+)
+
+
+def _replace_functions(template: str) -> None:
+    for table, slot in SOURCES:
+        for suffix, delta in EVENTS:
+            name = f"{table}_total_{suffix}"
+            op.execute(template.format(name=name, delta=delta.format(slot=slot)))
+
+
+def upgrade() -> None:
+    op.create_table(
+        'product_stock_delta',
+        sa.Column('id', sa.BigInteger(), sa.Identity(always=True), nullable=False),
+        sa.Column('product_id', sa.UUID(), nullable=False),
+        sa.Column('slot', sa.SmallInteger(), nullable=False),
+        sa.Column('on_hand', sa.Numeric(18, 4), nullable=False),
+        sa.Column('reserved', sa.Numeric(18, 4), nullable=False),
+        sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_product_stock_delta_product_id', 'product_stock_delta', ['product_id'], unique=False
+    )
+    _replace_functions(DELTA_FUNCTION)
+
+
+def downgrade() -> None:
+    _replace_functions(UPSERT_FUNCTION)
+    op.execute(
+        """
+        INSERT INTO product_stock_total AS t (product_id, slot, on_hand, reserved)
+        SELECT product_id, slot, sum(on_hand), sum(reserved)
+        FROM product_stock_delta GROUP BY product_id, slot
+        ON CONFLICT (product_id, slot) DO UPDATE
+            SET on_hand = t.on_hand + EXCLUDED.on_hand,
+                reserved = t.reserved + EXCLUDED.reserved
+        """
+    )
+    op.drop_index('ix_product_stock_delta_product_id', table_name='product_stock_delta')
+    op.drop_table('product_stock_delta')
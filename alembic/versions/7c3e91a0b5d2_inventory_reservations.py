@@ -0,0 +1,63 @@
+"""inventory reservations with ttl
+
+Revision ID: 7c3e91a0b5d2
+Revises: 1d551e8209f9
+Create Date: 2026-10-18 11:40:07.902115
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7c3e91a0b5d2"
+down_revision = "1d551e8209f9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'inventory_reservation',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('product_id', sa.UUID(), nullable=False),
+        sa.Column('location_id', sa.UUID(), nullable=False),
+        sa.Column('reference', sa.String(length=255), nullable=True),
+        sa.Column('qty', sa.Numeric(14, 4), nullable=False),
+        sa.Column('expires_at', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column(
+            'created_at',
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False
+        ),
+        sa.Column(
+            'updated_at',
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False
+        ),
+        sa.ForeignKeyConstraint(['location_id'], ['location.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_inventory_reservation_key_reference',
+        'inventory_reservation',
+        ['product_id', 'location_id', 'reference'],
+        unique=False
+    )
+    # sweeper reads only rows that can expire, ordered by expires_at
+    op.create_index(
+        'ix_inventory_reservation_expires_at',
+        'inventory_reservation',
+        ['expires_at'],
+        unique=False,
+        postgresql_where=sa.text('expires_at IS NOT NULL')
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_inventory_reservation_expires_at', table_name='inventory_reservation')
+    op.drop_index('ix_inventory_reservation_key_reference', table_name='inventory_reservation')
+    op.drop_table('inventory_reservation')
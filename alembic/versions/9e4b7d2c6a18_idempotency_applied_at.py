@@ -0,0 +1,28 @@
+"""mark idempotency keys whose request has committed its changes
+
+Revision ID: 9e4b7d2c6a18
+Revises: 3c8d5f2a7e14
+Create Date: 2026-10-20 11:16:52.870394
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9e4b7d2c6a18"
+down_revision = "3c8d5f2a7e14"
+branch_labels = None
+depends_on = None
+
+
+# Set in the same transaction as the request's own changes: a key whose changes went
+# through is never released for another run, even if storing its response failed.
+def upgrade() -> None:
+    op.add_column(
+        'idempotency_key', sa.Column('applied_at', sa.TIMESTAMP(timezone=True), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('idempotency_key', 'applied_at')
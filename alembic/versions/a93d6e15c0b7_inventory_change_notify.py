@@ -0,0 +1,57 @@
+"""notify listeners about inventory changes
+
+Revision ID: a93d6e15c0b7
+Revises: 5f0b3e7a92c4
+Create Date: 2026-10-18 14:51:09.377162
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a93d6e15c0b7"
+down_revision = "5f0b3e7a92c4"
+branch_labels = None
+depends_on = None
+
+# One NOTIFY per product touched by a statement; PostgreSQL delivers them at commit
+# and folds duplicates within a transaction.
+NOTIFY_FUNCTION = """
+CREATE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('inventory_changed', c.product_id::text)
+    FROM (SELECT DISTINCT product_id FROM {rows}) c;
+    RETURN NULL;
+END
+$$;
+"""
+
+FUNCTIONS = (("inventory_notify_new", "new_rows"), ("inventory_notify_old", "old_rows"))
+
+TRIGGERS = (
+    # (suffix, event, REFERENCING clause, function)
+    ("ins", "INSERT", "NEW TABLE AS new_rows", "inventory_notify_new"),
+    ("upd", "UPDATE", "NEW TABLE AS new_rows", "inventory_notify_new"),
+    ("del", "DELETE", "OLD TABLE AS old_rows", "inventory_notify_old"),
+)
+
+TABLES = ("inventory_item", "inventory_item_stripe")
+
+
+def upgrade() -> None:
+    for name, rows in FUNCTIONS:
+        op.execute(NOTIFY_FUNCTION.format(name=name, rows=rows))
+    for table in TABLES:
+        for suffix, event, referencing, function in TRIGGERS:
+            op.execute(
+                f"CREATE TRIGGER {table}_notify_{suffix} AFTER {event} ON {table} "
+                f"REFERENCING {referencing} FOR EACH STATEMENT EXECUTE FUNCTION {function}()"
+            )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        for suffix, *_rest in TRIGGERS:
+            op.execute(f"DROP TRIGGER {table}_notify_{suffix} ON {table}")
+    for name, _rows in FUNCTIONS:
+        op.execute(f"DROP FUNCTION {name}()")
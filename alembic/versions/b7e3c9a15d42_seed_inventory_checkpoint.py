@@ -0,0 +1,58 @@
+"""seed the base inventory checkpoint from live balances
+
+Revision ID: b7e3c9a15d42
+Revises: 6d2e8b4f1a39
+Create Date: 2026-10-19 11:03:18.772940
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b7e3c9a15d42"
+down_revision = "6d2e8b4f1a39"
+branch_labels = None
+depends_on = None
+
+# The journal written before the single-statement write paths cannot be replayed:
+# negative adjustments there have no from_location_id, so folding it into a first
+# checkpoint overstated every balance from then on. The base checkpoint is taken from
+# the live balances (items plus stripes) instead, for every pair, and replaces the
+# checkpoints folded so far. Its time goes to inventory_history_start: as-of queries
+# before it are rejected.
+#
+# SHARE locks wait for running writers and hold off new ones while the balances are
+# read, so the snapshot matches the journal up to taken_at.
+SEED = """
+WITH cut AS (SELECT clock_timestamp() AS taken_at),
+stripes AS (
+    SELECT product_id, location_id, sum(on_hand) AS on_hand, sum(reserved) AS reserved
+    FROM inventory_item_stripe GROUP BY product_id, location_id
+),
+seeded AS (
+    INSERT INTO inventory_checkpoint (product_id, location_id, taken_at, on_hand, reserved)
+    SELECT i.product_id, i.location_id, cut.taken_at,
+           i.on_hand + coalesce(s.on_hand, 0), i.reserved + coalesce(s.reserved, 0)
+    FROM inventory_item i
+    LEFT JOIN stripes s USING (product_id, location_id)
+    CROSS JOIN cut
+)
+INSERT INTO inventory_history_start (starts_at) SELECT taken_at FROM cut
+"""
+
+
+def upgrade() -> None:
+    op.create_table(
+        'inventory_history_start',
+        sa.Column('starts_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('starts_at')
+    )
+    op.execute("LOCK TABLE inventory_item, inventory_item_stripe IN SHARE MODE")
+    op.execute("DELETE FROM inventory_checkpoint")
+    op.execute(SEED)
+
+
+def downgrade() -> None:
+    # the checkpoints folded from the legacy journal were wrong; they are not restored
+    op.drop_table('inventory_history_start')
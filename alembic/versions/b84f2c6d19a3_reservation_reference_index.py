@@ -0,0 +1,28 @@
+"""index inventory reservations by reference
+
+Revision ID: b84f2c6d19a3
+Revises: 7c3e91a0b5d2
+Create Date: 2026-10-18 12:26:53.114870
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b84f2c6d19a3"
+down_revision = "7c3e91a0b5d2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_inventory_reservation_reference',
+        'inventory_reservation',
+        ['reference'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_inventory_reservation_reference', table_name='inventory_reservation')
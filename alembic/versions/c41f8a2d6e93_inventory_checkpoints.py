@@ -0,0 +1,69 @@
+"""inventory balance checkpoints and journal time indexes
+
+Revision ID: c41f8a2d6e93
+Revises: a93d6e15c0b7
+Create Date: 2026-10-18 15:37:52.614208
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c41f8a2d6e93"
+down_revision = "a93d6e15c0b7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'inventory_checkpoint',
+        sa.Column('product_id', sa.UUID(), nullable=False),
+        sa.Column('location_id', sa.UUID(), nullable=False),
+        sa.Column('taken_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('on_hand', sa.Numeric(18, 4), nullable=False),
+        sa.Column('reserved', sa.Numeric(18, 4), nullable=False),
+        sa.ForeignKeyConstraint(['location_id'], ['location.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('product_id', 'location_id', 'taken_at')
+    )
+    op.create_index(
+        'ix_inventory_checkpoint_taken_at', 'inventory_checkpoint', ['taken_at'], unique=False
+    )
+    # the journal only grows; build its indexes without blocking writers
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_inventory_txn_product_created_at',
+            'inventory_txn',
+            ['product_id', 'created_at'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_inventory_txn_created_at',
+            'inventory_txn',
+            ['created_at', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_inventory_txn_created_at',
+            table_name='inventory_txn',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            'ix_inventory_txn_product_created_at',
+            table_name='inventory_txn',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_index('ix_inventory_checkpoint_taken_at', table_name='inventory_checkpoint')
+    op.drop_table('inventory_checkpoint')
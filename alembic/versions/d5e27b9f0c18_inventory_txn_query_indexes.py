@@ -0,0 +1,46 @@
+"""indexes for journal queries by location and reference
+
+Revision ID: d5e27b9f0c18
+Revises: c41f8a2d6e93
+Create Date: 2026-10-18 16:12:40.538871
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d5e27b9f0c18"
+down_revision = "c41f8a2d6e93"
+branch_labels = None
+depends_on = None
+
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction; an interrupted build
+# leaves an INVALID index behind, which has to be dropped before running this again.
+INDEXES = (
+    ("ix_inventory_txn_from_location_created_at", ["from_location_id", "created_at"], None),
+    ("ix_inventory_txn_to_location_created_at", ["to_location_id", "created_at"], None),
+    ("ix_inventory_txn_reference", ["reference"], "reference IS NOT NULL"),
+)
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, columns, where in INDEXES:
+            op.create_index(
+                name,
+                'inventory_txn',
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                postgresql_where=sa.text(where) if where else None,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _columns, _where in reversed(INDEXES):
+            op.drop_index(
+                name, table_name='inventory_txn', postgresql_concurrently=True, if_exists=True
+            )
@@ -0,0 +1,42 @@
+"""idempotency keys
+
+Revision ID: e2a7d4c81f06
+Revises: b84f2c6d19a3
+Create Date: 2026-10-18 13:08:22.540391
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e2a7d4c81f06"
+down_revision = "b84f2c6d19a3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'idempotency_key',
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('request_hash', sa.String(length=64), nullable=False),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column('content_type', sa.String(length=255), nullable=True),
+        sa.Column('response_body', sa.LargeBinary(), nullable=True),
+        sa.Column(
+            'created_at',
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False
+        ),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(
+        'ix_idempotency_key_created_at', 'idempotency_key', ['created_at'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_idempotency_key_created_at', table_name='idempotency_key')
+    op.drop_table('idempotency_key')
@@ -0,0 +1,173 @@
+"""partition inventory_txn by month of created_at
+
+Revision ID: e8c5a1f47d20
+Revises: d5e27b9f0c18
+Create Date: 2026-10-18 16:58:21.904733
+
+"""
+
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "e8c5a1f47d20"
+down_revision = "d5e27b9f0c18"
+branch_labels = None
+depends_on = None
+
+# The existing table is not copied: it becomes the partition for everything before
+# the first month boundary after the upgrade. Everything that reads the old rows runs
+# first, outside the transaction and without blocking writers: the (created_at, id)
+# unique index is built CONCURRENTLY, and the bound CHECK is added NOT VALID and then
+# validated on its own. The swap itself - rename, primary key from that index, new
+# parent, ATTACH - is one short transaction: the validated CHECK lets ATTACH skip the
+# scan, and matching indexes and foreign keys are attached as they are. A run
+# interrupted before the swap leaves the index (INVALID if its build was cut short)
+# and the CHECK on inventory_txn; drop both before running this again.
+# New months get their own partitions (app.services.partitions keeps them ahead).
+MONTHS_AHEAD = 3
+
+FK_COLUMNS = ("product_id", "from_location_id", "to_location_id")
+
+INDEXES = (
+    ("ix_inventory_txn_product_created_at", ["product_id", "created_at"], None),
+    ("ix_inventory_txn_from_location_created_at", ["from_location_id", "created_at"], None),
+    ("ix_inventory_txn_to_location_created_at", ["to_location_id", "created_at"], None),
+    ("ix_inventory_txn_reference", ["reference"], "reference IS NOT NULL"),
+)
+
+
+def _months(count: int) -> list[datetime]:
+    now = datetime.now(timezone.utc)
+    year, month = now.year, now.month
+    out = []
+    for _ in range(count + 1):
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+        out.append(datetime(year, month, 1, tzinfo=timezone.utc))
+    return out
+
+
+def upgrade() -> None:
+    boundary, *later = _months(MONTHS_AHEAD)
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'inventory_txn_legacy_pkey',
+            'inventory_txn',
+            ['created_at', 'id'],
+            unique=True,
+            postgresql_concurrently=True,
+        )
+        op.execute(
+            "ALTER TABLE inventory_txn ADD CONSTRAINT inventory_txn_legacy_bound "
+            f"CHECK (created_at < '{boundary.isoformat()}') NOT VALID"
+        )
+        # SHARE UPDATE EXCLUSIVE: writers go on while the old rows are checked
+        op.execute("ALTER TABLE inventory_txn VALIDATE CONSTRAINT inventory_txn_legacy_bound")
+
+    # free every name the new parent table will use
+    op.execute("ALTER TABLE inventory_txn RENAME TO inventory_txn_legacy")
+    # a partition has one primary key: the parent's (created_at, id)
+    op.execute("ALTER TABLE inventory_txn_legacy DROP CONSTRAINT inventory_txn_pkey")
+    for column in FK_COLUMNS:
+        op.execute(
+            f"ALTER TABLE inventory_txn_legacy RENAME CONSTRAINT inventory_txn_{column}_fkey "
+            f"TO inventory_txn_legacy_{column}_fkey"
+        )
+    for name, _columns, _where in INDEXES:
+        legacy = name.replace("inventory_txn", "inventory_txn_legacy")
+        op.execute(f"ALTER INDEX {name} RENAME TO {legacy}")
+    # the (created_at, id) primary key index replaces it
+    op.drop_index('ix_inventory_txn_created_at', table_name='inventory_txn_legacy')
+
+    op.create_table(
+        'inventory_txn',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('product_id', sa.UUID(), nullable=False),
+        sa.Column('from_location_id', sa.UUID(), nullable=True),
+        sa.Column('to_location_id', sa.UUID(), nullable=True),
+        sa.Column('qty', sa.Numeric(14, 4), nullable=False),
+        sa.Column(
+            'txn_type',
+            postgresql.ENUM(name='inventory_txn_type', create_type=False),
+            nullable=False
+        ),
+        sa.Column('reason', sa.String(length=255), nullable=True),
+        sa.Column('reference', sa.String(length=255), nullable=True),
+        sa.Column(
+            'created_at',
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False
+        ),
+        sa.ForeignKeyConstraint(['from_location_id'], ['location.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='RESTRICT'),
+        sa.ForeignKeyConstraint(['to_location_id'], ['location.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('created_at', 'id'),
+        postgresql_partition_by='RANGE (created_at)'
+    )
+    # matching indexes of the legacy table are attached, not rebuilt
+    for name, columns, where in INDEXES:
+        op.create_index(
+            name,
+            'inventory_txn',
+            columns,
+            unique=False,
+            postgresql_where=sa.text(where) if where else None,
+        )
+
+    op.execute(
+        "ALTER TABLE inventory_txn_legacy "
+        "ADD CONSTRAINT inventory_txn_legacy_pkey PRIMARY KEY USING INDEX inventory_txn_legacy_pkey"
+    )
+    op.execute(
+        "ALTER TABLE inventory_txn ATTACH PARTITION inventory_txn_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ('{boundary.isoformat()}')"
+    )
+    op.execute("ALTER TABLE inventory_txn_legacy DROP CONSTRAINT inventory_txn_legacy_bound")
+
+    start = boundary
+    for end in later:
+        op.execute(
+            f"CREATE TABLE inventory_txn_p{start:%Y_%m} PARTITION OF inventory_txn "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        start = end
+    # rows past the prepared months still have somewhere to go
+    op.execute("CREATE TABLE inventory_txn_default PARTITION OF inventory_txn DEFAULT")
+
+
+def downgrade() -> None:
+    # detached partitions are standalone tables by now and stay as they are
+    op.execute(
+        "CREATE TABLE inventory_txn_flat (LIKE inventory_txn INCLUDING DEFAULTS)"
+    )
+    op.execute("INSERT INTO inventory_txn_flat SELECT * FROM inventory_txn")
+    op.execute("DROP TABLE inventory_txn CASCADE")
+    op.execute("ALTER TABLE inventory_txn_flat RENAME TO inventory_txn")
+    op.create_primary_key('inventory_txn_pkey', 'inventory_txn', ['id'])
+    op.create_foreign_key(
+        'inventory_txn_product_id_fkey', 'inventory_txn', 'product',
+        ['product_id'], ['id'], ondelete='RESTRICT'
+    )
+    for column in FK_COLUMNS[1:]:
+        op.create_foreign_key(
+            f'inventory_txn_{column}_fkey', 'inventory_txn', 'location',
+            [column], ['id'], ondelete='SET NULL'
+        )
+    for name, columns, where in INDEXES:
+        op.create_index(
+            name,
+            'inventory_txn',
+            columns,
+            unique=False,
+            postgresql_where=sa.text(where) if where else None,
+        )
+    op.create_index(
+        'ix_inventory_txn_created_at', 'inventory_txn', ['created_at', 'id'], unique=False
+    )
@@ -0,0 +1,73 @@
+"""background import jobs
+
+Revision ID: f3b9d2a6c571
+Revises: e8c5a1f47d20
+Create Date: 2026-10-18 18:24:07.351920
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "f3b9d2a6c571"
+down_revision = "e8c5a1f47d20"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'import_job',
+        sa.Column('kind', sa.String(length=32), nullable=False),
+        sa.Column(
+            'status',
+            sa.Enum('QUEUED', 'RUNNING', 'DONE', 'FAILED', name='import_job_status'),
+            nullable=False
+        ),
+        sa.Column('params', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=True),
+        sa.Column('spool_path', sa.String(length=1024), nullable=False),
+        sa.Column('bytes_total', sa.BigInteger(), nullable=False),
+        sa.Column('bytes_processed', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column('rows_processed', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column('rows_invalid', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.Column('result', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('started_at', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('heartbeat_at', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column(
+            'created_at',
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False
+        ),
+        sa.Column(
+            'updated_at',
+            sa.TIMESTAMP(timezone=True),
+            server_default=sa.text('now()'),
+            nullable=False
+        ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_import_job_pending',
+        'import_job',
+        ['created_at'],
+        unique=False,
+        postgresql_where=sa.text("status IN ('QUEUED', 'RUNNING')"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        'ix_import_job_pending',
+        table_name='import_job',
+        postgresql_where=sa.text("status IN ('QUEUED', 'RUNNING')"),
+    )
+    op.drop_table('import_job')
+    sa.Enum(name='import_job_status').drop(op.get_bind(), checkfirst=False)
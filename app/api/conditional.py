@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import hashlib
+
+from fastapi import Request, Response
+
+
+def make_etag(*parts: object) -> str:
+    """Strong ETag from a change token (counts, max(updated_at), version sums, ...).
+
+    Everything that shapes the body besides the data itself — query string, media
+    type — must be among ``parts`` too.
+    """
+    return '"' + hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check; uses weak comparison, as RFC 9110 prescribes for it."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def etag_response(request: Request, body: bytes, media_type: str) -> Response:
+    """Response tagged with a hash of its body, for results already in memory."""
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return Response(content=body, media_type=media_type, headers={"ETag": etag})
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from fastapi import Depends
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+
+from fastapi import Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.session import get_session
@@ -8,3 +10,13 @@ from app.db.session import get_session
 
 async def get_db(session: AsyncSession = Depends(get_session)) -> AsyncSession:
     return session
+
+
+def session_scope(request: Request) -> AbstractAsyncContextManager[AsyncSession]:
+    """A session outside of dependency injection (middleware, streamed bodies).
+
+    Uses the same provider as get_session, dependency overrides included, and
+    lives exactly as long as the ``async with`` block.
+    """
+    provider = request.app.dependency_overrides.get(get_session, get_session)
+    return asynccontextmanager(provider)()
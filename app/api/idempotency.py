@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import hashlib
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.types import ASGIApp
+
+from app.api.deps import session_scope
+from app.core.security import token_subject
+from app.services.idempotency import (
+    Claim,
+    StoredResponse,
+    claim_key,
+    complete_key,
+    current_claim,
+    release_key,
+    response_cache,
+)
+
+HEADER = "Idempotency-Key"
+_MUTATING = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+# retryable outcomes are not stored: the next attempt should run for real
+_NOT_STORED = frozenset({401, 403, 409, 429})
+_STREAMED = ("multipart/",)
+
+
+class IdempotencyMiddleware(BaseHTTPMiddleware):
+    """Replay the stored response for a repeated ``Idempotency-Key``.
+
+    The first request with a key claims it in the idempotency_key table and its
+    response is saved; repeats with the same key and payload get that response back
+    without running the handler, answered from an in-process LRU when possible.
+    Reusing a key for a different payload is rejected with 422, and a repeat that
+    arrives while the original is still running gets 409. So does every repeat of a
+    request that never stored its response (say the process died): its claim is not
+    taken over, since the change may have been committed already. Each commit of the
+    handler marks the claim applied in the same transaction, and an applied claim is
+    never released for another run; its response is stored whatever the status.
+
+    Multipart uploads (stocktake files) are not read here, so their payload is not
+    part of the request hash: reusing a key for another file replays the first
+    result instead of a 422.
+
+    Keys are scoped to the caller (the subject of a valid bearer token): a stored
+    response is only ever replayed to the principal whose request produced it, and
+    two callers picking the same key do not collide. Requests without a valid token
+    are passed through untouched, so route auth answers them.
+    """
+
+    def __init__(self, app: ASGIApp, *, prefixes: tuple[str, ...]) -> None:
+        super().__init__(app)
+        self.prefixes = prefixes
+
+    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
+        key = request.headers.get(HEADER)
+        if (
+            key is None
+            or request.method not in _MUTATING
+            or not request.url.path.startswith(self.prefixes)
+        ):
+            return await call_next(request)
+        if not 0 < len(key) <= 255:
+            return JSONResponse({"detail": f"{HEADER} must be 1-255 characters"}, 400)
+        subject = token_subject(request.headers.get("Authorization"))
+        if subject is None:
+            return await call_next(request)
+        # stored under a digest of (caller, key); fits the column whatever the key length
+        key = hashlib.sha256(f"{subject}\0{key}".encode()).hexdigest()
+
+        digest = hashlib.sha256()
+        for part in (subject, request.method, request.url.path, request.url.query):
+            digest.update(part.encode() + b"\0")
+        # buffering a whole upload in memory only to hash it is not worth it
+        if not request.headers.get("content-type", "").startswith(_STREAMED):
+            digest.update(await request.body())
+        request_hash = digest.hexdigest()
+
+        stored = response_cache.get(key)
+        if stored is None:
+            async with session_scope(request) as session:
+                stored = await claim_key(session, key, request_hash)
+            if stored is None:
+                return await self._execute(request, call_next, key, request_hash)
+
+        if stored.request_hash != request_hash:
+            return JSONResponse(
+                {"detail": f"{HEADER} was already used for a different request"}, 422
+            )
+        if stored.status_code is None:
+            return JSONResponse(
+                {"detail": f"A request with this {HEADER} is still in progress"}, 409
+            )
+        return Response(
+            content=stored.body,
+            status_code=stored.status_code,
+            media_type=stored.content_type,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    async def _execute(
+        self, request: Request, call_next: RequestResponseEndpoint, key: str, request_hash: str
+    ) -> Response:
+        claim = Claim(key)
+        token = current_claim.set(claim)
+        try:
+            response = await call_next(request)
+            body = b"".join([chunk async for chunk in response.body_iterator])
+        except BaseException:
+            async with session_scope(request) as session:
+                await release_key(session, key)
+            raise
+        finally:
+            claim.active = False
+            current_claim.reset(token)
+
+        async with session_scope(request) as session:
+            if not claim.applied and (
+                response.status_code >= 500 or response.status_code in _NOT_STORED
+            ):
+                await release_key(session, key)
+            else:
+                await complete_key(
+                    session,
+                    key,
+                    StoredResponse(
+                        request_hash,
+                        response.status_code,
+                        response.headers.get("content-type"),
+                        body,
+                    ),
+                )
+        return Response(
+            content=body,
+            status_code=response.status_code,
+            headers=dict(response.headers),
+        )
@@ -1,57 +1,368 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import AsyncIterator, Literal, NamedTuple
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.deps import get_db
-from app.models import InventoryItem
+from app.api.conditional import etag_matches, etag_response, make_etag, not_modified
+from app.api.deps import get_db, session_scope
+from app.core.config import settings
+from app.core.singleflight import SingleFlight
+from app.models import InventoryItem, InventoryTxnType, Location, Product
 from app.schemas.inventory import (
     AdjustRequest,
+    AllocateRequest,
+    AllocationOut,
+    AvailabilityRequest,
+    BatchItemOut,
+    BatchRequest,
     InventorySnapshot,
+    InventoryTxnOut,
     MoveRequest,
+    ProductTotal,
     ReleaseRequest,
     ReserveRequest
 )
+from app.services.allocation import allocate_order
+from app.services.coalescer import reservation_coalescer
+from app.services.history import history_start, journal_page, stock_as_of
+from app.services.import_jobs import submit_job
+from app.services.reservations import release_reference, ship_reference
+from app.services.stock_cache import ProductLevels, stock_cache
+from app.services.stocktake import DEFAULT_REASON, import_stocktake
 from app.services.inventory import (
     adjust_stock,
+    apply_batch,
+    availability,
+    availability_version,
+    cas_stats,
+    catalog_version,
     move_stock,
+    product_totals,
     release_reservation,
     reserve_stock,
-    ship_reserved
+    ship_reserved,
+    snapshot_version,
+    stock_levels
 )
 from app.core.security import require_roles
+from app.errors import ConcurrencyConflictError
 
 router = APIRouter(prefix="/inventory", tags=["inventory"])
 
 
+NDJSON = "application/x-ndjson"
+# rows per server-side cursor fetch when streaming
+_STREAM_BATCH = 1000
+
+# identical concurrent reads (same normalized parameters) share one query
+read_flight: SingleFlight[tuple[list[str], list]] = SingleFlight(settings.READ_COALESCE_ENABLED)
+
+
+def _row_dict(keys: list[str], row) -> dict:
+    # every column here is a UUID, Decimal or str: str() gives the same text pydantic would
+    return dict(zip(keys, map(str, row)))
+
+
+def _encode_cursor(product_id, location_id) -> str:
+    return base64.urlsafe_b64encode(f"{product_id}:{location_id}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[UUID, UUID]:
+    try:
+        product_id, location_id = base64.urlsafe_b64decode(cursor).decode().split(":")
+        return UUID(product_id), UUID(location_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _ids(values) -> tuple:
+    return tuple(sorted(set(values or ())))
+
+
+async def _shared_rows(request: Request, key: tuple, q) -> tuple[list[str], list]:
+    async def load() -> tuple[list[str], list]:
+        # runs detached from the request that started it, hence its own session
+        async with session_scope(request) as session:
+            res = await session.execute(q)
+            return list(res.keys()), res.all()
+
+    return await read_flight.do(key, load)
+
+
+def _encode_txn_cursor(created_at: datetime, txn_id) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{txn_id}".encode()).decode()
+
+
+def _decode_txn_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        created_at, txn_id = base64.urlsafe_b64decode(cursor).decode().split("|")
+        return datetime.fromisoformat(created_at), UUID(txn_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def _stream_ndjson(request: Request, q) -> AsyncIterator[str]:
+    # the body outlives the endpoint, so the stream holds its own session
+    async with session_scope(request) as session:
+        result = await session.stream(q.execution_options(yield_per=_STREAM_BATCH))
+        keys = list(result.keys())
+        async for rows in result.partitions():
+            yield "".join(
+                json.dumps(_row_dict(keys, row), separators=(",", ":")) + "\n" for row in rows
+            )
+
+
 @router.get("/snapshot", response_model=list[InventorySnapshot])
 async def snapshot(
-    product_id: str | None = None,
-    location_id: str | None = None,
+    request: Request,
+    product_id: list[UUID] | None = Query(None),
+    location_id: list[UUID] | None = Query(None),
+    include_codes: bool = False,
+    limit: int | None = Query(None, ge=1, le=10_000, description="Page size (keyset)"),
+    cursor: str | None = Query(None, description="X-Next-Cursor of the previous page"),
     db: AsyncSession = Depends(get_db)
 ):
-    q = select(InventoryItem)
+    """Stock levels; ``Accept: application/x-ndjson`` streams one JSON object per line.
+
+    With ``limit`` the result is paged by (product_id, location_id); a full page
+    carries ``X-Next-Cursor`` to pass as ``cursor`` for the next one.
+
+    Responses carry an ETag built from row counts, max(updated_at) and version sums,
+    so ``If-None-Match`` is answered with 304 before any stock row is read.
+    """
+    q = stock_levels(include_codes=include_codes)
     if product_id:
-        q = q.where(InventoryItem.product_id == product_id)
+        q = q.where(InventoryItem.product_id.in_(product_id))
     if location_id:
-        q = q.where(InventoryItem.location_id == location_id)
-    res = await db.execute(q)
-    items = res.scalars().all()
-    out: list[InventorySnapshot] = []
-    for it in items:
-        on_hand = it.on_hand or 0
-        reserved = it.reserved or 0
-        out.append(
-            InventorySnapshot(
-                product_id=it.product_id,
-                location_id=it.location_id,
-                on_hand=on_hand,
-                reserved=reserved,
-                available=(on_hand - reserved),
-            )
+        q = q.where(InventoryItem.location_id.in_(location_id))
+    key = tuple_(InventoryItem.product_id, InventoryItem.location_id)
+    if cursor:
+        q = q.where(key > tuple_(*_decode_cursor(cursor)))
+    streaming = NDJSON in request.headers.get("accept", "")
+    if product_id and stock_cache.active and not (limit or cursor or streaming or include_codes):
+        wanted = set(location_id or ())
+        cached = await stock_cache.get_many(db, product_id)
+        body = [
+            {
+                "product_id": str(pid),
+                "location_id": str(loc),
+                "on_hand": str(on_hand),
+                "reserved": str(reserved),
+                "available": str(on_hand - reserved),
+            }
+            for pid, value in cached.items()
+            for loc, on_hand, reserved in value.levels
+            if not wanted or loc in wanted
+        ]
+        return etag_response(
+            request, json.dumps(body, separators=(",", ":")).encode(), "application/json"
         )
-    return out
+
+    tokens = tuple((await db.execute(snapshot_version(product_id or (), location_id or ()))).one())
+    if include_codes:
+        for model in (Product, Location):
+            tokens += tuple((await db.execute(catalog_version(model))).one())
+    etag = make_etag(request.url.query, streaming, *tokens)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    if limit or streaming:
+        q = q.order_by(InventoryItem.product_id, InventoryItem.location_id)
+    if limit:
+        q = q.limit(limit)
+    if streaming:
+        return StreamingResponse(
+            _stream_ndjson(request, q), media_type=NDJSON, headers={"ETag": etag}
+        )
+
+    # a flight is joined only with the same version tokens, so its rows are never
+    # older than the ETag they are served with
+    await db.rollback()
+    flight_key = (
+        "snapshot", _ids(product_id), _ids(location_id), include_codes, limit, cursor, tokens
+    )
+    keys, rows = await _shared_rows(request, flight_key, q)
+    response = Response(
+        content=json.dumps([_row_dict(keys, row) for row in rows], separators=(",", ":")),
+        media_type="application/json",
+        headers={"ETag": etag},
+    )
+    if limit and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1][0], rows[-1][1])
+    return response
+
+
+@router.get("/as-of", response_model=list[InventorySnapshot])
+async def snapshot_as_of(
+    at: datetime = Query(..., description="Point in time, ISO 8601 with a UTC offset"),
+    product_id: list[UUID] = Query(..., max_length=1000),
+    location_id: list[UUID] | None = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Stock levels at a past moment, rebuilt from the transaction journal.
+
+    Starts from the nearest balance checkpoint not after ``at`` and replays only the
+    journal rows written after it, so the cost does not grow with the full history.
+    Moments before the base checkpoint are rejected with 400.
+    """
+    if at.tzinfo is None:
+        raise HTTPException(status_code=400, detail="at must include a UTC offset")
+    start = await history_start(db)
+    if start is not None and at < start:
+        raise HTTPException(
+            status_code=400, detail=f"Stock history is available from {start.isoformat()}"
+        )
+    res = await db.execute(stock_as_of(at, product_id, location_id or ()))
+    keys = list(res.keys())
+    return Response(
+        content=json.dumps([_row_dict(keys, row) for row in res], separators=(",", ":")),
+        media_type="application/json",
+    )
+
+
+@router.get(
+    "/txns",
+    response_model=list[InventoryTxnOut],
+    dependencies=[Depends(require_roles("viewer", "operator", "admin"))],
+)
+async def list_txns(
+    response: Response,
+    product_id: list[UUID] | None = Query(None),
+    location_id: list[UUID] | None = Query(None, description="Either side of a movement"),
+    txn_type: list[InventoryTxnType] | None = Query(None),
+    reference: str | None = None,
+    since: datetime | None = Query(None, description="Inclusive, ISO 8601 with a UTC offset"),
+    until: datetime | None = Query(None, description="Exclusive, ISO 8601 with a UTC offset"),
+    order: Literal["asc", "desc"] = "desc",
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = Query(None, description="X-Next-Cursor of the previous page"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Journal rows, newest first by default, paged by (created_at, id).
+
+    A full page carries ``X-Next-Cursor`` to pass as ``cursor`` for the next one.
+    """
+    for value in (since, until):
+        if value is not None and value.tzinfo is None:
+            raise HTTPException(status_code=400, detail="since/until must include a UTC offset")
+    q = journal_page(
+        product_ids=product_id or (),
+        location_ids=location_id or (),
+        txn_types=txn_type or (),
+        reference=reference,
+        since=since,
+        until=until,
+        after=_decode_txn_cursor(cursor) if cursor else None,
+        descending=order == "desc",
+        limit=limit,
+    )
+    rows = (await db.execute(q)).mappings().all()
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = _encode_txn_cursor(
+            rows[-1]["created_at"], rows[-1]["id"]
+        )
+    return rows
+
+
+class _Totals(NamedTuple):
+    product_id: UUID
+    sku: str
+    on_hand: Decimal
+    reserved: Decimal
+    available: Decimal
+
+
+def _cached_totals(cached: dict[UUID, ProductLevels], location_ids=()) -> list[_Totals]:
+    # same rows as services.inventory.availability(), computed from cached levels
+    wanted = set(location_ids)
+    rows = []
+    for pid, value in cached.items():
+        on_hand = reserved = Decimal("0")
+        for loc, loc_on_hand, loc_reserved in value.levels:
+            if not wanted or loc in wanted:
+                on_hand += loc_on_hand
+                reserved += loc_reserved
+        rows.append(_Totals(pid, value.sku, on_hand, reserved, on_hand - reserved))
+    return sorted(rows, key=lambda row: row.sku)
+
+
+@router.get("/totals", response_model=list[ProductTotal])
+async def totals(
+    request: Request,
+    product_id: list[UUID] = Query(..., max_length=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Total stock per product across all locations; unknown or empty products read as 0."""
+    if stock_cache.active:
+        rows = _cached_totals(await stock_cache.get_many(db, product_id))
+    else:
+        # as for the snapshot: a flight is joined only with the same version tokens
+        tokens = tuple(
+            (await db.execute(availability_version(product_ids=_ids(product_id)))).one()
+        )
+        await db.rollback()
+        _, rows = await _shared_rows(
+            request, ("totals", _ids(product_id), tokens), product_totals(_ids(product_id))
+        )
+    found = {row.product_id: row for row in rows}
+    body = []
+    for pid in dict.fromkeys(product_id):
+        row = found.get(pid)
+        body.append({
+            "product_id": str(pid),
+            "on_hand": str(row.on_hand) if row else "0",
+            "reserved": str(row.reserved) if row else "0",
+            "available": str(row.available) if row else "0",
+        })
+    return Response(content=json.dumps(body, separators=(",", ":")), media_type="application/json")
+
+
+@router.post("/availability")
+async def availability_lookup(
+    data: AvailabilityRequest, request: Request, db: AsyncSession = Depends(get_db)
+):
+    """Availability for many products at once, as columns (one array per field).
+
+    Products are matched by id or SKU in one query; requested ids/SKUs that match no
+    product are listed in ``not_found``. Supports ``If-None-Match`` with the ETag of a
+    previous identical lookup.
+    """
+    if not data.product_ids and not data.skus:
+        raise HTTPException(status_code=400, detail="Pass product_ids and/or skus")
+    if stock_cache.active and not data.skus:
+        cached = await stock_cache.get_many(db, data.product_ids)
+        keys, rows = _Totals._fields, _cached_totals(cached, data.location_ids)
+    else:
+        product_ids, skus, location_ids = (
+            _ids(data.product_ids), _ids(data.skus), _ids(data.location_ids)
+        )
+        args = dict(product_ids=product_ids, skus=skus, location_ids=location_ids)
+        tokens = tuple((await db.execute(availability_version(**args))).one())
+        await db.rollback()
+        keys, rows = await _shared_rows(
+            request,
+            ("availability", product_ids, skus, location_ids, tokens),
+            availability(**args),
+        )
+    columns = {key: [] for key in keys}
+    for row in rows:
+        for values, value in zip(columns.values(), row):
+            values.append(str(value))
+    found = set(columns["product_id"]) | set(columns["sku"])
+    requested = [str(pid) for pid in data.product_ids] + data.skus
+    body = {**columns, "not_found": [r for r in dict.fromkeys(requested) if r not in found]}
+    return etag_response(
+        request, json.dumps(body, separators=(",", ":")).encode(), "application/json"
+    )
 
 
 @router.post("/adjust", dependencies=[Depends(require_roles("operator", "admin"))])
@@ -73,6 +384,8 @@ async def adjust(data: AdjustRequest, db: AsyncSession = Depends(get_db)):
         }
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except ConcurrencyConflictError as e:
+        raise HTTPException(status_code=409, detail=e.message)
 
 
 @router.post("/move", dependencies=[Depends(require_roles("operator", "admin"))])
@@ -89,21 +402,35 @@ async def move(data: MoveRequest, db: AsyncSession = Depends(get_db)):
         return {"status": "ok"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except ConcurrencyConflictError as e:
+        raise HTTPException(status_code=409, detail=e.message)
 
 
 @router.post("/reserve", dependencies=[Depends(require_roles("operator", "admin"))])
 async def reserve(data: ReserveRequest, db: AsyncSession = Depends(get_db)):
     try:
-        item = await reserve_stock(
-            db,
-            product_id=data.product_id,
-            location_id=data.location_id,
-            qty=data.qty,
-            reference=data.reference
-        )
+        if settings.RESERVE_COALESCE_ENABLED:
+            item = await reservation_coalescer.reserve(
+                product_id=data.product_id,
+                location_id=data.location_id,
+                qty=data.qty,
+                reference=data.reference,
+                ttl_seconds=data.ttl_seconds
+            )
+        else:
+            item = await reserve_stock(
+                db,
+                product_id=data.product_id,
+                location_id=data.location_id,
+                qty=data.qty,
+                reference=data.reference,
+                ttl_seconds=data.ttl_seconds
+            )
         return {"status": "ok", "reserved": str(item.reserved)}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except ConcurrencyConflictError as e:
+        raise HTTPException(status_code=409, detail=e.message)
 
 
 @router.post("/release", dependencies=[Depends(require_roles("operator", "admin"))])
@@ -119,10 +446,12 @@ async def release(data: ReleaseRequest, db: AsyncSession = Depends(get_db)):
         return {"status": "ok", "reserved": str(item.reserved)}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except ConcurrencyConflictError as e:
+        raise HTTPException(status_code=409, detail=e.message)
 
 
 @router.post("/ship", dependencies=[Depends(require_roles("operator", "admin"))])
-async def ship(data: ReserveRequest, db: AsyncSession = Depends(get_db)):
+async def ship(data: ReleaseRequest, db: AsyncSession = Depends(get_db)):
     try:
         item = await ship_reserved(
             db,
@@ -134,3 +463,140 @@ async def ship(data: ReserveRequest, db: AsyncSession = Depends(get_db)):
         return {"status": "ok", "on_hand": str(item.on_hand), "reserved": str(item.reserved)}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except ConcurrencyConflictError as e:
+        raise HTTPException(status_code=409, detail=e.message)
+
+
+def _items_out(items) -> list[BatchItemOut]:
+    return [
+        BatchItemOut(
+            product_id=it.product_id,
+            location_id=it.location_id,
+            on_hand=it.on_hand,
+            reserved=it.reserved,
+        )
+        for it in items
+    ]
+
+
+@router.post("/batch", dependencies=[Depends(require_roles("operator", "admin"))])
+async def batch(data: BatchRequest, db: AsyncSession = Depends(get_db)):
+    try:
+        items = await apply_batch(db, data.operations)
+        return {"status": "ok", "applied": len(data.operations), "items": _items_out(items)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ConcurrencyConflictError as e:
+        raise HTTPException(status_code=409, detail=e.message)
+
+
+@router.post("/allocate", dependencies=[Depends(require_roles("operator", "admin"))])
+async def allocate(data: AllocateRequest, db: AsyncSession = Depends(get_db)):
+    try:
+        plan = await allocate_order(
+            db,
+            lines=[(line.product_id, line.qty) for line in data.lines],
+            policy=data.policy,
+            preferred_location_ids=data.preferred_location_ids,
+            reference=data.reference,
+            ttl_seconds=data.ttl_seconds
+        )
+        return {
+            "status": "ok",
+            "allocations": [
+                AllocationOut(product_id=p, location_id=loc, qty=qty) for p, loc, qty in plan
+            ],
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ConcurrencyConflictError as e:
+        raise HTTPException(status_code=409, detail=e.message)
+
+
+@router.post(
+    "/reservations/{reference}/release",
+    dependencies=[Depends(require_roles("operator", "admin"))]
+)
+async def release_by_reference(reference: str, db: AsyncSession = Depends(get_db)):
+    try:
+        items = await release_reference(db, reference)
+    except ConcurrencyConflictError as e:
+        raise HTTPException(status_code=409, detail=e.message)
+    if not items:
+        raise HTTPException(status_code=404, detail="No reservations for this reference")
+    return {"status": "ok", "reference": reference, "items": _items_out(items)}
+
+
+@router.post(
+    "/reservations/{reference}/ship",
+    dependencies=[Depends(require_roles("operator", "admin"))]
+)
+async def ship_by_reference(reference: str, db: AsyncSession = Depends(get_db)):
+    try:
+        items = await ship_reference(db, reference)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ConcurrencyConflictError as e:
+        raise HTTPException(status_code=409, detail=e.message)
+    if not items:
+        raise HTTPException(status_code=404, detail="No reservations for this reference")
+    return {"status": "ok", "reference": reference, "items": _items_out(items)}
+
+
+@router.post("/stocktake", dependencies=[Depends(require_roles("operator", "admin"))])
+async def stocktake(
+    response: Response,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    dry_run: bool = Query(False, description="Только отчёт о расхождениях, без изменений"),
+    reason: str = Query(DEFAULT_REASON, max_length=255),
+    reference: str | None = Query(None, max_length=255),
+    encoding: str | None = Query(None, description="Принудительная кодировка CSV"),
+    report_limit: int = Query(1000, ge=0, le=10000),
+    background: bool = Query(
+        False, description="Фоновая задача: сразу 202 с job_id, прогресс — GET /jobs/{id}"
+    ),
+):
+    """Инвентаризация / начальные остатки: on_hand = посчитанное количество.
+
+    Файл CSV (sku;location_code;qty или Артикул;Склад;Количество) или NDJSON
+    (.ndjson/.jsonl, объекты {"sku", "location_code", "qty"}). Строки идут через COPY во
+    временную таблицу, расхождения считаются и применяются несколькими запросами на
+    весь файл; по каждой изменившейся паре пишется ADJUSTMENT в журнал.
+    dry_run=true возвращает тот же отчёт (pairs / changed / increase / decrease /
+    below_reserved и крупнейшие расхождения), ничего не меняя.
+    """
+    name = (file.filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")):
+        fmt = "ndjson"
+    elif name.endswith(".csv"):
+        fmt = "csv"
+    else:
+        raise HTTPException(status_code=400, detail="Upload a .csv or .ndjson file")
+    params = {
+        "fmt": fmt,
+        "dry_run": dry_run,
+        "reason": reason,
+        "reference": reference,
+        "encoding": encoding,
+        "report_limit": report_limit,
+    }
+    if background:
+        job = await submit_job(db, "stocktake", file.file, filename=file.filename, params=params)
+        response.status_code = 202
+        response.headers["Location"] = f"/jobs/{job.id}"
+        return {"status": "queued", "job_id": str(job.id)}
+    try:
+        return await import_stocktake(db, file.file, **params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/stats", dependencies=[Depends(require_roles("admin"))])
+async def stats():
+    return {
+        "reserve_coalescer": reservation_coalescer.stats.snapshot(),
+        "concurrency": {"mode": settings.INVENTORY_CONCURRENCY, **cas_stats},
+        "stock_cache": stock_cache.stats(),
+        "read_coalescing": read_flight.stats(),
+    }
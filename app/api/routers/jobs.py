@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import get_db
+from app.core.security import require_roles
+from app.models import ImportJob
+from app.schemas.jobs import ImportJobOut
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+def _job_out(job: ImportJob) -> ImportJobOut:
+    rate = None
+    if job.started_at is not None:
+        elapsed = ((job.finished_at or datetime.now(timezone.utc)) - job.started_at).total_seconds()
+        if elapsed > 0:
+            rate = job.rows_processed / elapsed
+    return ImportJobOut(
+        id=job.id,
+        kind=job.kind,
+        status=job.status,
+        filename=job.filename,
+        bytes_total=job.bytes_total,
+        bytes_processed=job.bytes_processed,
+        progress=min(job.bytes_processed / job.bytes_total, 1.0) if job.bytes_total else 1.0,
+        rows_processed=job.rows_processed,
+        rows_invalid=job.rows_invalid,
+        rows_per_second=rate,
+        attempts=job.attempts,
+        result=job.result,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
+
+
+@router.get(
+    "/{job_id}",
+    response_model=ImportJobOut,
+    dependencies=[Depends(require_roles("viewer", "operator", "admin"))],
+)
+async def get_job(job_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    """Состояние фоновой задачи импорта: статус, прогресс, скорость, итог или ошибка."""
+    job = await db.get(ImportJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_out(job)
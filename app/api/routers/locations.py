@@ -1,13 +1,15 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api.conditional import etag_matches, make_etag, not_modified
 from app.api.deps import get_db
 from app.models import Location
 from app.schemas.location import LocationCreate, LocationOut
 from app.core.security import require_roles
+from app.services.inventory import catalog_version
 
 router = APIRouter(prefix="/locations", tags=["locations"])
 
@@ -29,6 +31,11 @@ async def create_location(data: LocationCreate, db: AsyncSession = Depends(get_d
 
 
 @router.get("", response_model=list[LocationOut])
-async def list_locations(db: AsyncSession = Depends(get_db)):
+async def list_locations(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    """Список локаций с ETag; при совпадении If-None-Match — 304 без чтения строк."""
+    etag = make_etag(*(await db.execute(catalog_version(Location))).one())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     res = await db.execute(select(Location))
     return [LocationOut(id=l.id, code=l.code, name=l.name) for l in res.scalars().all()]
@@ -1,18 +1,25 @@
 from __future__ import annotations
 
+import codecs
 import csv
 import io
 import uuid
+import zlib
+from typing import AsyncIterator
 
-from fastapi import APIRouter, Depends, File, HTTPException, Query, Response, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select
-from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.deps import get_db
+from app.api.conditional import etag_matches, make_etag, not_modified
+from app.api.deps import get_db, session_scope
 from app.core.security import require_roles
 from app.models import Product
-from app.schemas.product import ProductCreate, ProductOut
+from app.schemas.product import ProductCreate, ProductOut, StockStripesUpdate
+from app.services.import_jobs import submit_job
+from app.services.inventory import catalog_version
+from app.services.product_import import ImportMode, import_products
 
 router = APIRouter(prefix="/products", tags=["products"])
 
@@ -34,104 +41,119 @@ async def create_product(data: ProductCreate, db: AsyncSession = Depends(get_db)
 
 
 @router.get("", response_model=list[ProductOut])
-async def list_products(db: AsyncSession = Depends(get_db)):
+async def list_products(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    """Список товаров с ETag; при совпадении If-None-Match — 304 без чтения строк."""
+    etag = make_etag(*(await db.execute(catalog_version(Product))).one())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
     res = await db.execute(select(Product))
     return [ProductOut(id=p.id, sku=p.sku, name=p.name, unit=p.unit) for p in res.scalars().all()]
 
 
+@router.put("/{product_id}/stock-stripes", dependencies=[Depends(require_roles("admin"))])
+async def set_stock_stripes(
+    product_id: uuid.UUID, data: StockStripesUpdate, db: AsyncSession = Depends(get_db)
+):
+    """Число полос остатка для товара; перераскладку делает фоновый ребалансировщик."""
+    prod = await db.get(Product, product_id)
+    if not prod:
+        raise HTTPException(status_code=404, detail="Product not found")
+    prod.stock_stripes = data.stripes
+    await db.commit()
+    return {"status": "ok", "product_id": str(prod.id), "stock_stripes": prod.stock_stripes}
+
+
 # ── CSV IMPORT ───────────────────────────────────────────────────────────────
 @router.post("/import-csv", dependencies=[Depends(require_roles("operator", "admin"))])
 async def import_products_csv(
+    response: Response,
     file: UploadFile = File(...),
     db: AsyncSession = Depends(get_db),
     encoding: str | None = Query(
         None,
         description="Принудительная кодировка: utf-8, utf-8-sig, cp1251, utf-16 и т.п."
     ),
+    mode: ImportMode = Query(
+        "insert",
+        description="insert — только новые SKU; upsert — ещё и обновить изменившиеся",
+    ),
+    background: bool = Query(
+        False, description="Фоновая задача: сразу 202 с job_id, прогресс — GET /jobs/{id}"
+    ),
 ):
     """Импорт товаров из CSV. Поддерживаются кодировки UTF-8/UTF-16/CP1251 и др.,
     а также разделители ',', ';', '	', '|'. Заголовки: sku/name/unit/description
     (или русские аналоги: Артикул/Наименование/Ед/Описание).
+
+    Строки идут через COPY во временную таблицу и вливаются одним INSERT; в режиме
+    upsert существующие SKU обновляются, только если name/unit/description отличаются;
+    пустая ячейка или отсутствующая колонка unit/description оставляет прежнее значение.
+    Ответ: inserted / updated / skipped / invalid и первые ошибки по строкам.
+    С background=true файл сохраняется в spool-каталог, а импорт выполняет фоновый
+    обработчик (большие каталоги не держат запрос и соединение с БД).
     """
     if not file.filename.lower().endswith(".csv"):
         raise HTTPException(status_code=400, detail="Upload a .csv file")
-
-    content = await file.read()
-
-    def _decode_csv_bytes(b: bytes) -> str:
-        # Если пользователь явно указал encoding — используем его
-        if encoding:
-            try:
-                return b.decode(encoding)
-            except UnicodeDecodeError:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Не удалось декодировать файл как {encoding}"
-                )
-        # Автоматические попытки — популярные кодировки Windows/Excel
-        for enc in (
-        "utf-8-sig", "utf-8", "utf-16", "utf-16le", "utf-16be", "cp1251", "windows-1251",
-        "latin-1"):
-            try:
-                return b.decode(enc)
-            except UnicodeDecodeError:
-                continue
-        # Опционально: если установлен charset-normalizer — попробуем им
-        try:
-            from charset_normalizer import from_bytes  # type: ignore
-            res = from_bytes(b).best()
-            if res:
-                return str(res)
-        except Exception:
-            pass
-        raise HTTPException(
-            status_code=400,
-            detail="Не удалось распознать кодировку. Сохраните файл как 'CSV UTF-8' и повторите."
+    if background:
+        job = await submit_job(
+            db,
+            "products",
+            file.file,
+            filename=file.filename,
+            params={"mode": mode, "encoding": encoding},
         )
+        response.status_code = 202
+        response.headers["Location"] = f"/jobs/{job.id}"
+        return {"status": "queued", "job_id": str(job.id)}
+    # файл уже на диске (spool Starlette): читаем и декодируем его потоково, пачками
+    try:
+        result = await import_products(db, file.file, mode=mode, encoding=encoding)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return result.as_dict()
 
-    text = _decode_csv_bytes(content)
 
-    # Определяем разделитель (запятая/точка с запятой/таб/|)
-    try:
-        dialect = csv.Sniffer().sniff(text[:10000], delimiters=",;|\t")
-    except Exception:
-        dialect = csv.excel
-
-    reader = csv.DictReader(io.StringIO(text), dialect=dialect)
-
-    def pick(row: dict, *keys: str) -> str:
-        for k in keys:
-            v = row.get(k)
-            if v is not None and str(v).strip():
-                return str(v).strip()
-        return ""
-
-    rows: list[dict] = []
-    for row in reader:
-        # Поддерживаем и англ., и русские заголовки
-        sku = pick(row, "sku", "SKU", "артикул", "Артикул", "код", "Код", "Код товара")
-        name = pick(row, "name", "Name", "наименование", "Наименование", "Название", "Товар")
-        if not sku or not name:
-            continue
-        unit = pick(row, "unit", "Unit", "ед", "Ед", "единица", "ед. изм.", "шт") or "pcs"
-        description = pick(row, "description", "Description", "описание", "Описание") or None
-        rows.append(
-            {"id": uuid.uuid4(), "sku": sku, "name": name, "unit": unit, "description": description}
-        )
+# ── CSV EXPORT ───────────────────────────────────────────────────────────────
+# rows per server-side cursor fetch; each batch becomes one encoded body chunk
+_EXPORT_BATCH = 2000
 
-    if not rows:
-        return {"status": "ok", "inserted": 0}
 
-    stmt = insert(Product).values(rows).on_conflict_do_nothing(index_elements=[Product.sku])
-    await db.execute(stmt)
-    await db.commit()
-    return {"status": "ok", "inserted": len(rows)}
+async def _export_chunks(
+    request: Request, q, delimiter: str, encoding: str, compress: bool
+) -> AsyncIterator[bytes]:
+    # the body outlives the endpoint, so the stream holds its own session
+    sio = io.StringIO()
+    writer = csv.writer(sio, delimiter=delimiter)
+    # символы, которых нет в выбранной кодировке, становятся '?': посреди потока
+    # ответить ошибкой уже нельзя
+    encoder = codecs.getincrementalencoder(encoding)(errors="replace")
+    gz = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+
+    def flush(final: bool = False) -> bytes:
+        data = encoder.encode(sio.getvalue(), final)
+        sio.seek(0)
+        sio.truncate()
+        if gz is not None:
+            data = gz.compress(data) + (gz.flush() if final else b"")
+        return data
+
+    writer.writerow(["sku", "name", "unit", "description"])  # шапка
+    async with session_scope(request) as session:
+        result = await session.stream(q.execution_options(yield_per=_EXPORT_BATCH))
+        async for rows in result.partitions():
+            for sku, name, unit, description in rows:
+                # Убираем переводы строк из description, чтобы не ломать CSV
+                cleaned_desc = (description or "").replace("\r", " ").replace("\n", " ")
+                writer.writerow([sku or "", name or "", unit or "", cleaned_desc])
+            if chunk := flush():
+                yield chunk
+    yield flush(final=True)
 
 
-# ── CSV EXPORT ───────────────────────────────────────────────────────────────
 @router.get("/export-csv", dependencies=[Depends(require_roles("viewer", "operator", "admin"))])
 async def export_products_csv(
-    db: AsyncSession = Depends(get_db),
+    request: Request,
     delimiter: str = Query(
         ",",
         min_length=1,
@@ -143,21 +165,33 @@ async def export_products_csv(
         description="Кодировка вывода: 'utf-8-sig' дружелюбна к Excel на Windows; можно 'utf-8' или 'cp1251'",
     ),
     filename: str = Query("products.csv", description="Имя файла для скачивания"),
+    gzip: bool = Query(
+        False, description="Сжать ответ (Content-Encoding: gzip), если клиент принимает gzip"
+    ),
 ):
-    res = await db.execute(select(Product).order_by(Product.sku))
-    products = list(res.scalars().all())
-
-    sio = io.StringIO()
-    writer = csv.writer(sio, delimiter=delimiter)
-    writer.writerow(["sku", "name", "unit", "description"])  # шапка
-    for p in products:
-        # Убираем переводы строк из description, чтобы не ломать CSV
-        cleaned_desc = (p.description or "").replace("\r", " ").replace("\n", " ")
-        writer.writerow([p.sku or "", p.name or "", p.unit or "", cleaned_desc])
-
-    data_bytes = sio.getvalue().encode(encoding, errors="strict")
+    """Выгрузка каталога потоком: только нужные колонки, пачками из серверного курсора,
+    кодирование и (опционально) gzip по мере чтения — память не растёт с размером каталога.
+    """
+    try:
+        codecs.getincrementalencoder(encoding)
+        csv.writer(io.StringIO(), delimiter=delimiter)
+    except LookupError:
+        raise HTTPException(status_code=400, detail=f"Unknown encoding {encoding}")
+    except (TypeError, csv.Error):
+        raise HTTPException(status_code=400, detail="Invalid delimiter")
+    compress = gzip and "gzip" in request.headers.get("accept-encoding", "")
+
+    q = select(Product.sku, Product.name, Product.unit, Product.description).order_by(Product.sku)
     headers = {
         "Content-Disposition": f"attachment; filename=\"{filename}\"",
         "Cache-Control": "no-store",
     }
-    return Response(content=data_bytes, media_type=f"text/csv; charset={encoding}", headers=headers)
+    if gzip:
+        headers["Vary"] = "Accept-Encoding"
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        _export_chunks(request, q, delimiter, encoding, compress),
+        media_type=f"text/csv; charset={encoding}",
+        headers=headers,
+    )
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
+from uuid import UUID
+
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.deps import get_db
@@ -15,7 +16,8 @@ from app.schemas.purchase import (
     SupplierCreate,
     SupplierOut
 )
-from app.services.inventory import adjust_stock
+from app.errors import ConcurrencyConflictError
+from app.services.purchasing import receive_purchase_order
 
 router = APIRouter(prefix="/purchase", tags=["purchase"])
 
@@ -76,34 +78,13 @@ async def add_po_line(
 
 
 @router.post("/orders/{po_id}/receive", dependencies=[Depends(require_roles("operator", "admin"))])
-async def receive_po(po_id: str, data: PurchaseReceiveRequest, db: AsyncSession = Depends(get_db)):
-    po = await db.get(PurchaseOrder, po_id)
-    if not po:
+async def receive_po(po_id: UUID, data: PurchaseReceiveRequest, db: AsyncSession = Depends(get_db)):
+    try:
+        po = await receive_purchase_order(db, po_id, data.lines)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ConcurrencyConflictError as e:
+        raise HTTPException(status_code=409, detail=e.message)
+    if po is None:
         raise HTTPException(status_code=404, detail="PO not found")
-    if po.status in (POStatus.CANCELLED, POStatus.RECEIVED):
-        raise HTTPException(status_code=400, detail="PO closed")
-
-    for line_in in data.lines:
-        line = await db.get(PurchaseOrderLine, line_in.line_id)
-        if not line or line.purchase_order_id != po.id:
-            raise HTTPException(status_code=400, detail=f"Line {line_in.line_id} invalid")
-        remaining = line.qty_ordered - line.qty_received
-        if line_in.qty > remaining:
-            raise HTTPException(status_code=400, detail="Receive qty exceeds remaining")
-        line.qty_received += line_in.qty
-        await adjust_stock(
-            db,
-            product_id=line.product_id,
-            location_id=line_in.location_id,
-            delta=line_in.qty,
-            reason=f"PO {po.id}",
-        )
-
-    res = await db.execute(
-        select(PurchaseOrderLine).where(PurchaseOrderLine.purchase_order_id == po.id)
-    )
-    lines = res.scalars().all()
-    if all(l.qty_received >= l.qty_ordered for l in lines):
-        po.status = POStatus.RECEIVED
-    await db.commit()
     return {"status": "ok"}
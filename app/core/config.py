@@ -1,5 +1,9 @@
 from __future__ import annotations
 
+import tempfile
+from pathlib import Path
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -16,6 +20,70 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
     JWT_ALG: str = "HS256"
 
+    # Группировка конкурентных резервов одной позиции в одну транзакцию (opt-in)
+    RESERVE_COALESCE_ENABLED: bool = False
+    RESERVE_COALESCE_WINDOW_MS: int = 5
+    RESERVE_COALESCE_MAX_BATCH: int = 200
+
+    # Полосы (stripes) для горячих SKU: быстрый путь + фоновый ребалансировщик
+    INVENTORY_STRIPING_ENABLED: bool = False
+    STRIPE_REBALANCE_INTERVAL_SECONDS: float = 5.0
+
+    # Стратегия конкурентного доступа к остаткам: блокировки или CAS по version
+    INVENTORY_CONCURRENCY: Literal["pessimistic", "optimistic"] = "pessimistic"
+    INVENTORY_CAS_MAX_RETRIES: int = 5
+    INVENTORY_CAS_BACKOFF_MS: float = 2.0
+
+    # Снятие просроченных резервов (ttl_seconds): пачками, с ограничением работы за проход
+    RESERVATION_SWEEP_ENABLED: bool = True
+    RESERVATION_SWEEP_INTERVAL_SECONDS: float = 10.0
+    RESERVATION_SWEEP_BATCH_SIZE: int = 500
+    RESERVATION_SWEEP_MAX_BATCHES: int = 10
+
+    # Idempotency-Key: сколько хранить ответы, размер LRU в процессе, очистка старых ключей
+    IDEMPOTENCY_KEY_RETENTION_HOURS: int = 24
+    IDEMPOTENCY_CACHE_SIZE: int = 10_000
+    IDEMPOTENCY_PURGE_INTERVAL_SECONDS: float = 300.0
+    IDEMPOTENCY_PURGE_BATCH_SIZE: int = 1000
+
+    # Кэш остатков в процессе; сбрасывается по NOTIFY из триггеров, TTL — страховка
+    STOCK_CACHE_ENABLED: bool = True
+    STOCK_CACHE_SIZE: int = 50_000
+    STOCK_CACHE_TTL_SECONDS: float = 300.0
+
+    # Итоги по товарам: триггеры дописывают дельты, свёртка пачками переносит их в итоги
+    STOCK_TOTALS_COMPACT_INTERVAL_SECONDS: float = 5.0
+    STOCK_TOTALS_COMPACT_BATCH_SIZE: int = 10_000
+    STOCK_TOTALS_COMPACT_MAX_BATCHES: int = 10
+
+    # Контрольные точки остатков для запросов «на дату»; срез делается с отставанием,
+    # превышающим самую длинную пишущую транзакцию
+    INVENTORY_CHECKPOINT_ENABLED: bool = True
+    INVENTORY_CHECKPOINT_INTERVAL_SECONDS: float = 3600.0
+    INVENTORY_CHECKPOINT_LAG_SECONDS: float = 300.0
+
+    # Секции журнала inventory_txn по месяцам: сколько месяцев вперёд держать готовыми
+    # и сколько хранить (0 — всё); старые секции отсоединяются (detach) или удаляются
+    INVENTORY_TXN_MAINTENANCE_ENABLED: bool = True
+    INVENTORY_TXN_MAINTENANCE_INTERVAL_SECONDS: float = 21600.0
+    INVENTORY_TXN_PARTITION_MONTHS_AHEAD: int = 3
+    INVENTORY_TXN_RETENTION_MONTHS: int = 0
+    INVENTORY_TXN_RETENTION_ACTION: Literal["detach", "drop"] = "detach"
+
+    # Одинаковые одновременные чтения (snapshot/totals/availability) делят один запрос
+    READ_COALESCE_ENABLED: bool = True
+
+    # Импорт товаров из CSV: строк в одной пачке COPY во временную таблицу
+    PRODUCT_IMPORT_BATCH_ROWS: int = 5000
+
+    # Фоновые задачи импорта: файлы ждут в spool-каталоге (общем для всех процессов),
+    # задачу без heartbeat дольше STALE секунд подхватывает другой обработчик
+    IMPORT_JOBS_ENABLED: bool = True
+    IMPORT_JOB_POLL_INTERVAL_SECONDS: float = 2.0
+    IMPORT_JOB_STALE_SECONDS: float = 600.0
+    IMPORT_JOB_MAX_ATTEMPTS: int = 3
+    IMPORT_SPOOL_DIR: str = str(Path(tempfile.gettempdir()) / "inventory-import")
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
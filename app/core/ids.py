@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy import literal_column
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql.elements import ColumnElement
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+_COUNTER_MAX = 0xFFF
+
+
+def uuid7() -> uuid.UUID:
+    """Time-ordered UUID, version 7 (RFC 9562).
+
+    48-bit Unix time in milliseconds, then a 12-bit counter in ``rand_a`` (RFC 9562,
+    method 1) and 62 random bits. The counter starts at a random value below half its
+    range every millisecond and counts up within it, so ids from one process are
+    strictly increasing; on overflow the timestamp is advanced by one millisecond.
+    """
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms = ms
+            _counter = int.from_bytes(os.urandom(2), "big") & (_COUNTER_MAX >> 1)
+        else:
+            _counter += 1
+            if _counter > _COUNTER_MAX:
+                _last_ms += 1
+                _counter = 0
+        ms, counter = _last_ms, _counter
+    rand_b = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    return uuid.UUID(int=ms << 80 | 0x7 << 76 | counter << 64 | 0b10 << 62 | rand_b)
+
+
+def uuid7_sql() -> ColumnElement[uuid.UUID]:
+    """UUIDv7 computed by PostgreSQL (no uuidv7() before 18), for INSERT ... SELECT.
+
+    gen_random_uuid() with its first 48 bits replaced by the Unix time in ms and the
+    version nibble turned from 4 into 7 (bits 52, 53); the variant bits stay.
+    Unlike uuid7() there is no counter: ids from the same millisecond are unordered.
+    """
+    return literal_column(
+        "encode(set_bit(set_bit(overlay(uuid_send(gen_random_uuid()) placing "
+        "substring(int8send(floor(extract(epoch FROM clock_timestamp()) * 1000)::bigint) "
+        "FROM 3) FROM 1 FOR 6), 52, 1), 53, 1), 'hex')::uuid",
+        UUID(as_uuid=True),
+    )
@@ -34,6 +34,22 @@ def create_access_token(*, sub: str, role: str, minutes: int | None = None) -> s
     )
 
 
+def token_subject(authorization: str | None) -> str | None:
+    """sub из заголовка «Authorization: Bearer ...», если подпись и срок токена верны.
+
+    Без обращения к БД — для middleware, которому нужно знать, чей это запрос,
+    до разрешения зависимостей маршрута.
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = jwt.decode(token, settings.APP_SECRET, algorithms=[settings.JWT_ALG])
+    except JWTError:
+        return None
+    return payload.get("sub") or None
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: AsyncSession = Depends(get_session)
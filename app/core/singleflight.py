@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """Collapse concurrent calls with the same key into one execution.
+
+    The first caller for a key starts ``fn`` as a separate task; callers arriving
+    while it runs await the same task and get the same result (or exception). The
+    task is shielded, so a caller that goes away does not cancel it for the others.
+    Nothing is kept after completion — this is deduplication, not a cache.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self._inflight: dict[Hashable, asyncio.Task[T]] = {}
+        self.executions = 0
+        self.collapsed = 0
+        self.failures = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        if not self.enabled:
+            return await fn()
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+            self.executions += 1
+        else:
+            self.collapsed += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task[T]) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled() or task.exception() is not None:
+            self.failures += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._inflight),
+            "executions": self.executions,
+            "collapsed": self.collapsed,
+            "failures": self.failures,
+        }
@@ -16,3 +16,7 @@ class InvalidSecretError(BaseError):
 
 class UserExistsError(BaseError):
     ...
+
+
+class ConcurrencyConflictError(BaseError):
+    ...
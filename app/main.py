@@ -1,12 +1,77 @@
 from __future__ import annotations
 
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
 
+from app.api.idempotency import IdempotencyMiddleware
 # Здесь мы импортируем СРАЗУ объекты APIRouter из пакета routers.__init__
-from app.api.routers import auth, inventory, locations, products, purchase_orders
+from app.api.routers import auth, inventory, jobs, locations, products, purchase_orders
+from app.core.config import settings
+from app.services.history import take_checkpoint
+from app.services.idempotency import purge_idempotency_keys
+from app.services.import_jobs import run_import_jobs
+from app.services.partitions import maintain_journal
+from app.services.reservations import expire_reservations
+from app.services.scheduler import run_periodically
+from app.services.stock_cache import listen_for_changes
+from app.services.stock_totals import compact_stock_totals
+from app.services.stripes import rebalance_stripes
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # Фоновые задачи живут вместе с процессом и гасятся при остановке
+    tasks: list[asyncio.Task] = []
+    if settings.INVENTORY_STRIPING_ENABLED:
+        tasks.append(asyncio.create_task(run_periodically(
+            "stripe rebalancer", settings.STRIPE_REBALANCE_INTERVAL_SECONDS, rebalance_stripes
+        )))
+    if settings.RESERVATION_SWEEP_ENABLED:
+        tasks.append(asyncio.create_task(run_periodically(
+            "reservation sweeper",
+            settings.RESERVATION_SWEEP_INTERVAL_SECONDS,
+            expire_reservations,
+        )))
+    if settings.INVENTORY_CHECKPOINT_ENABLED:
+        tasks.append(asyncio.create_task(run_periodically(
+            "inventory checkpoint",
+            settings.INVENTORY_CHECKPOINT_INTERVAL_SECONDS,
+            take_checkpoint,
+        )))
+    if settings.INVENTORY_TXN_MAINTENANCE_ENABLED:
+        tasks.append(asyncio.create_task(run_periodically(
+            "journal partition maintenance",
+            settings.INVENTORY_TXN_MAINTENANCE_INTERVAL_SECONDS,
+            maintain_journal,
+        )))
+    if settings.IMPORT_JOBS_ENABLED:
+        tasks.append(asyncio.create_task(run_periodically(
+            "import jobs", settings.IMPORT_JOB_POLL_INTERVAL_SECONDS, run_import_jobs
+        )))
+    if settings.STOCK_CACHE_ENABLED:
+        tasks.append(asyncio.create_task(listen_for_changes()))
+    tasks.append(asyncio.create_task(run_periodically(
+        "stock totals compaction",
+        settings.STOCK_TOTALS_COMPACT_INTERVAL_SECONDS,
+        compact_stock_totals,
+    )))
+    tasks.append(asyncio.create_task(run_periodically(
+        "idempotency key purge",
+        settings.IDEMPOTENCY_PURGE_INTERVAL_SECONDS,
+        purge_idempotency_keys,
+    )))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
 
-app = FastAPI(title="Inventory API", version="0.2.0")
+app = FastAPI(title="Inventory API", version="0.2.0", lifespan=lifespan)
+# повтор мутирующего запроса с тем же Idempotency-Key получает сохранённый ответ
+app.add_middleware(IdempotencyMiddleware, prefixes=("/inventory", "/purchase"))
 
 
 @app.get("/healthz")
@@ -30,3 +95,4 @@ app.include_router(products)
 app.include_router(locations)
 app.include_router(inventory)
 app.include_router(purchase_orders)
+app.include_router(jobs)
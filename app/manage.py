@@ -0,0 +1,72 @@
+"""Maintenance commands.
+
+    python -m app.manage partitions [--months-ahead N]
+    python -m app.manage retention [--months N] [--action detach|drop] [--dry-run]
+    python -m app.manage checkpoint
+
+The same jobs run periodically inside the app (see app.main); these commands are for
+cron-driven deployments, first-time setup and one-off archiving.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+
+from app.db.session import AsyncSessionMaker, engine
+from app.services.history import take_checkpoint
+from app.services.partitions import apply_retention, ensure_partitions, list_partitions
+
+
+async def _partitions(args: argparse.Namespace) -> None:
+    created = await ensure_partitions(months_ahead=args.months_ahead)
+    print(f"created: {', '.join(created) or 'none'}")
+    async with AsyncSessionMaker() as session:
+        for p in await list_partitions(session):
+            if p.default:
+                print(f"{p.name}\tDEFAULT")
+            else:
+                print(f"{p.name}\t[{p.lower or 'MINVALUE'}, {p.upper or 'MAXVALUE'})")
+
+
+async def _retention(args: argparse.Namespace) -> None:
+    names = await apply_retention(
+        retention_months=args.months, action=args.action, dry_run=args.dry_run
+    )
+    verb = "would be removed" if args.dry_run else "removed"
+    print(f"{verb}: {', '.join(names) or 'none'}")
+
+
+async def _checkpoint(_args: argparse.Namespace) -> None:
+    print(f"checkpoint rows written: {await take_checkpoint()}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("partitions", help="create journal partitions ahead and list them")
+    p.add_argument("--months-ahead", type=int, default=None)
+    p.set_defaults(run=_partitions)
+
+    p = commands.add_parser("retention", help="detach or drop journal months past retention")
+    p.add_argument("--months", type=int, default=None, help="default: settings")
+    p.add_argument("--action", choices=("detach", "drop"), default=None)
+    p.add_argument("--dry-run", action="store_true")
+    p.set_defaults(run=_retention)
+
+    p = commands.add_parser("checkpoint", help="fold the journal into a balance checkpoint now")
+    p.set_defaults(run=_checkpoint)
+
+    args = parser.parse_args(argv)
+
+    async def run() -> None:
+        try:
+            await args.run(args)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
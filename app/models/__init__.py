@@ -1,4 +1,16 @@
-from .inventory import InventoryItem, InventoryTxn, InventoryTxnType
+from .idempotency import IdempotencyKey
+from .inventory import (
+    InventoryCheckpoint,
+    InventoryHistoryStart,
+    InventoryItem,
+    InventoryReservation,
+    InventoryStripe,
+    InventoryTxn,
+    InventoryTxnType,
+    ProductStockDelta,
+    ProductStockTotal,
+)
+from .jobs import ImportJob, ImportJobStatus
 from .location import Location
 from .partners import Supplier
 from .product import Product
@@ -9,7 +21,10 @@ __all__ = [
     "User", "Role",
     "Product",
     "Location",
-    "InventoryItem", "InventoryTxn", "InventoryTxnType",
+    "InventoryItem", "InventoryReservation", "InventoryStripe", "InventoryTxn", "InventoryTxnType",
+    "InventoryCheckpoint", "InventoryHistoryStart", "ProductStockDelta", "ProductStockTotal",
     "Supplier",
+    "IdempotencyKey",
+    "ImportJob", "ImportJobStatus",
     "PurchaseOrder", "PurchaseOrderLine", "POStatus",
 ]
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from sqlalchemy import TIMESTAMP, Index, Integer, LargeBinary, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+from app.models.mixins import CreatedAtMixin
+
+
+class IdempotencyKey(CreatedAtMixin, Base):
+    """Сохранённый ответ на мутирующий запрос с заголовком Idempotency-Key.
+
+    status_code = NULL — запрос ещё выполняется; повтор с тем же ключом получает
+    сохранённый ответ вместо повторного выполнения. applied_at ставится в той же
+    транзакции, что и изменения самого запроса: такой ключ уже не освобождается.
+    """
+    __tablename__ = "idempotency_key"
+    __table_args__ = (Index("ix_idempotency_key_created_at", "created_at"),)
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    status_code: Mapped[int | None] = mapped_column(Integer)
+    content_type: Mapped[str | None] = mapped_column(String(255))
+    response_body: Mapped[bytes | None] = mapped_column(LargeBinary)
+    applied_at: Mapped[object | None] = mapped_column(TIMESTAMP(timezone=True))
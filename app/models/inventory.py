@@ -3,10 +3,26 @@ from __future__ import annotations
 import enum
 from typing import Optional
 
-from sqlalchemy import Enum, ForeignKey, Index, Integer, Numeric, String, UniqueConstraint
+from sqlalchemy import (
+    BigInteger,
+    Enum,
+    ForeignKey,
+    Identity,
+    Index,
+    Integer,
+    Numeric,
+    SmallInteger,
+    String,
+    UniqueConstraint,
+    text,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.sql import func
+from sqlalchemy.types import TIMESTAMP
 
+from app.core.ids import uuid7
 from app.db.base import Base
+
 from app.models.mixins import CreatedAtMixin, TimestampMixin, UUIDPKMixin
 
 
@@ -38,15 +54,140 @@ class InventoryItem(UUIDPKMixin, TimestampMixin, Base):
     reserved: Mapped[float] = mapped_column(Numeric(14, 4), nullable=False, default=0)
     version: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
 
-    # relations
-    product = relationship("Product", back_populates="inventory_items", lazy="selectin")
-    location = relationship("Location", back_populates="inventory_items", lazy="selectin")
+    # UPDATE идёт с WHERE version = <прочитанная>; инкремент делает сервис
+    __mapper_args__ = {"version_id_col": version, "version_id_generator": False}
+
+    # relations; не подгружаются неявно: каждая загруженная пачка позиций тянула бы
+    # ещё два SELECT — при необходимости грузите явно через selectinload()
+    product = relationship("Product", back_populates="inventory_items", lazy="raise")
+    location = relationship("Location", back_populates="inventory_items", lazy="raise")
+
+
+class InventoryStripe(UUIDPKMixin, TimestampMixin, Base):
+    """Дополнительная «полоса» остатка для горячих SKU (stripe >= 1).
+
+    Строка inventory_item играет роль полосы 0; итог по паре (product, location)
+    равен сумме строки и всех её полос.
+    """
+    __tablename__ = "inventory_item_stripe"
+    __table_args__ = (
+        UniqueConstraint(
+            "product_id", "location_id", "stripe", name="uq_inventory_item_stripe_key"
+        ),
+    )
+
+    product_id: Mapped[object] = mapped_column(
+        ForeignKey("product.id", ondelete="CASCADE"), nullable=False
+    )
+    location_id: Mapped[object] = mapped_column(
+        ForeignKey("location.id", ondelete="CASCADE"), nullable=False
+    )
+    stripe: Mapped[int] = mapped_column(SmallInteger, nullable=False)
+
+    on_hand: Mapped[float] = mapped_column(Numeric(14, 4), nullable=False, default=0)
+    reserved: Mapped[float] = mapped_column(Numeric(14, 4), nullable=False, default=0)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+
+    __mapper_args__ = {"version_id_col": version, "version_id_generator": False}
+
+
+class ProductStockTotal(Base):
+    """Свёрнутые итоги остатка по товару во всех локациях.
+
+    Одна строка на (product, slot), где slot — номер полосы (0 — сами строки
+    inventory_item). Итог товара — сумма его строк плюс ещё не свёрнутые строки
+    ProductStockDelta. Пишет сюда только свёртка (compact_stock_totals).
+    """
+    __tablename__ = "product_stock_total"
+
+    product_id: Mapped[object] = mapped_column(
+        ForeignKey("product.id", ondelete="CASCADE"), primary_key=True
+    )
+    slot: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    on_hand: Mapped[float] = mapped_column(Numeric(18, 4), nullable=False, server_default=text("0"))
+    reserved: Mapped[float] = mapped_column(
+        Numeric(18, 4), nullable=False, server_default=text("0")
+    )
+    # растёт при каждой свёртке в строку; вместе с дельтами — признак изменения итогов
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default=text("1"))
+
+
+class ProductStockDelta(Base):
+    """Изменения итогов по товарам, которые триггеры дописывают на каждый оператор.
+
+    Только вставки: запись остатков не берёт блокировок на общих строках итога, так что
+    транзакции по разным локациям одного товара не ждут друг друга и не упираются во
+    взаимоблокировку. Периодическая свёртка переносит строки в ProductStockTotal.
+    """
+    __tablename__ = "product_stock_delta"
+
+    id: Mapped[int] = mapped_column(BigInteger, Identity(always=True), primary_key=True)
+    product_id: Mapped[object] = mapped_column(
+        ForeignKey("product.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    slot: Mapped[int] = mapped_column(SmallInteger, nullable=False)
+    on_hand: Mapped[float] = mapped_column(Numeric(18, 4), nullable=False)
+    reserved: Mapped[float] = mapped_column(Numeric(18, 4), nullable=False)
+
+
+class InventoryReservation(UUIDPKMixin, TimestampMixin, Base):
+    """Резерв под reference (заказ) и/или со сроком жизни; qty уже учтено в inventory_item.reserved.
+
+    release/ship по reference уменьшают qty или снимают весь заказ разом, строки с
+    истёкшим expires_at снимает фоновый sweeper, возвращая количество в остаток.
+    """
+    __tablename__ = "inventory_reservation"
+    uuid_factory = uuid7
+    __table_args__ = (
+        Index("ix_inventory_reservation_key_reference", "product_id", "location_id", "reference"),
+        Index("ix_inventory_reservation_reference", "reference"),
+        Index(
+            "ix_inventory_reservation_expires_at",
+            "expires_at",
+            postgresql_where=text("expires_at IS NOT NULL"),
+        ),
+    )
+
+    product_id: Mapped[object] = mapped_column(
+        ForeignKey("product.id", ondelete="CASCADE"), nullable=False
+    )
+    location_id: Mapped[object] = mapped_column(
+        ForeignKey("location.id", ondelete="CASCADE"), nullable=False
+    )
+    reference: Mapped[str | None] = mapped_column(String(255))
+    qty: Mapped[float] = mapped_column(Numeric(14, 4), nullable=False)
+    expires_at: Mapped[object | None] = mapped_column(TIMESTAMP(timezone=True))
 
 
 class InventoryTxn(UUIDPKMixin, CreatedAtMixin, Base):
-    """Журнал движения запасов (append-only)."""
+    """Журнал движения запасов (append-only).
+
+    Секционирован по месяцам created_at (inventory_txn_pYYYY_MM, плюс секция DEFAULT);
+    будущие секции создаёт и старые отсоединяет app.services.partitions.
+    """
     __tablename__ = "inventory_txn"
+    uuid_factory = uuid7
+    # ключ секционирования обязан входить в PK; идентичность в ORM — по одному id
+    __mapper_args__ = {"primary_key": ["id"]}
+    __table_args__ = (
+        # хвост журнала по товару для запросов «на дату»
+        Index("ix_inventory_txn_product_created_at", "product_id", "created_at"),
+        # окно журнала между контрольными точками и keyset-страницы /inventory/txns
+        # обслуживает сам PK (created_at, id)
+        Index("ix_inventory_txn_from_location_created_at", "from_location_id", "created_at"),
+        Index("ix_inventory_txn_to_location_created_at", "to_location_id", "created_at"),
+        Index(
+            "ix_inventory_txn_reference",
+            "reference",
+            postgresql_where=text("reference IS NOT NULL"),
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
+    created_at: Mapped[object] = mapped_column(
+        TIMESTAMP(timezone=True), primary_key=True, server_default=func.now(),
+        doc="Время создания события/журнальной записи"
+    )
     product_id: Mapped[object] = mapped_column(
         ForeignKey("product.id", ondelete="RESTRICT"), nullable=False
     )
@@ -63,3 +204,38 @@ class InventoryTxn(UUIDPKMixin, CreatedAtMixin, Base):
     )
     reason: Mapped[str | None] = mapped_column(String(255))
     reference: Mapped[str | None] = mapped_column(String(255))
+
+
+class InventoryCheckpoint(Base):
+    """Остаток пары (product, location) на момент taken_at, свёрнутый из журнала.
+
+    Точку пишет фоновая задача только для пар, менявшихся с предыдущей точки, поэтому
+    остаток на момент точки — последняя строка пары не позже неё. Запрос «на дату»
+    берёт ближайшую точку и доигрывает только хвост журнала после неё.
+    """
+    __tablename__ = "inventory_checkpoint"
+    __table_args__ = (
+        Index("ix_inventory_checkpoint_taken_at", "taken_at"),
+    )
+
+    product_id: Mapped[object] = mapped_column(
+        ForeignKey("product.id", ondelete="CASCADE"), primary_key=True
+    )
+    location_id: Mapped[object] = mapped_column(
+        ForeignKey("location.id", ondelete="CASCADE"), primary_key=True
+    )
+    taken_at: Mapped[object] = mapped_column(TIMESTAMP(timezone=True), primary_key=True)
+    on_hand: Mapped[float] = mapped_column(Numeric(18, 4), nullable=False)
+    reserved: Mapped[float] = mapped_column(Numeric(18, 4), nullable=False)
+
+
+class InventoryHistoryStart(Base):
+    """С какого момента остатки «на дату» восстанавливаются из контрольных точек и журнала.
+
+    Первую строку пишет миграция вместе с базовой точкой, снятой с живых остатков
+    (журнал до неё доиграть нельзя); следующие — удаление старых партиций журнала.
+    Действует последняя (наибольшая) отметка.
+    """
+    __tablename__ = "inventory_history_start"
+
+    starts_at: Mapped[object] = mapped_column(TIMESTAMP(timezone=True), primary_key=True)
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import enum
+
+from sqlalchemy import BigInteger, Enum, Index, Integer, String, Text, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.types import TIMESTAMP
+
+from app.db.base import Base
+from app.models.mixins import TimestampMixin, UUIDPKMixin
+
+
+class ImportJobStatus(str, enum.Enum):
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+
+class ImportJob(UUIDPKMixin, TimestampMixin, Base):
+    """Фоновая задача импорта файла; очередь и прогресс живут в Postgres.
+
+    Загруженный файл лежит в spool-каталоге (spool_path) до завершения задачи.
+    Импорт применяется одной транзакцией, поэтому задачу, чей обработчик пропал
+    (heartbeat_at давно не обновлялся), можно просто выполнить заново.
+    """
+    __tablename__ = "import_job"
+    __table_args__ = (
+        # очередь: только незавершённые задачи, по порядку поступления
+        Index(
+            "ix_import_job_pending",
+            "created_at",
+            postgresql_where=text("status IN ('QUEUED', 'RUNNING')"),
+        ),
+    )
+
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)
+    status: Mapped[ImportJobStatus] = mapped_column(
+        Enum(ImportJobStatus, name="import_job_status"),
+        nullable=False,
+        default=ImportJobStatus.QUEUED,
+    )
+    # параметры импорта (mode, encoding, ...)
+    params: Mapped[dict] = mapped_column(JSONB, nullable=False, default=dict)
+    filename: Mapped[str | None] = mapped_column(String(255))
+    spool_path: Mapped[str] = mapped_column(String(1024), nullable=False)
+
+    bytes_total: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    bytes_processed: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default=text("0")
+    )
+    rows_processed: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default=text("0")
+    )
+    rows_invalid: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default=text("0")
+    )
+    attempts: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default=text("0")
+    )
+
+    # итог (счётчики и первые ошибки по строкам) или причина отказа
+    result: Mapped[dict | None] = mapped_column(JSONB)
+    error: Mapped[str | None] = mapped_column(Text())
+
+    started_at: Mapped[object | None] = mapped_column(TIMESTAMP(timezone=True))
+    heartbeat_at: Mapped[object | None] = mapped_column(TIMESTAMP(timezone=True))
+    finished_at: Mapped[object | None] = mapped_column(TIMESTAMP(timezone=True))
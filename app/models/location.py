@@ -6,10 +6,10 @@ from sqlalchemy import String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.base import Base
-from app.models.mixins import IsActiveMixin, TimestampMixin, UUIDPKMixin
+from app.models.mixins import IsActiveMixin, RowVersionMixin, TimestampMixin, UUIDPKMixin
 
 
-class Location(UUIDPKMixin, TimestampMixin, IsActiveMixin, Base):
+class Location(UUIDPKMixin, TimestampMixin, IsActiveMixin, RowVersionMixin, Base):
     """Локация/склад/ячейка. Пара (product, location) формирует остаток."""
     __tablename__ = "location"
 
@@ -17,7 +17,7 @@ class Location(UUIDPKMixin, TimestampMixin, IsActiveMixin, Base):
     name: Mapped[str] = mapped_column(String(255), nullable=False)
 
     inventory_items: Mapped[List["InventoryItem"]] = relationship(
-        "InventoryItem", back_populates="location", lazy="selectin"
+        "InventoryItem", back_populates="location", lazy="raise"
     )
 
     def __repr__(self) -> str:
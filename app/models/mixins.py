@@ -1,19 +1,29 @@
 from __future__ import annotations
 
 import uuid
+from typing import Callable, ClassVar
 
-from sqlalchemy import Boolean, text
+from sqlalchemy import BigInteger, Boolean, FetchedValue, text
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.orm import Mapped, declared_attr, mapped_column
 from sqlalchemy.sql import func
 from sqlalchemy.types import TIMESTAMP
 
 
 class UUIDPKMixin:
-    """UUID первичный ключ."""
-    id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, doc="PK UUID"
-    )
+    """UUID первичный ключ.
+
+    Генератор задаётся в модели атрибутом ``uuid_factory``: по умолчанию uuid4, для
+    таблиц, куда в основном дописывают, — ``app.core.ids.uuid7`` (ключи растут со
+    временем, вставка идёт в правый край индекса, а не в случайную страницу).
+    """
+    uuid_factory: ClassVar[Callable[[], uuid.UUID]] = uuid.uuid4
+
+    @declared_attr
+    def id(cls) -> Mapped[uuid.UUID]:
+        return mapped_column(
+            UUID(as_uuid=True), primary_key=True, default=cls.uuid_factory, doc="PK UUID"
+        )
 
 
 class TimestampMixin:
@@ -29,6 +39,18 @@ class TimestampMixin:
     )
 
 
+class RowVersionMixin:
+    """Счётчик изменений строки; растёт на каждом UPDATE (триггер bump_row_version).
+
+    Сумма по таблице — признак изменения справочника: в отличие от max(updated_at) она
+    сдвигается и от транзакции, начатой раньше последней записи, но закоммиченной позже.
+    """
+    version: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, server_default=text("1"), server_onupdate=FetchedValue(),
+        doc="Номер версии строки"
+    )
+
+
 class CreatedAtMixin:
     """Только created_at — пригодно для журналов (append-only)."""
     created_at: Mapped[object] = mapped_column(
@@ -2,14 +2,14 @@ from __future__ import annotations
 
 from typing import List
 
-from sqlalchemy import String, Text
+from sqlalchemy import SmallInteger, String, Text, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.base import Base
-from app.models.mixins import IsActiveMixin, TimestampMixin, UUIDPKMixin
+from app.models.mixins import IsActiveMixin, RowVersionMixin, TimestampMixin, UUIDPKMixin
 
 
-class Product(UUIDPKMixin, TimestampMixin, IsActiveMixin, Base):
+class Product(UUIDPKMixin, TimestampMixin, IsActiveMixin, RowVersionMixin, Base):
     """Товар (SKU, имя, описание, единица измерения)."""
     __tablename__ = "product"
 
@@ -17,13 +17,19 @@ class Product(UUIDPKMixin, TimestampMixin, IsActiveMixin, Base):
     name: Mapped[str] = mapped_column(String(255), nullable=False)
     description: Mapped[str | None] = mapped_column(Text())
     unit: Mapped[str] = mapped_column(String(16), nullable=False, default="pcs")
+    # >1 — остаток по каждой локации раскладывается на столько полос (горячие SKU)
+    stock_stripes: Mapped[int] = mapped_column(
+        SmallInteger, nullable=False, default=1, server_default=text("1")
+    )
 
-    # relations
+    # relations; коллекции не подгружаются неявно (на горячем SKU это тысячи строк) —
+    # при необходимости грузите явно через selectinload()
     inventory_items: Mapped[List["InventoryItem"]] = relationship(
-        "InventoryItem", back_populates="product", cascade="all, delete-orphan", lazy="selectin"
+        "InventoryItem", back_populates="product", cascade="all, delete-orphan",
+        lazy="raise", passive_deletes=True
     )
     po_lines: Mapped[List["PurchaseOrderLine"]] = relationship(
-        "PurchaseOrderLine", back_populates="product", lazy="selectin"
+        "PurchaseOrderLine", back_populates="product", lazy="raise"
     )
 
     def __repr__(self) -> str:
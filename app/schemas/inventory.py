@@ -1,9 +1,21 @@
 from __future__ import annotations
 
+from datetime import datetime
 from decimal import Decimal
+from typing import Annotated, Literal, Union
 from uuid import UUID
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+
+from app.models.inventory import InventoryTxnType
+
+
+def _check_ttl_reference(model):
+    # истекающий резерв должен быть привязан к reference: иначе release/ship не снимут
+    # его запись в журнале резервов, и sweeper освободит количество второй раз
+    if model.ttl_seconds is not None and model.reference is None:
+        raise ValueError("ttl_seconds requires a reference")
+    return model
 
 
 class AdjustRequest(BaseModel):
@@ -26,6 +38,11 @@ class ReserveRequest(BaseModel):
     location_id: UUID
     qty: Decimal
     reference: str | None = None
+    ttl_seconds: int | None = Field(
+        default=None, gt=0, description="Reservation is released automatically after this"
+    )
+
+    _ttl_needs_reference = model_validator(mode="after")(_check_ttl_reference)
 
 
 class ReleaseRequest(BaseModel):
@@ -41,3 +58,92 @@ class InventorySnapshot(BaseModel):
     on_hand: Decimal
     reserved: Decimal
     available: Decimal
+    sku: str | None = Field(default=None, description="Only with include_codes=true")
+    location_code: str | None = Field(default=None, description="Only with include_codes=true")
+
+
+class InventoryTxnOut(BaseModel):
+    id: UUID
+    product_id: UUID
+    from_location_id: UUID | None
+    to_location_id: UUID | None
+    qty: Decimal
+    txn_type: InventoryTxnType
+    reason: str | None
+    reference: str | None
+    created_at: datetime
+
+
+class ProductTotal(BaseModel):
+    product_id: UUID
+    on_hand: Decimal
+    reserved: Decimal
+    available: Decimal
+
+
+class AvailabilityRequest(BaseModel):
+    product_ids: list[UUID] = Field(default_factory=list, max_length=10_000)
+    skus: list[str] = Field(default_factory=list, max_length=10_000)
+    location_ids: list[UUID] = Field(
+        default_factory=list, max_length=1000, description="Empty — all locations"
+    )
+
+
+class BatchAdjust(AdjustRequest):
+    op: Literal["adjust"]
+
+
+class BatchMove(MoveRequest):
+    op: Literal["move"]
+
+
+class BatchReserve(ReserveRequest):
+    op: Literal["reserve"]
+
+
+class BatchRelease(ReleaseRequest):
+    op: Literal["release"]
+
+
+class BatchShip(ReleaseRequest):
+    op: Literal["ship"]
+
+
+BatchOperation = Annotated[
+    Union[BatchAdjust, BatchMove, BatchReserve, BatchRelease, BatchShip],
+    Field(discriminator="op"),
+]
+
+
+class BatchRequest(BaseModel):
+    operations: list[BatchOperation] = Field(min_length=1, max_length=10_000)
+
+
+class BatchItemOut(BaseModel):
+    product_id: UUID
+    location_id: UUID
+    on_hand: Decimal
+    reserved: Decimal
+
+
+class AllocationLine(BaseModel):
+    product_id: UUID
+    qty: Decimal = Field(gt=0)
+
+
+class AllocateRequest(BaseModel):
+    lines: list[AllocationLine] = Field(min_length=1, max_length=10_000)
+    policy: Literal["fewest_locations", "preferred_order", "largest_first"] = "fewest_locations"
+    preferred_location_ids: list[UUID] = Field(
+        default_factory=list, description="Location priority for the preferred_order policy"
+    )
+    reference: str | None = None
+    ttl_seconds: int | None = Field(default=None, gt=0)
+
+    _ttl_needs_reference = model_validator(mode="after")(_check_ttl_reference)
+
+
+class AllocationOut(BaseModel):
+    product_id: UUID
+    location_id: UUID
+    qty: Decimal
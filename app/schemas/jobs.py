@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from datetime import datetime
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+from app.models.jobs import ImportJobStatus
+
+
+class ImportJobOut(BaseModel):
+    id: UUID
+    kind: str
+    status: ImportJobStatus
+    filename: str | None = None
+    bytes_total: int
+    bytes_processed: int
+    progress: float = Field(description="Доля прочитанного файла, 0..1")
+    rows_processed: int
+    rows_invalid: int
+    rows_per_second: float | None = Field(
+        default=None, description="Строк в секунду с начала текущей попытки"
+    )
+    attempts: int
+    result: dict | None = Field(
+        default=None, description="Итог: inserted / updated / skipped / invalid / errors"
+    )
+    error: str | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class ProductCreate(BaseModel):
@@ -17,3 +17,7 @@ class ProductOut(BaseModel):
     sku: str
     name: str
     unit: str
+
+
+class StockStripesUpdate(BaseModel):
+    stripes: int = Field(ge=1, le=64, description="1 — обычный режим, >1 — горячий SKU")
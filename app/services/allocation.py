@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from typing import Literal, Mapping, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import InventoryItem, InventoryTxn
+from app.services.inventory import (
+    _apply_reserve,
+    _lock_items,
+    _record_reservation,
+    _reserve_txn,
+    _run_cas,
+    stock_levels,
+)
+
+AllocationPolicy = Literal["fewest_locations", "preferred_order", "largest_first"]
+
+# (product_id, location_id, qty)
+Allocation = tuple[uuid.UUID, uuid.UUID, Decimal]
+
+
+def plan_allocation(
+    wanted: Mapping[uuid.UUID, Decimal],
+    available: Mapping[uuid.UUID, Mapping[uuid.UUID, Decimal]],
+    policy: AllocationPolicy,
+    preferred: Sequence[uuid.UUID] = (),
+) -> list[Allocation]:
+    """Decide which locations fill each order line; pure, no I/O.
+
+    ``wanted`` maps product -> qty, ``available`` maps product -> {location: available}.
+
+    * ``largest_first`` — per product, take from the location with most stock first;
+    * ``preferred_order`` — per product, follow ``preferred`` (others after it,
+      largest first);
+    * ``fewest_locations`` — for the whole order, greedily pick the location that
+      fully covers the most remaining lines (then the most remaining qty), so the
+      order ships from as few places as possible.
+
+    Raises ValueError naming the first product that cannot be covered.
+    """
+    for product_id, qty in wanted.items():
+        total = sum(available.get(product_id, {}).values(), Decimal("0"))
+        if total < qty:
+            raise ValueError(
+                f"Not enough available stock for product {product_id}: "
+                f"requested {qty}, available {total}"
+            )
+
+    if policy == "fewest_locations":
+        return _plan_fewest_locations(wanted, available)
+
+    rank = {loc: n for n, loc in enumerate(preferred)} if policy == "preferred_order" else {}
+    plan: list[Allocation] = []
+    for product_id, qty in wanted.items():
+        stock = available.get(product_id, {})
+        order = sorted(
+            stock, key=lambda loc: (rank.get(loc, len(rank)), -stock[loc], str(loc))
+        )
+        remaining = qty
+        for loc in order:
+            if remaining <= 0:
+                break
+            take = min(remaining, stock[loc])
+            if take > 0:
+                plan.append((product_id, loc, take))
+                remaining -= take
+    return plan
+
+
+def _plan_fewest_locations(
+    wanted: Mapping[uuid.UUID, Decimal],
+    available: Mapping[uuid.UUID, Mapping[uuid.UUID, Decimal]],
+) -> list[Allocation]:
+    remaining = {p: q for p, q in wanted.items() if q > 0}
+    stock: dict[uuid.UUID, dict[uuid.UUID, Decimal]] = defaultdict(dict)
+    for product_id, locations in available.items():
+        if product_id in remaining:
+            for loc, qty in locations.items():
+                if qty > 0:
+                    stock[loc][product_id] = qty
+
+    def score(loc):
+        have = stock[loc]
+        full = sum(1 for p, q in remaining.items() if have.get(p, 0) >= q)
+        covered = sum(min(q, have.get(p, Decimal("0"))) for p, q in remaining.items())
+        return full, covered, str(loc)
+
+    plan: list[Allocation] = []
+    while remaining:
+        loc = max(stock, key=score)
+        for product_id in list(remaining):
+            take = min(remaining[product_id], stock[loc].get(product_id, Decimal("0")))
+            if take <= 0:
+                continue
+            plan.append((product_id, loc, take))
+            remaining[product_id] -= take
+            if remaining[product_id] <= 0:
+                del remaining[product_id]
+        del stock[loc]
+    return plan
+
+
+async def allocate_order(
+    session: AsyncSession,
+    *,
+    lines: Sequence[tuple[object, Decimal]],
+    policy: AllocationPolicy,
+    preferred_location_ids: Sequence[object] = (),
+    reference: str | None = None,
+    ttl_seconds: int | None = None,
+) -> list[Allocation]:
+    """Reserve (product, qty) order lines across locations, all-or-nothing.
+
+    Candidate rows are found with one query over the stock levels, locked in canonical
+    order, and the plan is computed from the locked values, so it cannot be overtaken
+    by a concurrent reservation.
+    """
+    wanted: dict[uuid.UUID, Decimal] = defaultdict(Decimal)
+    for product_id, qty in lines:
+        wanted[uuid.UUID(str(product_id))] += Decimal(qty)
+    preferred = [uuid.UUID(str(loc)) for loc in preferred_location_ids]
+
+    async def attempt():
+        async with session.begin():
+            levels = stock_levels().where(InventoryItem.product_id.in_(list(wanted))).subquery()
+            res = await session.execute(
+                select(levels.c.product_id, levels.c.location_id).where(levels.c.available > 0)
+            )
+            keys = res.all()
+            items = await _lock_items(session, keys) if keys else {}
+
+            available: dict[uuid.UUID, dict[uuid.UUID, Decimal]] = defaultdict(dict)
+            for (product_id, location_id), item in items.items():
+                available[product_id][location_id] = Decimal(item.on_hand) - Decimal(item.reserved)
+            plan = plan_allocation(wanted, available, policy, preferred)
+
+            for product_id, location_id, qty in plan:
+                _apply_reserve(items[(product_id, location_id)], qty)
+                session.add(InventoryTxn(**_reserve_txn(product_id, location_id, qty, reference)))
+                _record_reservation(session, product_id, location_id, qty, reference, ttl_seconds)
+            return plan
+
+    return await _run_cas(attempt)
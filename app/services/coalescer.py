@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio
+import uuid
+from decimal import Decimal
+from typing import NamedTuple
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.db.session import AsyncSessionMaker
+from app.models.inventory import InventoryItem
+from app.services.inventory import reserve_many
+
+
+class _Pending(NamedTuple):
+    qty: Decimal
+    reference: str | None
+    ttl_seconds: int | None
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class CoalescerStats:
+    """Счётчики для подбора окна: размеры пачек и время ожидания в очереди."""
+
+    BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.rejected = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.max_batch_size = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.batch_size_histogram = {b: 0 for b in self.BATCH_SIZE_BUCKETS}
+        self.batch_size_overflow = 0
+
+    def record_batch(self, size: int, waits: list[float]) -> None:
+        self.batches += 1
+        self.requests += size
+        self.max_batch_size = max(self.max_batch_size, size)
+        for bound in self.BATCH_SIZE_BUCKETS:
+            if size <= bound:
+                self.batch_size_histogram[bound] += 1
+                break
+        else:
+            self.batch_size_overflow += 1
+        self.queue_wait_total += sum(waits)
+        self.queue_wait_max = max(self.queue_wait_max, *waits)
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "batch_size_histogram": {
+                **{f"le_{b}": n for b, n in self.batch_size_histogram.items()},
+                "overflow": self.batch_size_overflow,
+            },
+            "avg_queue_wait_ms": (
+                self.queue_wait_total / self.requests * 1000 if self.requests else 0.0
+            ),
+            "max_queue_wait_ms": self.queue_wait_max * 1000,
+        }
+
+
+class ReservationCoalescer:
+    """Group-commit for concurrent reservations of the same (product, location).
+
+    The first request for a key opens a short window; everything that arrives for the
+    same key before it closes (or until ``max_batch`` is reached) is applied by one
+    transaction holding one row lock. Each caller still gets its own accept/reject.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession] = AsyncSessionMaker,
+        *,
+        window_ms: int,
+        max_batch: int,
+    ) -> None:
+        self._session_factory = session_factory
+        self._window = window_ms / 1000
+        self._max_batch = max_batch
+        self._pending: dict[tuple, list[_Pending]] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.stats = CoalescerStats()
+
+    async def reserve(
+        self,
+        *,
+        product_id,
+        location_id,
+        qty: Decimal,
+        reference: str | None,
+        ttl_seconds: int | None = None,
+    ) -> InventoryItem:
+        loop = asyncio.get_running_loop()
+        key = (uuid.UUID(str(product_id)), uuid.UUID(str(location_id)))
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = []
+            loop.call_later(self._window, self._dispatch, key, batch)
+        future = loop.create_future()
+        batch.append(_Pending(qty, reference, ttl_seconds, future, loop.time()))
+        if len(batch) >= self._max_batch:
+            self._dispatch(key, batch)
+        return await future
+
+    def _dispatch(self, key: tuple, batch: list[_Pending]) -> None:
+        # The window timer may fire after the batch was already sent off for being full
+        if self._pending.get(key) is not batch:
+            return
+        del self._pending[key]
+        task = asyncio.get_running_loop().create_task(self._flush(key, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, key: tuple, batch: list[_Pending]) -> None:
+        # Callers that gave up (client disconnect) are not reserved for
+        batch = [p for p in batch if not p.future.done()]
+        if not batch:
+            return
+        now = asyncio.get_running_loop().time()
+        self.stats.record_batch(len(batch), [now - p.enqueued_at for p in batch])
+        product_id, location_id = key
+        try:
+            async with self._session_factory() as session:
+                outcomes = await reserve_many(
+                    session,
+                    product_id=product_id,
+                    location_id=location_id,
+                    requests=[(p.qty, p.reference, p.ttl_seconds) for p in batch],
+                )
+        except Exception as e:
+            self.stats.failed_batches += 1
+            for p in batch:
+                if not p.future.done():
+                    p.future.set_exception(e)
+            return
+        for p, outcome in zip(batch, outcomes):
+            if p.future.done():
+                continue
+            if isinstance(outcome, ValueError):
+                self.stats.rejected += 1
+                p.future.set_exception(outcome)
+            else:
+                p.future.set_result(outcome)
+
+
+reservation_coalescer = ReservationCoalescer(
+    window_ms=settings.RESERVE_COALESCE_WINDOW_MS,
+    max_batch=settings.RESERVE_COALESCE_MAX_BATCH,
+)
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import asyncio
+import codecs
+import csv
+import io
+from contextlib import contextmanager
+from typing import Awaitable, BinaryIO, Callable, Iterator, Mapping, NamedTuple, Sequence
+
+from sqlalchemy import Table
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.schema import CreateTable
+
+# enough to guess the encoding and the delimiter; the rest is decoded as it is read
+SAMPLE_BYTES = 64 * 1024
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+# tried in order on the sample; cp1251 rejects only a handful of bytes, so real
+# UTF-8 is recognised first and Windows/Excel exports land on cp1251
+_CANDIDATES = ("utf-8", "cp1251")
+
+# at most this many invalid rows are described in a result; all of them are counted
+MAX_REPORTED_ERRORS = 100
+
+
+def detect_encoding(sample: bytes, forced: str | None = None) -> str:
+    """Encoding of a file from its first bytes: BOM, then strict trial decoding.
+
+    A multi-byte sequence cut at the end of the sample is not an error (the
+    decoder is incremental). charset-normalizer is consulted when installed,
+    latin-1 is the last resort since it accepts any byte sequence.
+    """
+    if forced:
+        try:
+            return codecs.lookup(forced).name
+        except LookupError:
+            raise ValueError(f"Unknown encoding {forced}") from None
+    for bom, name in _BOMS:
+        if sample.startswith(bom):
+            return name
+    for name in _CANDIDATES:
+        try:
+            codecs.getincrementaldecoder(name)().decode(sample, final=False)
+            return name
+        except UnicodeDecodeError:
+            continue
+    try:
+        from charset_normalizer import from_bytes  # type: ignore
+
+        best = from_bytes(sample).best()
+        if best is not None:
+            return best.encoding
+    except ImportError:
+        pass
+    return "latin-1"
+
+
+class CsvReader:
+    """csv.reader that reports decoding and format errors as ValueError."""
+
+    def __init__(self, reader, encoding: str) -> None:
+        self._reader = reader
+        self.encoding = encoding
+
+    @property
+    def line_num(self) -> int:
+        return self._reader.line_num
+
+    def __iter__(self) -> CsvReader:
+        return self
+
+    def __next__(self) -> list[str]:
+        try:
+            return next(self._reader)
+        except UnicodeDecodeError:
+            raise ValueError(
+                f"Cannot decode the file as {self.encoding} (near line {self.line_num + 1})"
+            ) from None
+        except csv.Error as exc:
+            raise ValueError(f"Malformed CSV at line {self.line_num}: {exc}") from None
+
+
+@contextmanager
+def open_csv(binary: BinaryIO, encoding: str | None = None) -> Iterator[CsvReader]:
+    """csv.reader over a binary file, decoded incrementally as rows are consumed.
+
+    The file must be seekable (an upload spool or a file on disk); it is left open.
+    Delimiter is sniffed from the sample among ``, ; TAB |``.
+    """
+    sample = binary.read(SAMPLE_BYTES)
+    name = detect_encoding(sample, encoding)
+    head = codecs.getincrementaldecoder(name)(errors="replace").decode(sample, final=False)
+    try:
+        dialect = csv.Sniffer().sniff(head[:10000], delimiters=",;|\t")
+    except csv.Error:
+        dialect = csv.excel
+    binary.seek(0)
+    stream = io.TextIOWrapper(binary, encoding=name, newline="")
+    try:
+        yield CsvReader(csv.reader(stream, dialect), name)
+    finally:
+        # detach, or closing the wrapper would close the caller's file
+        stream.detach()
+
+
+def header_index(header: Sequence[str], aliases: Mapping[str, Sequence[str]]) -> dict:
+    """Field -> positions of its header aliases, in alias order."""
+    positions = {name.strip(): i for i, name in reversed(list(enumerate(header)))}
+    return {
+        field: [positions[a] for a in names if a in positions] for field, names in aliases.items()
+    }
+
+
+def pick(row: Sequence[str], positions: Sequence[int]) -> str:
+    """First non-blank value among ``positions`` (stripped), else ''."""
+    for i in positions:
+        if i < len(row):
+            value = row[i].strip()
+            if value:
+                return value
+    return ""
+
+
+async def copy_rows(session: AsyncSession, table: Table, rows: Sequence[tuple]) -> None:
+    """COPY ``rows`` into ``table`` over the session's connection (binary protocol).
+
+    Runs inside the session's transaction, so a temporary table created there is
+    visible and the rows go away with a rollback.
+    """
+    conn = await session.connection()
+    raw = (await conn.get_raw_connection()).driver_connection
+    await raw.copy_records_to_table(
+        table.name, records=rows, columns=[c.name for c in table.columns]
+    )
+
+
+class ParsedBatch(NamedTuple):
+    rows: list[tuple]  # valid rows, in stage table column order
+    errors: list[tuple[int, str]]  # (line, message)
+    line: int  # last file line consumed
+    offset: int  # bytes of the file read so far (the decoder reads ahead a little)
+
+
+OnBatch = Callable[[ParsedBatch], Awaitable[None]]
+
+
+async def stage_batches(
+    session: AsyncSession,
+    table: Table,
+    batches: Iterator[ParsedBatch],
+    on_batch: OnBatch | None = None,
+) -> tuple[int, int, list[dict]]:
+    """Create temporary ``table`` and COPY every batch into it.
+
+    Batches are parsed in a worker thread one at a time, so at most one batch is in
+    memory while the previous one is being copied. ``on_batch`` is awaited after
+    each COPY (progress reporting). Returns (staged, invalid, first errors).
+    """
+    await session.execute(CreateTable(table))
+    staged = invalid = 0
+    errors: list[dict] = []
+    while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+        if batch.rows:
+            await copy_rows(session, table, batch.rows)
+        staged += len(batch.rows)
+        invalid += len(batch.errors)
+        room = MAX_REPORTED_ERRORS - len(errors)
+        errors += [{"line": n, "error": e} for n, e in batch.errors[:room]]
+        if on_batch is not None:
+            await on_batch(batch)
+    return staged, invalid, errors
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timedelta
+from typing import Sequence
+
+from sqlalchemy import (
+    TIMESTAMP,
+    CompoundSelect,
+    Select,
+    bindparam,
+    case,
+    func,
+    literal,
+    literal_column,
+    select,
+    true,
+    tuple_,
+    union_all,
+)
+from sqlalchemy.dialects.postgresql import distinct_on, insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.db.session import AsyncSessionMaker
+from app.models import InventoryCheckpoint, InventoryHistoryStart, InventoryTxn, InventoryTxnType
+from app.services.inventory import _any
+
+_txn = InventoryTxn.__table__
+_cp = InventoryCheckpoint.__table__
+_start = InventoryHistoryStart.__table__
+
+# pg_advisory_xact_lock key: checkpoint windows must not overlap
+_CHECKPOINT_LOCK = 0x1C4EC6F0
+
+# leg of a journal row that changes on_hand: +qty at to_location, -qty at from_location
+_ADDS_ON_HAND = (InventoryTxnType.ADJUSTMENT, InventoryTxnType.IN, InventoryTxnType.TRANSFER)
+_REMOVES_ON_HAND = (InventoryTxnType.ADJUSTMENT, InventoryTxnType.TRANSFER, InventoryTxnType.OUT)
+
+
+def _journal_legs(*conditions) -> CompoundSelect:
+    """Строки журнала как изменения остатка по локациям: (product, location, on_hand, reserved).
+
+    Строка журнала даёт до двух «ног»: на to_location (приход, снятие резерва) и на
+    from_location (расход, резерв, отгрузка). Ноги с удалённой локацией (NULL) опускаются.
+    """
+    qty = _txn.c.qty
+    to_leg = select(
+        _txn.c.product_id,
+        _txn.c.to_location_id.label("location_id"),
+        case((_txn.c.txn_type.in_(_ADDS_ON_HAND), qty), else_=0).label("on_hand"),
+        case((_txn.c.txn_type == InventoryTxnType.RELEASE, -qty), else_=0).label("reserved"),
+    ).where(_txn.c.to_location_id.is_not(None), *conditions)
+    from_leg = select(
+        _txn.c.product_id,
+        _txn.c.from_location_id.label("location_id"),
+        case((_txn.c.txn_type.in_(_REMOVES_ON_HAND), -qty), else_=0).label("on_hand"),
+        case(
+            (_txn.c.txn_type == InventoryTxnType.RESERVE, qty),
+            (_txn.c.txn_type == InventoryTxnType.OUT, -qty),
+            else_=0,
+        ).label("reserved"),
+    ).where(_txn.c.from_location_id.is_not(None), *conditions)
+    return union_all(to_leg, from_leg)
+
+
+async def history_start(session: AsyncSession) -> datetime | None:
+    """Earliest moment stock_as_of can answer for; None: the whole journal is usable.
+
+    Set to the base checkpoint by the migration that took it from live balances (the
+    journal before it does not replay to correct balances), and moved forward when
+    journal retention removes old partitions.
+    """
+    return await session.scalar(select(func.max(_start.c.starts_at)))
+
+
+def stock_as_of(
+    at: datetime, product_ids: Sequence, location_ids: Sequence = ()
+) -> Select:
+    """Остатки товаров на момент ``at``: ближайшая контрольная точка плюс хвост журнала.
+
+    Точка берётся последняя не позже ``at`` среди строк запрошенных товаров; так как
+    фоновая задача пишет строки для всех изменившихся пар, на этот момент остаток
+    каждой пары — её последняя строка. Журнал читается только после этой точки
+    (индекс по product_id, created_at). Без точек доигрывается вся история товаров.
+    ``at`` раньше history_start() не поддерживается: вызывающий проверяет это сам.
+    """
+    at_param = bindparam("at", at, type_=TIMESTAMP(timezone=True))
+    products = _any(_cp.c.product_id, "checkpoint_product_ids", product_ids)
+    base_at = func.coalesce(
+        select(func.max(_cp.c.taken_at))
+        .where(_cp.c.taken_at <= at_param, products)
+        .scalar_subquery(),
+        literal_column("'-infinity'::timestamptz"),
+    )
+    base = (
+        select(_cp.c.product_id, _cp.c.location_id, _cp.c.on_hand, _cp.c.reserved)
+        .ext(distinct_on(_cp.c.product_id, _cp.c.location_id))
+        .where(_cp.c.taken_at <= base_at, products)
+        .order_by(_cp.c.product_id, _cp.c.location_id, _cp.c.taken_at.desc())
+        .subquery("base")
+    )
+    tail = _journal_legs(
+        _any(_txn.c.product_id, "product_ids", product_ids),
+        _txn.c.created_at > base_at,
+        _txn.c.created_at <= at_param,
+    )
+    rows = union_all(select(*base.c), tail).subquery("rows")
+    on_hand = func.sum(rows.c.on_hand)
+    reserved = func.sum(rows.c.reserved)
+    q = (
+        select(
+            rows.c.product_id,
+            rows.c.location_id,
+            on_hand.label("on_hand"),
+            reserved.label("reserved"),
+            (on_hand - reserved).label("available"),
+        )
+        .group_by(rows.c.product_id, rows.c.location_id)
+        .order_by(rows.c.product_id, rows.c.location_id)
+    )
+    if location_ids:
+        q = q.where(_any(rows.c.location_id, "location_ids", location_ids))
+    return q
+
+
+def journal_page(
+    *,
+    product_ids: Sequence = (),
+    location_ids: Sequence = (),
+    txn_types: Sequence[InventoryTxnType] = (),
+    reference: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    after: tuple[datetime, uuid.UUID] | None = None,
+    descending: bool = True,
+    limit: int = 100,
+) -> Select:
+    """Страница журнала с фильтрами; keyset по (created_at, id) вместо OFFSET.
+
+    ``after`` — (created_at, id) последней строки предыдущей страницы. Локация ищется
+    и в from_location_id, и в to_location_id (два индекса, BitmapOr). ``since``
+    включительно, ``until`` — нет.
+    """
+    q = select(_txn)
+    if product_ids:
+        q = q.where(_any(_txn.c.product_id, "product_ids", product_ids))
+    if location_ids:
+        q = q.where(
+            _any(_txn.c.from_location_id, "from_location_ids", location_ids)
+            | _any(_txn.c.to_location_id, "to_location_ids", location_ids)
+        )
+    if txn_types:
+        q = q.where(_txn.c.txn_type.in_(list(txn_types)))
+    if reference is not None:
+        q = q.where(_txn.c.reference == reference)
+    if since is not None:
+        q = q.where(_txn.c.created_at >= since)
+    if until is not None:
+        q = q.where(_txn.c.created_at < until)
+    key = tuple_(_txn.c.created_at, _txn.c.id)
+    if after is not None:
+        q = q.where(key < tuple_(*after) if descending else key > tuple_(*after))
+    if descending:
+        q = q.order_by(_txn.c.created_at.desc(), _txn.c.id.desc())
+    else:
+        q = q.order_by(_txn.c.created_at, _txn.c.id)
+    return q.limit(limit)
+
+
+async def take_checkpoint(
+    session_factory: async_sessionmaker[AsyncSession] = AsyncSessionMaker,
+    *,
+    lag_seconds: float | None = None,
+) -> int:
+    """Fold the journal written since the previous checkpoint into a new one.
+
+    Only pairs that changed in the window get a row: previous balance plus the
+    window's net change. The cut is ``now() - lag``: journal rows carry their
+    transaction's start time, so the lag must exceed the longest write transaction,
+    or a late commit could land behind an existing checkpoint. Returns rows written.
+    """
+    if lag_seconds is None:
+        lag_seconds = settings.INVENTORY_CHECKPOINT_LAG_SECONDS
+    async with session_factory() as session:
+        async with session.begin():
+            await session.execute(select(func.pg_advisory_xact_lock(_CHECKPOINT_LOCK)))
+            res = await session.execute(
+                select(
+                    func.now() - timedelta(seconds=lag_seconds),
+                    select(func.max(_cp.c.taken_at)).scalar_subquery(),
+                )
+            )
+            taken_at, previous = res.one()
+            if previous is not None and taken_at <= previous:
+                return 0
+
+            window = [_txn.c.created_at <= taken_at]
+            if previous is not None:
+                window.append(_txn.c.created_at > previous)
+            legs = _journal_legs(*window).subquery("legs")
+            delta = (
+                select(
+                    legs.c.product_id,
+                    legs.c.location_id,
+                    func.sum(legs.c.on_hand).label("on_hand"),
+                    func.sum(legs.c.reserved).label("reserved"),
+                )
+                .group_by(legs.c.product_id, legs.c.location_id)
+                .subquery("delta")
+            )
+            last = (
+                select(_cp.c.on_hand, _cp.c.reserved)
+                .where(
+                    _cp.c.product_id == delta.c.product_id,
+                    _cp.c.location_id == delta.c.location_id,
+                )
+                .order_by(_cp.c.taken_at.desc())
+                .limit(1)
+                .lateral("last")
+            )
+            rows = select(
+                delta.c.product_id,
+                delta.c.location_id,
+                literal(taken_at, TIMESTAMP(timezone=True)),
+                func.coalesce(last.c.on_hand, 0) + delta.c.on_hand,
+                func.coalesce(last.c.reserved, 0) + delta.c.reserved,
+            ).select_from(delta.outerjoin(last, true()))
+            res = await session.execute(
+                insert(_cp).from_select(
+                    ["product_id", "location_id", "taken_at", "on_hand", "reserved"], rows
+                )
+            )
+            return res.rowcount
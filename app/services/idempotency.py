@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+from contextvars import ContextVar
+from datetime import timedelta
+from typing import NamedTuple
+
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.db.session import AsyncSessionMaker
+from app.models import IdempotencyKey
+
+_key_t = IdempotencyKey.__table__
+
+
+class StoredResponse(NamedTuple):
+    request_hash: str
+    status_code: int | None  # None while the original request is still running
+    content_type: str | None
+    body: bytes | None
+
+
+# Completed responses only; they never change, so a per-process copy is always valid
+response_cache: LRUCache[StoredResponse] = LRUCache(
+    settings.IDEMPOTENCY_CACHE_SIZE, ttl_seconds=settings.IDEMPOTENCY_KEY_RETENTION_HOURS * 3600
+)
+
+
+async def claim_key(session: AsyncSession, key: str, request_hash: str) -> StoredResponse | None:
+    """Claim ``key`` for a new execution; returns None when the caller now owns it.
+
+    Otherwise returns what is stored for the key: a finished response to replay, or
+    a record still in progress. An unfinished claim is never taken over, however old:
+    its request may still be running or may have committed already (see
+    mark_applied). It stays until released or purged with the other old keys.
+    """
+    stmt = (
+        insert(_key_t)
+        .values(key=key, request_hash=request_hash)
+        .on_conflict_do_nothing(index_elements=[_key_t.c.key])
+        .returning(_key_t.c.key)
+    )
+    async with session.begin():
+        if (await session.execute(stmt)).first() is not None:
+            return None
+        res = await session.execute(
+            select(
+                _key_t.c.request_hash,
+                _key_t.c.status_code,
+                _key_t.c.content_type,
+                _key_t.c.response_body,
+            ).where(_key_t.c.key == key)
+        )
+        row = res.first()
+    if row is None:
+        # released between the two statements; the client may simply retry
+        return StoredResponse(request_hash, None, None, None)
+    stored = StoredResponse(*row)
+    if stored.status_code is not None:
+        response_cache.set(key, stored)
+    return stored
+
+
+class Claim:
+    """A key owned by the request running in this context."""
+
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.active = True  # cleared once the handler has produced its response
+        self.applied = False  # a transaction of the handler has committed
+
+
+current_claim: ContextVar[Claim | None] = ContextVar("idempotency_claim", default=None)
+
+
+@event.listens_for(Session, "before_commit")
+def mark_applied(session: Session) -> None:
+    """Mark the current claim applied inside every commit of its request.
+
+    Runs for any session, so whichever transaction the handler commits carries the
+    marker with it: either both are durable or neither is.
+    """
+    claim = current_claim.get()
+    if claim is None or not claim.active:
+        return
+    session.execute(
+        update(_key_t)
+        .where(_key_t.c.key == claim.key, _key_t.c.applied_at.is_(None))
+        .values(applied_at=func.now())
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _applied(session: Session) -> None:
+    claim = current_claim.get()
+    if claim is not None and claim.active:
+        claim.applied = True
+
+
+async def complete_key(
+    session: AsyncSession, key: str, response: StoredResponse
+) -> None:
+    async with session.begin():
+        await session.execute(
+            update(_key_t)
+            .where(_key_t.c.key == key)
+            .values(
+                status_code=response.status_code,
+                content_type=response.content_type,
+                response_body=response.body,
+            )
+        )
+    response_cache.set(key, response)
+
+
+async def release_key(session: AsyncSession, key: str) -> None:
+    """Drop an unfinished claim so the request can be retried with the same key.
+
+    A claim whose request has committed anything is kept: running it again would
+    apply the change twice.
+    """
+    async with session.begin():
+        await session.execute(
+            delete(_key_t).where(
+                _key_t.c.key == key,
+                _key_t.c.status_code.is_(None),
+                _key_t.c.applied_at.is_(None),
+            )
+        )
+
+
+async def purge_idempotency_keys(
+    session_factory: async_sessionmaker[AsyncSession] = AsyncSessionMaker,
+) -> int:
+    """Delete keys older than the retention period, in bounded batches.
+
+    Returns the number of keys removed.
+    """
+    cutoff = func.now() - timedelta(hours=settings.IDEMPOTENCY_KEY_RETENTION_HOURS)
+    batch = settings.IDEMPOTENCY_PURGE_BATCH_SIZE
+    purged = 0
+    async with session_factory() as session:
+        while True:
+            old = (
+                select(_key_t.c.key)
+                .where(_key_t.c.created_at < cutoff)
+                .limit(batch)
+                .with_for_update(skip_locked=True)
+            )
+            async with session.begin():
+                res = await session.execute(
+                    delete(_key_t).where(_key_t.c.key.in_(old.scalar_subquery()))
+                )
+            purged += res.rowcount
+            if res.rowcount < batch:
+                return purged
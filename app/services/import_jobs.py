@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import shutil
+import uuid
+from datetime import timedelta
+from pathlib import Path
+from typing import Awaitable, BinaryIO, Callable
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.db.session import AsyncSessionMaker
+from app.models import ImportJob, ImportJobStatus
+from app.services.csv_stream import OnBatch, ParsedBatch
+from app.services.product_import import import_products
+from app.services.stocktake import import_stocktake
+
+logger = logging.getLogger(__name__)
+
+_COPY_CHUNK = 1024 * 1024
+
+# kind -> runs the import of an opened spool file; returns the job result
+Runner = Callable[[AsyncSession, BinaryIO, dict, OnBatch], Awaitable[dict]]
+
+
+async def _run_product_import(
+    session: AsyncSession, source: BinaryIO, params: dict, on_batch: OnBatch
+) -> dict:
+    result = await import_products(
+        session,
+        source,
+        mode=params.get("mode", "insert"),
+        encoding=params.get("encoding"),
+        on_batch=on_batch,
+    )
+    return result.as_dict()
+
+
+async def _run_stocktake(
+    session: AsyncSession, source: BinaryIO, params: dict, on_batch: OnBatch
+) -> dict:
+    return await import_stocktake(session, source, **params, on_batch=on_batch)
+
+
+RUNNERS: dict[str, Runner] = {"products": _run_product_import, "stocktake": _run_stocktake}
+
+
+def _spool(source: BinaryIO, path: Path) -> int:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    source.seek(0)
+    with open(path, "wb") as out:
+        shutil.copyfileobj(source, out, _COPY_CHUNK)
+        return out.tell()
+
+
+async def submit_job(
+    session: AsyncSession, kind: str, source: BinaryIO, *, filename: str | None, params: dict
+) -> ImportJob:
+    """Copy an upload to the spool directory and queue a job for it.
+
+    The file is written before the row is committed, so a queued job always has its
+    file; a failed commit removes the file again.
+    """
+    if kind not in RUNNERS:
+        raise ValueError(f"Unknown import kind {kind}")
+    job_id = uuid.uuid4()
+    path = Path(settings.IMPORT_SPOOL_DIR) / f"{job_id}.upload"
+    size = await asyncio.to_thread(_spool, source, path)
+    job = ImportJob(
+        id=job_id,
+        kind=kind,
+        params=params,
+        filename=filename,
+        spool_path=str(path),
+        bytes_total=size,
+    )
+    try:
+        async with session.begin():
+            session.add(job)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return job
+
+
+async def claim_job(
+    session_factory: async_sessionmaker[AsyncSession] = AsyncSessionMaker,
+) -> ImportJob | None:
+    """Take the oldest queued job, or a running one whose worker stopped heartbeating.
+
+    SKIP LOCKED lets several processes poll the same queue without waiting on each
+    other. Counters are reset: an interrupted import was rolled back as a whole.
+    """
+    stale = func.now() - timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS)
+    next_job = (
+        select(ImportJob.id)
+        .where(
+            or_(
+                ImportJob.status == ImportJobStatus.QUEUED,
+                (ImportJob.status == ImportJobStatus.RUNNING) & (ImportJob.heartbeat_at < stale),
+            )
+        )
+        .order_by(ImportJob.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    async with session_factory() as session:
+        async with session.begin():
+            res = await session.execute(
+                update(ImportJob)
+                .where(ImportJob.id == next_job)
+                .values(
+                    status=ImportJobStatus.RUNNING,
+                    attempts=ImportJob.attempts + 1,
+                    started_at=func.now(),
+                    heartbeat_at=func.now(),
+                    bytes_processed=0,
+                    rows_processed=0,
+                    rows_invalid=0,
+                )
+                .returning(ImportJob)
+            )
+            return res.scalars().first()
+
+
+async def _update(session_factory: async_sessionmaker[AsyncSession], job_id, **values) -> None:
+    async with session_factory() as session:
+        async with session.begin():
+            await session.execute(update(ImportJob).where(ImportJob.id == job_id).values(**values))
+
+
+async def _heartbeat(session_factory: async_sessionmaker[AsyncSession], job_id) -> None:
+    # separate from progress: the final merge can run long without any batch
+    while True:
+        await asyncio.sleep(settings.IMPORT_JOB_STALE_SECONDS / 4)
+        try:
+            await _update(session_factory, job_id, heartbeat_at=func.now())
+        except Exception:
+            logger.warning("Import job %s heartbeat failed", job_id, exc_info=True)
+
+
+async def _finish(
+    session_factory: async_sessionmaker[AsyncSession], job: ImportJob, **values
+) -> None:
+    await _update(session_factory, job.id, finished_at=func.now(), **values)
+    Path(job.spool_path).unlink(missing_ok=True)
+
+
+async def run_job(
+    job: ImportJob, session_factory: async_sessionmaker[AsyncSession] = AsyncSessionMaker
+) -> None:
+    """Run a claimed job to DONE or FAILED, reporting progress after every batch.
+
+    On cancellation (shutdown) the job stays RUNNING; once its heartbeat is stale
+    another worker starts it over, up to IMPORT_JOB_MAX_ATTEMPTS times.
+    """
+    if job.attempts > settings.IMPORT_JOB_MAX_ATTEMPTS:
+        await _finish(
+            session_factory,
+            job,
+            status=ImportJobStatus.FAILED,
+            error=f"Abandoned by its worker {job.attempts - 1} times",
+        )
+        return
+    processed = invalid = 0
+
+    async def progress(batch: ParsedBatch) -> None:
+        nonlocal processed, invalid
+        processed += len(batch.rows) + len(batch.errors)
+        invalid += len(batch.errors)
+        await _update(
+            session_factory,
+            job.id,
+            rows_processed=processed,
+            rows_invalid=invalid,
+            bytes_processed=batch.offset,
+            heartbeat_at=func.now(),
+        )
+
+    heartbeat = asyncio.create_task(_heartbeat(session_factory, job.id))
+    try:
+        with open(job.spool_path, "rb") as source:
+            async with session_factory() as session:
+                result = await RUNNERS[job.kind](session, source, job.params, progress)
+    except (ValueError, OSError) as exc:
+        await _finish(session_factory, job, status=ImportJobStatus.FAILED, error=str(exc))
+    except Exception as exc:
+        logger.exception("Import job %s failed", job.id)
+        await _finish(
+            session_factory,
+            job,
+            status=ImportJobStatus.FAILED,
+            error=f"Import failed ({type(exc).__name__}), see server log",
+        )
+    else:
+        await _finish(
+            session_factory,
+            job,
+            status=ImportJobStatus.DONE,
+            result=result,
+            bytes_processed=job.bytes_total,
+        )
+    finally:
+        heartbeat.cancel()
+
+
+async def run_import_jobs(
+    session_factory: async_sessionmaker[AsyncSession] = AsyncSessionMaker,
+) -> int:
+    """Work through the queue until it is empty; returns the number of jobs run."""
+    count = 0
+    while (job := await claim_job(session_factory)) is not None:
+        await run_job(job, session_factory)
+        count += 1
+    return count
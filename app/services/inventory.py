@@ -1,35 +1,740 @@
 from __future__ import annotations
 
+import asyncio
+import random
+import uuid
+from datetime import timedelta
 from decimal import Decimal
+from typing import Awaitable, Callable, Sequence, TypeVar
 
-from sqlalchemy import select
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import (
+    CTE,
+    ColumnElement,
+    Row,
+    Select,
+    Subquery,
+    Table,
+    and_,
+    any_,
+    bindparam,
+    column,
+    func,
+    literal,
+    select,
+    true,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.sql.selectable import TableValuedAlias
 
-from app.models.inventory import InventoryItem, InventoryTxn, InventoryTxnType
+from app.core.config import settings
+from app.errors import ConcurrencyConflictError
+from app.models.inventory import (
+    InventoryItem,
+    InventoryReservation,
+    InventoryStripe,
+    InventoryTxn,
+    InventoryTxnType,
+    ProductStockDelta,
+    ProductStockTotal,
+)
+from app.models.location import Location
+from app.models.product import Product
+from app.schemas.inventory import BatchOperation
 
+_item = InventoryItem.__table__
+_stripe = InventoryStripe.__table__
+_txn = InventoryTxn.__table__
+_product = Product.__table__
+_total = ProductStockTotal.__table__
+_delta = ProductStockDelta.__table__
+_location = Location.__table__
 
-async def _ensure_and_lock_item(session: AsyncSession, product_id, location_id) -> InventoryItem:
-    # Create row if missing (idempotent), then select FOR UPDATE to avoid races
-    stmt = insert(InventoryItem).values(
-        product_id=product_id, location_id=location_id, on_hand=0, reserved=0
-    ).on_conflict_do_nothing(index_elements=[InventoryItem.product_id, InventoryItem.location_id])
+T = TypeVar("T")
+
+# счётчики оптимистичного режима (CAS по version), отдаются в /inventory/stats
+cas_stats = {"conflicts": 0, "retries": 0, "exhausted": 0}
+
+
+def _key(product_id, location_id) -> tuple[uuid.UUID, uuid.UUID]:
+    return uuid.UUID(str(product_id)), uuid.UUID(str(location_id))
+
+
+def _stripe_totals() -> Subquery:
+    return (
+        select(
+            _stripe.c.product_id,
+            _stripe.c.location_id,
+            func.sum(_stripe.c.on_hand).label("on_hand"),
+            func.sum(_stripe.c.reserved).label("reserved"),
+        )
+        .group_by(_stripe.c.product_id, _stripe.c.location_id)
+        .subquery("stripes")
+    )
+
+
+def stock_levels(*, include_codes: bool = False) -> Select:
+    """Остатки по парам (product, location) с учётом полос; available считается в SQL.
+
+    include_codes добавляет колонки sku и location_code (join с product и location).
+    """
+    stripes = _stripe_totals()
+    on_hand = _item.c.on_hand + func.coalesce(stripes.c.on_hand, 0)
+    reserved = _item.c.reserved + func.coalesce(stripes.c.reserved, 0)
+    source = _item.outerjoin(
+        stripes,
+        and_(
+            stripes.c.product_id == _item.c.product_id,
+            stripes.c.location_id == _item.c.location_id,
+        ),
+    )
+    columns = [
+        _item.c.product_id,
+        _item.c.location_id,
+        on_hand.label("on_hand"),
+        reserved.label("reserved"),
+        (on_hand - reserved).label("available"),
+    ]
+    if include_codes:
+        source = source.join(_product, _product.c.id == _item.c.product_id).join(
+            _location, _location.c.id == _item.c.location_id
+        )
+        columns += [_product.c.sku, _location.c.code.label("location_code")]
+    return select(*columns).select_from(source)
+
+
+def snapshot_version(product_ids: Sequence = (), location_ids: Sequence = ()) -> Select:
+    """Признак изменения снимка остатков: одна строка агрегатов без выборки самих строк.
+
+    Число строк и max(updated_at) по позициям и полосам ловят вставки и удаления,
+    сумма version растёт при любом обновлении (каждый писатель инкрементирует version).
+    """
+    parts = []
+    for table in (_item, _stripe):
+        q = select(
+            func.count().label("rows"),
+            func.max(table.c.updated_at).label("updated_at"),
+            func.coalesce(func.sum(table.c.version), 0).label("versions"),
+        )
+        if product_ids:
+            q = q.where(table.c.product_id.in_(product_ids))
+        if location_ids:
+            q = q.where(table.c.location_id.in_(location_ids))
+        parts.append(q.subquery(table.name))
+    items, stripes = parts
+    return select(*items.c, *stripes.c).select_from(items.join(stripes, true()))
+
+
+def catalog_version(model: type[Product] | type[Location]) -> Select:
+    """Признак изменения справочника: число строк, сумма version и max(updated_at)."""
+    return select(
+        func.count(), func.coalesce(func.sum(model.version), 0), func.max(model.updated_at)
+    )
+
+
+def _stock_totals() -> Subquery:
+    # свёрнутые итоги плюс ещё не свёрнутые дельты; сумма по товару — его итог
+    columns = ("product_id", "on_hand", "reserved")
+    return (
+        select(*(_total.c[c] for c in columns))
+        .union_all(select(*(_delta.c[c] for c in columns)))
+        .subquery("totals")
+    )
+
+
+def product_totals(product_ids: Sequence) -> Select:
+    """Итоги по товарам из product_stock_total и несвёрнутых дельт, по индексу product_id.
+
+    Товары без остатка в выборку не попадают.
+    """
+    totals = _stock_totals()
+    on_hand = func.sum(totals.c.on_hand)
+    reserved = func.sum(totals.c.reserved)
+    return (
+        select(
+            totals.c.product_id,
+            on_hand.label("on_hand"),
+            reserved.label("reserved"),
+            (on_hand - reserved).label("available"),
+        )
+        .where(totals.c.product_id.in_(product_ids))
+        .group_by(totals.c.product_id)
+    )
+
+
+def _any(column, name: str, values: Sequence) -> ColumnElement[bool]:
+    # one array parameter instead of one parameter per value
+    return column == any_(bindparam(name, list(values), type_=ARRAY(column.type)))
+
+
+def availability(
+    *, product_ids: Sequence = (), skus: Sequence[str] = (), location_ids: Sequence = ()
+) -> Select:
+    """Доступность по товарам, заданным id и/или SKU, с опциональным фильтром по локациям.
+
+    Каждый список передаётся одним параметром-массивом (= ANY), поэтому размер запроса
+    не упирается в лимит параметров драйвера. Без фильтра по локациям итоги берутся
+    из product_stock_total и дельт. Товары без остатка дают нули.
+    """
+    if location_ids:
+        levels = stock_levels().where(_any(_item.c.location_id, "location_ids", location_ids))
+        source = levels.subquery("levels")
+    else:
+        source = _stock_totals()
+    on_hand = func.coalesce(func.sum(source.c.on_hand), 0)
+    reserved = func.coalesce(func.sum(source.c.reserved), 0)
+    return (
+        select(
+            _product.c.id.label("product_id"),
+            _product.c.sku,
+            on_hand.label("on_hand"),
+            reserved.label("reserved"),
+            (on_hand - reserved).label("available"),
+        )
+        .select_from(_product.outerjoin(source, source.c.product_id == _product.c.id))
+        .where(
+            _any(_product.c.id, "product_ids", product_ids)
+            | _any(_product.c.sku, "skus", skus)
+        )
+        .group_by(_product.c.id, _product.c.sku)
+        .order_by(_product.c.sku)
+    )
+
+
+def availability_version(
+    *, product_ids: Sequence = (), skus: Sequence[str] = (), location_ids: Sequence = ()
+) -> Select:
+    """Признак изменения ответа availability() с теми же аргументами, одной строкой агрегатов.
+
+    Без фильтра по локациям: сумма version строк итогов (растёт при каждой свёртке),
+    число и сумма id несвёрнутых дельт (каждая запись дописывает новую строку). С фильтром —
+    как snapshot_version по позициям и полосам этих локаций. Число найденных товаров
+    ловит появление и удаление SKU.
+    """
+    matched = select(_product.c.id).where(
+        _any(_product.c.id, "version_product_ids", product_ids)
+        | _any(_product.c.sku, "version_skus", skus)
+    )
+    parts = [select(func.count().label("products")).select_from(matched.subquery("matched"))]
+    if location_ids:
+        for table in (_item, _stripe):
+            parts.append(
+                select(
+                    func.count().label("rows"),
+                    func.max(table.c.updated_at).label("updated_at"),
+                    func.coalesce(func.sum(table.c.version), 0).label("versions"),
+                ).where(
+                    table.c.product_id.in_(matched),
+                    _any(table.c.location_id, f"version_{table.name}_locations", location_ids),
+                )
+            )
+    else:
+        parts += [
+            select(
+                func.count().label("rows"),
+                func.coalesce(func.sum(_total.c.version), 0).label("versions"),
+            ).where(_total.c.product_id.in_(matched)),
+            select(
+                func.count().label("rows"), func.coalesce(func.sum(_delta.c.id), 0).label("ids")
+            ).where(_delta.c.product_id.in_(matched)),
+        ]
+    subqueries = [q.subquery(f"v{n}") for n, q in enumerate(parts)]
+    source = subqueries[0]
+    for sq in subqueries[1:]:
+        source = source.join(sq, true())
+    return select(*(c for sq in subqueries for c in sq.c)).select_from(source)
+
+
+def product_levels(product_ids: Sequence) -> Select:
+    """Все локации товаров вместе с SKU; товар без строк остатка даёт одну строку с NULL."""
+    levels = stock_levels().where(_any(_item.c.product_id, "level_product_ids", product_ids))
+    levels = levels.subquery("levels")
+    return (
+        select(
+            _product.c.id.label("product_id"),
+            _product.c.sku,
+            levels.c.location_id,
+            levels.c.on_hand,
+            levels.c.reserved,
+        )
+        .select_from(_product.outerjoin(levels, levels.c.product_id == _product.c.id))
+        .where(_any(_product.c.id, "product_ids", product_ids))
+        .order_by(_product.c.id, levels.c.location_id)
+    )
+
+
+def _key_rows(keys: Sequence[tuple]) -> TableValuedAlias:
+    # (product_id, location_id) pairs as unnest() of two array parameters, so the
+    # statement size does not grow with the number of keys (asyncpg caps it at 32767)
+    return (
+        func.unnest(
+            bindparam(
+                "key_product_ids", [k[0] for k in keys], type_=ARRAY(_item.c.product_id.type)
+            ),
+            bindparam(
+                "key_location_ids", [k[1] for k in keys], type_=ARRAY(_item.c.location_id.type)
+            ),
+        )
+        .table_valued(
+            column("product_id", _item.c.product_id.type),
+            column("location_id", _item.c.location_id.type),
+        )
+        .render_derived("keys")
+    )
+
+
+async def _lock_items(
+    session: AsyncSession, keys, *, lock: bool | None = None
+) -> dict[tuple, InventoryItem]:
+    """Create missing rows and lock all of them in canonical (product_id, location_id) order.
+
+    Every multi-row path locks through here, so two transactions touching the same
+    rows always acquire them in the same order and cannot deadlock each other.
+    Stock held in stripes is folded into the base row, so callers see full totals.
+
+    In optimistic mode (``lock`` defaults to the configured strategy) rows are read
+    without FOR UPDATE; the version check on flush then detects concurrent writers.
+    Rows are always refreshed from the database: a session reused across transactions
+    (the sweeper's) would otherwise get its stale identity-map copies back.
+    """
+    if lock is None:
+        lock = settings.INVENTORY_CONCURRENCY != "optimistic"
+    ordered = sorted({_key(product_id, location_id) for product_id, location_id in keys})
+    wanted = _key_rows(ordered)
+    stmt = insert(_item).from_select(
+        ["id", "product_id", "location_id", "on_hand", "reserved", "version"],
+        select(
+            func.gen_random_uuid(), wanted.c.product_id, wanted.c.location_id, 0, 0, 1
+        ).order_by(wanted.c.product_id, wanted.c.location_id),
+    ).on_conflict_do_nothing(index_elements=[_item.c.product_id, _item.c.location_id])
     await session.execute(stmt)
 
     q = (
         select(InventoryItem)
         .where(
-            InventoryItem.product_id == product_id,
-            InventoryItem.location_id == location_id,
+            tuple_(InventoryItem.product_id, InventoryItem.location_id).in_(
+                select(wanted.c.product_id, wanted.c.location_id)
+            )
         )
-        .with_for_update()
+        .order_by(InventoryItem.product_id, InventoryItem.location_id)
+        .options(raiseload("*"))
+        .execution_options(populate_existing=True)
     )
+    if lock:
+        q = q.with_for_update()
     res = await session.execute(q)
-    item = res.scalars().first()
-    if not item:
+    items = {(it.product_id, it.location_id): it for it in res.scalars()}
+    if len(items) != len(ordered):
         raise RuntimeError("Failed to fetch inventory item after upsert")
-    return item
 
+    q = (
+        select(InventoryStripe)
+        .where(
+            tuple_(InventoryStripe.product_id, InventoryStripe.location_id).in_(
+                select(wanted.c.product_id, wanted.c.location_id)
+            ),
+            (InventoryStripe.on_hand != 0) | (InventoryStripe.reserved != 0),
+        )
+        .order_by(InventoryStripe.product_id, InventoryStripe.location_id, InventoryStripe.stripe)
+        .execution_options(populate_existing=True)
+    )
+    if lock:
+        q = q.with_for_update()
+    stripes = await session.execute(q)
+    for stripe in stripes.scalars():
+        item = items[(stripe.product_id, stripe.location_id)]
+        item.on_hand = Decimal(item.on_hand) + Decimal(stripe.on_hand)
+        item.reserved = Decimal(item.reserved) + Decimal(stripe.reserved)
+        stripe.on_hand = Decimal("0")
+        stripe.reserved = Decimal("0")
+        stripe.version += 1
+    return items
+
+
+async def _run_cas(attempt: Callable[[], Awaitable[T]]) -> T:
+    """Run one transactional attempt, retrying it on version conflicts in optimistic mode.
+
+    Retries are bounded by INVENTORY_CAS_MAX_RETRIES and separated by full-jitter
+    exponential backoff, so colliding writers spread out instead of colliding again.
+    """
+    retries = (
+        settings.INVENTORY_CAS_MAX_RETRIES if settings.INVENTORY_CONCURRENCY == "optimistic" else 0
+    )
+    for n in range(retries + 1):
+        try:
+            return await attempt()
+        except StaleDataError:
+            cas_stats["conflicts"] += 1
+            if n == retries:
+                break
+            cas_stats["retries"] += 1
+            backoff_ms = settings.INVENTORY_CAS_BACKOFF_MS * 2 ** n
+            await asyncio.sleep(random.uniform(0, backoff_ms) / 1000)
+    cas_stats["exhausted"] += 1
+    raise ConcurrencyConflictError(message="Concurrent update conflict, please retry")
+
+
+async def _ensure_and_lock_item(session: AsyncSession, product_id, location_id) -> InventoryItem:
+    # Create row if missing (idempotent), then select FOR UPDATE to avoid races
+    items = await _lock_items(session, [(product_id, location_id)])
+    return items[_key(product_id, location_id)]
+
+
+def _journal_cte(source: CTE, txn: dict) -> CTE:
+    # Python-side column defaults are not applied inside a CTE, so pass the id explicitly
+    values = {"id": InventoryTxn.uuid_factory(), **txn}
+    return (
+        insert(_txn)
+        .from_select(
+            list(values),
+            select(*(literal(v, _txn.c[k].type) for k, v in values.items())).select_from(source),
+        )
+        .cte("journal")
+    )
+
+
+async def _guarded_update(
+    session: AsyncSession,
+    *,
+    product_id,
+    location_id,
+    guard: ColumnElement[bool],
+    txn: dict,
+    on_hand_delta: Decimal = Decimal("0"),
+    reserved_delta: Decimal = Decimal("0"),
+) -> Row | None:
+    """Fast path: apply the change and write the journal row in one statement.
+
+    The UPDATE only matches when ``guard`` holds, so the row lock is held for the
+    duration of a single statement. Returns ``None`` when the row is missing or the
+    guard failed; callers then fall back to the locking path, which creates the row
+    and reports the precise error.
+    """
+    upd = (
+        update(_item)
+        .where(_item.c.product_id == product_id, _item.c.location_id == location_id, guard)
+        .values(
+            on_hand=_item.c.on_hand + on_hand_delta,
+            reserved=_item.c.reserved + reserved_delta,
+            version=_item.c.version + 1,
+        )
+        .returning(
+            _item.c.product_id,
+            _item.c.location_id,
+            _item.c.on_hand,
+            _item.c.reserved,
+            _item.c.version,
+        )
+        .cte("upd")
+    )
+    stmt = select(upd)
+    if settings.INVENTORY_STRIPING_ENABLED:
+        # report full totals: this statement does not touch the stripes
+        stripes = _stripe_totals()
+        stmt = select(
+            upd.c.product_id,
+            upd.c.location_id,
+            (upd.c.on_hand + func.coalesce(stripes.c.on_hand, 0)).label("on_hand"),
+            (upd.c.reserved + func.coalesce(stripes.c.reserved, 0)).label("reserved"),
+            upd.c.version,
+        ).select_from(
+            upd.outerjoin(
+                stripes,
+                and_(
+                    stripes.c.product_id == upd.c.product_id,
+                    stripes.c.location_id == upd.c.location_id,
+                ),
+            )
+        )
+    res = await session.execute(stmt.add_cte(_journal_cte(upd, txn)))
+    return res.first()
+
+
+async def _guarded_stripe_update(
+    session: AsyncSession,
+    *,
+    product_id,
+    location_id,
+    guard: ColumnElement[bool],
+    txn: dict,
+    on_hand_delta: Decimal = Decimal("0"),
+    reserved_delta: Decimal = Decimal("0"),
+) -> Row | None:
+    """Striped fast path: apply the change to one random stripe satisfying ``guard``.
+
+    Stripes locked by concurrent transactions are skipped rather than waited for.
+    Returns ``None`` for non-striped items or when no free stripe qualifies.
+    """
+    pick = (
+        select(_stripe.c.id)
+        .where(_stripe.c.product_id == product_id, _stripe.c.location_id == location_id, guard)
+        .order_by(func.random())
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .cte("pick")
+    )
+    upd = (
+        update(_stripe)
+        .where(_stripe.c.id == pick.c.id)
+        .values(
+            on_hand=_stripe.c.on_hand + on_hand_delta,
+            reserved=_stripe.c.reserved + reserved_delta,
+            version=_stripe.c.version + 1,
+        )
+        .returning(_stripe.c.product_id, _stripe.c.location_id, _stripe.c.version)
+        .cte("upd")
+    )
+    # totals are read from the statement snapshot, i.e. before this change
+    levels = stock_levels().where(
+        _item.c.product_id == product_id, _item.c.location_id == location_id
+    ).subquery("levels")
+    stmt = select(
+        upd.c.product_id,
+        upd.c.location_id,
+        (levels.c.on_hand + on_hand_delta).label("on_hand"),
+        (levels.c.reserved + reserved_delta).label("reserved"),
+        upd.c.version,
+    ).select_from(upd.join(levels, true()))
+    res = await session.execute(stmt.add_cte(_journal_cte(upd, txn)))
+    return res.first()
+
+
+async def _fast_path(
+    session: AsyncSession,
+    *,
+    product_id,
+    location_id,
+    guard: Callable[[Table], ColumnElement[bool]],
+    txn: dict,
+    on_hand_delta: Decimal = Decimal("0"),
+    reserved_delta: Decimal = Decimal("0"),
+) -> Row | None:
+    kwargs = dict(
+        product_id=product_id,
+        location_id=location_id,
+        txn=txn,
+        on_hand_delta=on_hand_delta,
+        reserved_delta=reserved_delta,
+    )
+    if settings.INVENTORY_STRIPING_ENABLED:
+        row = await _guarded_stripe_update(session, guard=guard(_stripe), **kwargs)
+        if row is not None:
+            return row
+    return await _guarded_update(session, guard=guard(_item), **kwargs)
+
+
+# ── reservation ledger ───────────────────────────────────────────────────────
+# Reservations made with a reference or a TTL are recorded in inventory_reservation,
+# so a whole order can be settled by reference and the sweeper can hand expired ones
+# back. Ledger rows are always locked before item rows, which keeps every path's
+# lock order compatible.
+
+def _check_ttl(reference: str | None, ttl_seconds: int | None) -> None:
+    # release/ship only consume ledger rows by reference; an expiring row without one
+    # would outlive the stock it stood for and be released a second time by the sweeper
+    if ttl_seconds is not None and reference is None:
+        raise ValueError("ttl_seconds requires a reference")
+
+
+def _record_reservation(
+    session: AsyncSession, product_id, location_id, qty: Decimal, reference: str | None,
+    ttl_seconds: int | None,
+) -> None:
+    _check_ttl(reference, ttl_seconds)
+    if reference is None:
+        return
+    session.add(
+        InventoryReservation(
+            product_id=product_id,
+            location_id=location_id,
+            reference=reference,
+            qty=qty,
+            expires_at=func.now() + timedelta(seconds=ttl_seconds) if ttl_seconds else None,
+        )
+    )
+
+
+async def _consume_reservations(
+    session: AsyncSession, product_id, location_id, reference: str | None, qty: Decimal
+) -> Decimal:
+    """Take ``qty`` off the ledger rows of ``reference``, soonest-expiring first.
+
+    Called before the item row is touched. Quantities beyond what the ledger holds
+    belong to reservations made without a reference and are simply not tracked here.
+
+    Without a reference nothing is consumed: the item's ledger rows are locked and the
+    total of the expiring ones is returned. The sweeper will still release that much
+    of ``reserved``, so the call may only touch the rest (see _check_untracked).
+    """
+    q = (
+        select(InventoryReservation)
+        .where(
+            InventoryReservation.product_id == product_id,
+            InventoryReservation.location_id == location_id,
+        )
+        .order_by(
+            InventoryReservation.expires_at.nulls_last(),
+            InventoryReservation.created_at,
+            InventoryReservation.id,
+        )
+        .with_for_update()
+    )
+    if reference is None:
+        res = await session.execute(q)
+        return sum(
+            (Decimal(row.qty) for row in res.scalars() if row.expires_at is not None),
+            Decimal("0"),
+        )
+
+    res = await session.execute(q.where(InventoryReservation.reference == reference))
+    remaining = Decimal(qty)
+    for row in res.scalars():
+        if remaining <= 0:
+            break
+        if Decimal(row.qty) <= remaining:
+            remaining -= Decimal(row.qty)
+            await session.delete(row)
+        else:
+            row.qty = Decimal(row.qty) - remaining
+            remaining = Decimal("0")
+    return Decimal("0")
+
+
+async def _ledger_held(session: AsyncSession, keys) -> dict[tuple, Decimal]:
+    """Expiring ledger quantity per (product_id, location_id), pending changes included."""
+    wanted = _key_rows(sorted({_key(product_id, location_id) for product_id, location_id in keys}))
+    res = await session.execute(
+        select(
+            InventoryReservation.product_id,
+            InventoryReservation.location_id,
+            func.sum(InventoryReservation.qty),
+        )
+        .where(
+            tuple_(InventoryReservation.product_id, InventoryReservation.location_id).in_(
+                select(wanted.c.product_id, wanted.c.location_id)
+            ),
+            InventoryReservation.expires_at.is_not(None),
+        )
+        .group_by(InventoryReservation.product_id, InventoryReservation.location_id)
+    )
+    return {(p, loc): Decimal(held) for p, loc, held in res}
+
+
+def _check_untracked(item: InventoryItem, held: Decimal) -> None:
+    if Decimal(item.reserved) < held:
+        raise ValueError("Reservations with a TTL can only be released by their reference")
+
+
+# ── per-operation rules ──────────────────────────────────────────────────────
+# Each operation is split into a journal-row builder and an applier that validates
+# and mutates an already locked item, so single calls and batches share the logic.
+
+def _adjust_txn(product_id, location_id, delta: Decimal, reason: str | None) -> dict:
+    return dict(
+        product_id=product_id,
+        from_location_id=location_id if delta < 0 else None,
+        to_location_id=location_id if delta > 0 else None,
+        qty=abs(delta),
+        txn_type=InventoryTxnType.ADJUSTMENT,
+        reason=reason,
+    )
+
+
+def _apply_adjust(item: InventoryItem, delta: Decimal) -> None:
+    new_on_hand = Decimal(item.on_hand) + Decimal(delta)
+    if new_on_hand < Decimal("0"):
+        raise ValueError("Adjustment would result in negative on-hand")
+    item.on_hand = new_on_hand
+    item.version += 1
+
+
+def _move_txn(
+    product_id, from_location_id, to_location_id, qty: Decimal, reason: str | None
+) -> dict:
+    return dict(
+        product_id=product_id,
+        from_location_id=from_location_id,
+        to_location_id=to_location_id,
+        qty=qty,
+        txn_type=InventoryTxnType.TRANSFER,
+        reason=reason,
+    )
+
+
+def _apply_move(src: InventoryItem, dst: InventoryItem, qty: Decimal) -> None:
+    available = Decimal(src.on_hand) - Decimal(src.reserved)
+    if qty > available:
+        raise ValueError("Not enough available stock to move")
+    src.on_hand = Decimal(src.on_hand) - qty
+    dst.on_hand = Decimal(dst.on_hand) + qty
+    src.version += 1
+    dst.version += 1
+
+
+def _reserve_txn(product_id, location_id, qty: Decimal, reference: str | None) -> dict:
+    return dict(
+        product_id=product_id,
+        from_location_id=location_id,
+        to_location_id=None,
+        qty=qty,
+        txn_type=InventoryTxnType.RESERVE,
+        reference=reference,
+    )
+
+
+def _apply_reserve(item: InventoryItem, qty: Decimal) -> None:
+    available = Decimal(item.on_hand) - Decimal(item.reserved)
+    if qty > available:
+        raise ValueError("Not enough available to reserve")
+    item.reserved = Decimal(item.reserved) + qty
+    item.version += 1
+
+
+def _release_txn(product_id, location_id, qty: Decimal, reference: str | None) -> dict:
+    return dict(
+        product_id=product_id,
+        from_location_id=None,
+        to_location_id=location_id,
+        qty=qty,
+        txn_type=InventoryTxnType.RELEASE,
+        reference=reference,
+    )
+
+
+def _apply_release(item: InventoryItem, qty: Decimal) -> None:
+    if qty > Decimal(item.reserved):
+        raise ValueError("Cannot release more than reserved")
+    item.reserved = Decimal(item.reserved) - qty
+    item.version += 1
+
+
+def _ship_txn(product_id, location_id, qty: Decimal, reference: str | None) -> dict:
+    return dict(
+        product_id=product_id,
+        from_location_id=location_id,
+        to_location_id=None,
+        qty=qty,
+        txn_type=InventoryTxnType.OUT,
+        reference=reference,
+    )
+
+
+def _apply_ship(item: InventoryItem, qty: Decimal) -> None:
+    # Decrease both reserved and on_hand
+    if qty > Decimal(item.reserved):
+        raise ValueError("Not enough reserved to ship")
+    if qty > Decimal(item.on_hand):
+        raise ValueError("Inconsistent state: reserved exceeds on_hand")
+    item.reserved = Decimal(item.reserved) - qty
+    item.on_hand = Decimal(item.on_hand) - qty
+    item.version += 1
+
+
+# ── public API ───────────────────────────────────────────────────────────────
 
 async def adjust_stock(
     session: AsyncSession,
@@ -38,25 +743,43 @@ async def adjust_stock(
     location_id,
     delta: Decimal,
     reason: str | None
-) -> InventoryItem:
-    async with session.begin():
-        item = await _ensure_and_lock_item(session, product_id, location_id)
-        new_on_hand = Decimal(item.on_hand) + Decimal(delta)
-        if new_on_hand < Decimal("0"):
-            raise ValueError("Adjustment would result in negative on-hand")
-        item.on_hand = new_on_hand
-        item.version += 1
-        txn = InventoryTxn(
-            product_id=product_id,
-            from_location_id=None,
-            to_location_id=location_id if delta > 0 else None,
-            qty=abs(delta),
-            txn_type=InventoryTxnType.ADJUSTMENT,
-            reason=reason,
-        )
-        session.add(txn)
-        await session.flush()
-        return item
+) -> InventoryItem | Row:
+    txn = _adjust_txn(product_id, location_id, delta, reason)
+
+    async def attempt():
+        async with session.begin():
+            row = await _fast_path(
+                session,
+                product_id=product_id,
+                location_id=location_id,
+                guard=lambda t: t.c.on_hand + delta >= 0,
+                txn=txn,
+                on_hand_delta=delta,
+            )
+            if row is not None:
+                return row
+            item = await _ensure_and_lock_item(session, product_id, location_id)
+            _apply_adjust(item, delta)
+            session.add(InventoryTxn(**txn))
+            await session.flush()
+            return item
+
+    return await _run_cas(attempt)
+
+
+async def adjust_many(
+    session: AsyncSession, adjustments: Sequence[tuple[object, object, Decimal, str | None]]
+) -> dict[tuple, InventoryItem]:
+    """Apply (product, location, delta, reason) adjustments inside the caller's transaction.
+
+    Unlike the single-item functions this does not open a transaction itself, so it
+    can be combined atomically with other writes (e.g. receiving a purchase order).
+    """
+    items = await _lock_items(session, [(p, loc) for p, loc, _, _ in adjustments])
+    for product_id, location_id, delta, reason in adjustments:
+        _apply_adjust(items[_key(product_id, location_id)], delta)
+        session.add(InventoryTxn(**_adjust_txn(product_id, location_id, delta, reason)))
+    return items
 
 
 async def move_stock(
@@ -70,26 +793,22 @@ async def move_stock(
 ) -> None:
     if from_location_id == to_location_id:
         raise ValueError("from and to locations must be different")
-    async with session.begin():
-        src = await _ensure_and_lock_item(session, product_id, from_location_id)
-        dst = await _ensure_and_lock_item(session, product_id, to_location_id)
-        available = Decimal(src.on_hand) - Decimal(src.reserved)
-        if qty > available:
-            raise ValueError("Not enough available stock to move")
-        src.on_hand = Decimal(src.on_hand) - qty
-        dst.on_hand = Decimal(dst.on_hand) + qty
-        src.version += 1
-        dst.version += 1
-        session.add(
-            InventoryTxn(
-                product_id=product_id,
-                from_location_id=from_location_id,
-                to_location_id=to_location_id,
-                qty=qty,
-                txn_type=InventoryTxnType.TRANSFER,
-                reason=reason,
+
+    async def attempt():
+        async with session.begin():
+            items = await _lock_items(
+                session, [(product_id, from_location_id), (product_id, to_location_id)]
             )
-        )
+            _apply_move(
+                items[_key(product_id, from_location_id)],
+                items[_key(product_id, to_location_id)],
+                qty,
+            )
+            session.add(
+                InventoryTxn(**_move_txn(product_id, from_location_id, to_location_id, qty, reason))
+            )
+
+    return await _run_cas(attempt)
 
 
 async def reserve_stock(
@@ -98,26 +817,31 @@ async def reserve_stock(
     product_id,
     location_id,
     qty: Decimal,
-    reference: str | None
-) -> InventoryItem:
-    async with session.begin():
-        item = await _ensure_and_lock_item(session, product_id, location_id)
-        available = Decimal(item.on_hand) - Decimal(item.reserved)
-        if qty > available:
-            raise ValueError("Not enough available to reserve")
-        item.reserved = Decimal(item.reserved) + qty
-        item.version += 1
-        session.add(
-            InventoryTxn(
+    reference: str | None,
+    ttl_seconds: int | None = None,
+) -> InventoryItem | Row:
+    """Reserve available stock; with ``ttl_seconds`` the reservation expires on its own."""
+    txn = _reserve_txn(product_id, location_id, qty, reference)
+
+    async def attempt():
+        async with session.begin():
+            _record_reservation(session, product_id, location_id, qty, reference, ttl_seconds)
+            row = await _fast_path(
+                session,
                 product_id=product_id,
-                from_location_id=location_id,
-                to_location_id=None,
-                qty=qty,
-                txn_type=InventoryTxnType.RESERVE,
-                reference=reference,
+                location_id=location_id,
+                guard=lambda t: t.c.on_hand - t.c.reserved >= qty,
+                txn=txn,
+                reserved_delta=qty,
             )
-        )
-        return item
+            if row is not None:
+                return row
+            item = await _ensure_and_lock_item(session, product_id, location_id)
+            _apply_reserve(item, qty)
+            session.add(InventoryTxn(**txn))
+            return item
+
+    return await _run_cas(attempt)
 
 
 async def release_reservation(
@@ -127,24 +851,31 @@ async def release_reservation(
     location_id,
     qty: Decimal,
     reference: str | None
-) -> InventoryItem:
-    async with session.begin():
-        item = await _ensure_and_lock_item(session, product_id, location_id)
-        if qty > Decimal(item.reserved):
-            raise ValueError("Cannot release more than reserved")
-        item.reserved = Decimal(item.reserved) - qty
-        item.version += 1
-        session.add(
-            InventoryTxn(
+) -> InventoryItem | Row:
+    txn = _release_txn(product_id, location_id, qty, reference)
+
+    async def attempt():
+        async with session.begin():
+            held = await _consume_reservations(
+                session, product_id, location_id, reference, qty
+            )
+            row = await _fast_path(
+                session,
                 product_id=product_id,
-                from_location_id=None,
-                to_location_id=location_id,
-                qty=qty,
-                txn_type=InventoryTxnType.RELEASE,
-                reference=reference,
+                location_id=location_id,
+                guard=lambda t: t.c.reserved - held >= qty,
+                txn=txn,
+                reserved_delta=-qty,
             )
-        )
-        return item
+            if row is not None:
+                return row
+            item = await _ensure_and_lock_item(session, product_id, location_id)
+            _apply_release(item, qty)
+            _check_untracked(item, held)
+            session.add(InventoryTxn(**txn))
+            return item
+
+    return await _run_cas(attempt)
 
 
 async def ship_reserved(
@@ -154,25 +885,149 @@ async def ship_reserved(
     location_id,
     qty: Decimal,
     reference: str | None
-) -> InventoryItem:
-    # Decrease both reserved and on_hand
-    async with session.begin():
-        item = await _ensure_and_lock_item(session, product_id, location_id)
-        if qty > Decimal(item.reserved):
-            raise ValueError("Not enough reserved to ship")
-        item.reserved = Decimal(item.reserved) - qty
-        if qty > Decimal(item.on_hand):
-            raise ValueError("Inconsistent state: reserved exceeds on_hand")
-        item.on_hand = Decimal(item.on_hand) - qty
-        item.version += 1
-        session.add(
-            InventoryTxn(
+) -> InventoryItem | Row:
+    txn = _ship_txn(product_id, location_id, qty, reference)
+
+    async def attempt():
+        async with session.begin():
+            held = await _consume_reservations(
+                session, product_id, location_id, reference, qty
+            )
+            row = await _fast_path(
+                session,
                 product_id=product_id,
-                from_location_id=location_id,
-                to_location_id=None,
-                qty=qty,
-                txn_type=InventoryTxnType.OUT,
-                reference=reference,
+                location_id=location_id,
+                guard=lambda t: (t.c.reserved - held >= qty) & (t.c.on_hand >= qty),
+                txn=txn,
+                on_hand_delta=-qty,
+                reserved_delta=-qty,
             )
+            if row is not None:
+                return row
+            item = await _ensure_and_lock_item(session, product_id, location_id)
+            _apply_ship(item, qty)
+            _check_untracked(item, held)
+            session.add(InventoryTxn(**txn))
+            return item
+
+    return await _run_cas(attempt)
+
+
+async def reserve_many(
+    session: AsyncSession,
+    *,
+    product_id,
+    location_id,
+    requests: Sequence[tuple[Decimal, str | None, int | None]],
+) -> list[InventoryItem | ValueError]:
+    """Apply several (qty, reference, ttl_seconds) reservations against one item under one lock.
+
+    Requests are evaluated in order and accepted or rejected individually; the outcome
+    list holds, per request, either a detached copy of the item after that reservation
+    or the ValueError that rejected it. Everything accepted commits together.
+    """
+
+    async def attempt():
+        outcomes: list[InventoryItem | ValueError] = []
+        async with session.begin():
+            item = await _ensure_and_lock_item(session, product_id, location_id)
+            for qty, reference, ttl_seconds in requests:
+                try:
+                    _check_ttl(reference, ttl_seconds)
+                    _apply_reserve(item, qty)
+                except ValueError as e:
+                    outcomes.append(e)
+                    continue
+                _record_reservation(session, product_id, location_id, qty, reference, ttl_seconds)
+                txn = _reserve_txn(product_id, location_id, qty, reference)
+                session.add(InventoryTxn(**txn))
+                outcomes.append(
+                    InventoryItem(
+                        product_id=item.product_id,
+                        location_id=item.location_id,
+                        on_hand=item.on_hand,
+                        reserved=item.reserved,
+                        version=item.version,
+                    )
+                )
+        return outcomes
+
+    return await _run_cas(attempt)
+
+
+def _batch_keys(op) -> list[tuple]:
+    if op.op == "move":
+        return [(op.product_id, op.from_location_id), (op.product_id, op.to_location_id)]
+    return [(op.product_id, op.location_id)]
+
+
+def _apply_batch_op(session: AsyncSession, items: dict[tuple, InventoryItem], op) -> dict:
+    if op.op == "move":
+        if op.from_location_id == op.to_location_id:
+            raise ValueError("from and to locations must be different")
+        _apply_move(
+            items[_key(op.product_id, op.from_location_id)],
+            items[_key(op.product_id, op.to_location_id)],
+            op.qty,
+        )
+        return _move_txn(op.product_id, op.from_location_id, op.to_location_id, op.qty, op.reason)
+
+    item = items[_key(op.product_id, op.location_id)]
+    if op.op == "adjust":
+        _apply_adjust(item, op.delta)
+        return _adjust_txn(op.product_id, op.location_id, op.delta, op.reason)
+    if op.op == "reserve":
+        _apply_reserve(item, op.qty)
+        _record_reservation(
+            session, op.product_id, op.location_id, op.qty, op.reference, op.ttl_seconds
         )
-        return item
+        return _reserve_txn(op.product_id, op.location_id, op.qty, op.reference)
+    if op.op == "release":
+        _apply_release(item, op.qty)
+        return _release_txn(op.product_id, op.location_id, op.qty, op.reference)
+    if op.op == "ship":
+        _apply_ship(item, op.qty)
+        return _ship_txn(op.product_id, op.location_id, op.qty, op.reference)
+    raise ValueError(f"Unknown operation {op.op!r}")
+
+
+async def apply_batch(
+    session: AsyncSession, operations: Sequence[BatchOperation]
+) -> list[InventoryItem]:
+    """Apply mixed operations all-or-nothing in one transaction.
+
+    All touched rows are locked up front in canonical order, then the operations are
+    applied sequentially, so later operations see the effect of earlier ones.
+    """
+    keys = [k for op in operations for k in _batch_keys(op)]
+    # ledger rows go first, in a stable order, to keep the ledger -> item lock order;
+    # an item's rows are all locked before a reference's if any op comes without one
+    consumed = sorted(
+        (
+            (*_key(op.product_id, op.location_id), op.reference, op.qty)
+            for op in operations
+            if op.op in ("release", "ship")
+        ),
+        key=lambda c: (c[0], c[1], c[2] is not None, c[2] or ""),
+    )
+    untracked = {(c[0], c[1]) for c in consumed if c[2] is None}
+
+    async def attempt():
+        async with session.begin():
+            for product_id, location_id, reference, qty in consumed:
+                await _consume_reservations(session, product_id, location_id, reference, qty)
+            items = await _lock_items(session, keys)
+            for n, op in enumerate(operations, start=1):
+                try:
+                    txn = _apply_batch_op(session, items, op)
+                except ValueError as e:
+                    raise ValueError(f"Operation #{n} ({op.op}): {e}") from e
+                session.add(InventoryTxn(**txn))
+            if untracked:
+                held = await _ledger_held(session, untracked)
+                for key in untracked:
+                    _check_untracked(items[key], held.get(key, Decimal("0")))
+            await session.flush()
+            return list(items.values())
+
+    return await _run_cas(attempt)
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import logging
+import re
+from datetime import datetime, timezone
+from typing import Literal, NamedTuple, Sequence
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.db.session import AsyncSessionMaker
+from app.models import InventoryCheckpoint, InventoryHistoryStart
+
+logger = logging.getLogger(__name__)
+
+PARENT = "inventory_txn"
+
+# partition DDL needs a short exclusive lock on the journal; rather fail and retry on the
+# next pass than queue every writer behind a long-running transaction
+_LOCK_TIMEOUT = "5s"
+_MAINTENANCE_LOCK = 0x1C4EC6F1
+
+_BOUND = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+_FAR_PAST = datetime.min.replace(tzinfo=timezone.utc)
+
+
+class Partition(NamedTuple):
+    name: str
+    lower: datetime | None  # None: MINVALUE (or the DEFAULT partition)
+    upper: datetime | None  # None: MAXVALUE (or the DEFAULT partition)
+    default: bool = False
+
+
+def _parse_bound(value: str) -> datetime | None:
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
+def _month_start(moment: datetime) -> datetime:
+    moment = moment.astimezone(timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def _add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT}_p{month:%Y_%m}"
+
+
+async def list_partitions(session: AsyncSession) -> list[Partition]:
+    res = await session.execute(
+        text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:parent AS regclass)"
+        ),
+        {"parent": PARENT},
+    )
+    partitions = []
+    for name, bound in res:
+        match = _BOUND.search(bound)
+        if match is None:
+            partitions.append(Partition(name, None, None, default=True))
+        else:
+            partitions.append(Partition(name, *map(_parse_bound, match.groups())))
+    return sorted(partitions, key=lambda p: (p.default, p.lower or _FAR_PAST))
+
+
+def missing_months(
+    partitions: Sequence[Partition], now: datetime, months_ahead: int
+) -> list[datetime]:
+    """Month starts from the current month on that no range partition covers yet."""
+    months = []
+    month = _month_start(now)
+    for _ in range(months_ahead + 1):
+        end = _add_months(month, 1)
+        covered = any(
+            not p.default
+            and (p.lower is None or p.lower < end)
+            and (p.upper is None or p.upper > month)
+            for p in partitions
+        )
+        if not covered:
+            months.append(month)
+        month = end
+    return months
+
+
+def expired_partitions(
+    partitions: Sequence[Partition],
+    now: datetime,
+    retention_months: int,
+    last_checkpoint: datetime | None,
+) -> list[Partition]:
+    """Partitions entirely older than the retention window.
+
+    Only rows already folded into a balance checkpoint may go: the next checkpoint
+    must never need them. Without any checkpoint nothing expires.
+    """
+    if retention_months <= 0 or last_checkpoint is None:
+        return []
+    cutoff = min(_add_months(_month_start(now), -retention_months), last_checkpoint)
+    return [p for p in partitions if p.upper is not None and p.upper <= cutoff]
+
+
+async def advance_history_start(
+    session: AsyncSession, removed: Sequence[Partition], last_checkpoint: datetime
+) -> datetime:
+    """Move the as-of horizon past journal partitions that are being removed.
+
+    An as-of answer replays the journal after the nearest checkpoint, so it is only
+    complete from the first checkpoint at or after the oldest journal row still kept;
+    earlier moments are rejected from now on. Returns the new start.
+    """
+    kept_from = max(p.upper for p in removed)
+    starts_at = await session.scalar(
+        select(func.min(InventoryCheckpoint.taken_at)).where(
+            InventoryCheckpoint.taken_at >= kept_from
+        )
+    )
+    # checkpoint rows of deleted products are gone; the latest one still bounds it
+    starts_at = starts_at or last_checkpoint
+    await session.execute(
+        insert(InventoryHistoryStart).values(starts_at=starts_at).on_conflict_do_nothing()
+    )
+    return starts_at
+
+
+async def ensure_partitions(
+    session_factory: async_sessionmaker[AsyncSession] = AsyncSessionMaker,
+    *,
+    months_ahead: int | None = None,
+) -> list[str]:
+    """Create monthly journal partitions up to ``months_ahead`` months from now.
+
+    Months already covered (e.g. by the pre-partitioning table) are skipped. Rows
+    that landed in the DEFAULT partition for a month block creating it; that is
+    logged and has to be resolved by hand. Returns the names created.
+    """
+    if months_ahead is None:
+        months_ahead = settings.INVENTORY_TXN_PARTITION_MONTHS_AHEAD
+    async with session_factory() as session:
+        async with session.begin():
+            await session.execute(select(func.pg_advisory_xact_lock(_MAINTENANCE_LOCK)))
+            await session.execute(text(f"SET LOCAL lock_timeout = '{_LOCK_TIMEOUT}'"))
+            now = await session.scalar(select(func.now()))
+            partitions = await list_partitions(session)
+            default = next((p.name for p in partitions if p.default), None)
+            if default is not None:
+                stray = await session.scalar(text(f"SELECT count(*) FROM {default}"))
+                if stray:
+                    logger.warning(
+                        "%s journal rows are in %s; move them to a month partition",
+                        stray,
+                        default,
+                    )
+            created = []
+            for month in missing_months(partitions, now, months_ahead):
+                name, end = partition_name(month), _add_months(month, 1)
+                await session.execute(
+                    text(
+                        f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES "
+                        f"FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+                    )
+                )
+                created.append(name)
+    return created
+
+
+async def apply_retention(
+    session_factory: async_sessionmaker[AsyncSession] = AsyncSessionMaker,
+    *,
+    retention_months: int | None = None,
+    action: Literal["detach", "drop"] | None = None,
+    dry_run: bool = False,
+) -> list[str]:
+    """Detach (or drop) journal partitions older than the retention window.
+
+    A detached partition stays as a standalone table to archive (pg_dump) and drop
+    later; no rows are deleted one by one. As-of queries before the first checkpoint
+    after the removed months are rejected from then on. Returns the affected names.
+    """
+    if retention_months is None:
+        retention_months = settings.INVENTORY_TXN_RETENTION_MONTHS
+    if action is None:
+        action = settings.INVENTORY_TXN_RETENTION_ACTION
+    async with session_factory() as session:
+        async with session.begin():
+            await session.execute(select(func.pg_advisory_xact_lock(_MAINTENANCE_LOCK)))
+            await session.execute(text(f"SET LOCAL lock_timeout = '{_LOCK_TIMEOUT}'"))
+            now = await session.scalar(select(func.now()))
+            last_checkpoint = await session.scalar(select(func.max(InventoryCheckpoint.taken_at)))
+            expired = expired_partitions(
+                await list_partitions(session), now, retention_months, last_checkpoint
+            )
+            if dry_run or not expired:
+                return [p.name for p in expired]
+            await advance_history_start(session, expired, last_checkpoint)
+            for p in expired:
+                await session.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {p.name}"))
+                if action == "drop":
+                    await session.execute(text(f"DROP TABLE {p.name}"))
+    return [p.name for p in expired]
+
+
+async def maintain_journal(
+    session_factory: async_sessionmaker[AsyncSession] = AsyncSessionMaker,
+) -> None:
+    """Periodic pass: partitions ahead first, then the retention policy."""
+    created = await ensure_partitions(session_factory)
+    if created:
+        logger.info("Created journal partitions: %s", ", ".join(created))
+    removed = await apply_retention(session_factory)
+    if removed:
+        logger.info(
+            "Journal partitions past retention (%s): %s",
+            settings.INVENTORY_TXN_RETENTION_ACTION,
+            ", ".join(removed),
+        )
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+from typing import BinaryIO, Iterator, Literal, NamedTuple
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    Table,
+    Text,
+    func,
+    literal,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import distinct_on, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models import Product
+from app.services.csv_stream import (
+    OnBatch,
+    ParsedBatch,
+    header_index,
+    open_csv,
+    pick,
+    stage_batches,
+)
+
+_product = Product.__table__
+
+ImportMode = Literal["insert", "upsert"]
+
+# accepted header names per field, first non-blank wins (English and Russian exports)
+HEADERS = {
+    "sku": ("sku", "SKU", "артикул", "Артикул", "код", "Код", "Код товара"),
+    "name": ("name", "Name", "наименование", "Наименование", "Название", "Товар"),
+    "unit": ("unit", "Unit", "ед", "Ед", "единица", "ед. изм.", "шт"),
+    "description": ("description", "Description", "описание", "Описание"),
+}
+DEFAULT_UNIT = "pcs"
+
+_LIMITS = {field: _product.c[field].type.length for field in ("sku", "name", "unit")}
+
+# per-transaction scratch table the parsed rows are COPYed into
+stage = Table(
+    "product_import_stage",
+    MetaData(),
+    Column("line", Integer, nullable=False),
+    Column("sku", Text, nullable=False),
+    Column("name", Text, nullable=False),
+    # blank = not given: DEFAULT_UNIT / NULL for a new SKU, kept as is on upsert
+    Column("unit", Text),
+    Column("description", Text),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+
+
+def _validate(sku: str, name: str, unit: str, description: str) -> str | None:
+    if not sku or not name:
+        return "sku and name are required"
+    for field, value in (("sku", sku), ("name", name), ("unit", unit)):
+        if len(value) > _LIMITS[field]:
+            return f"{field} is longer than {_LIMITS[field]} characters"
+    if "\x00" in sku + name + unit + description:
+        return "NUL character in a value"
+    return None
+
+
+def iter_batches(
+    binary: BinaryIO, encoding: str | None = None, batch_size: int | None = None
+) -> Iterator[ParsedBatch]:
+    """Parse a product CSV into batches of valid rows plus the invalid ones.
+
+    Blocking (file reads, decoding, csv): meant to be advanced off the event loop.
+    Raises ValueError for files that cannot be read as CSV at all.
+    """
+    if batch_size is None:
+        batch_size = settings.PRODUCT_IMPORT_BATCH_ROWS
+    with open_csv(binary, encoding) as reader:
+        header = next(reader, None)
+        if header is None:
+            return
+        columns = header_index(header, HEADERS)
+        if not columns["sku"] or not columns["name"]:
+            raise ValueError("CSV header must contain sku and name columns")
+        rows: list[tuple] = []
+        errors: list[tuple[int, str]] = []
+        line = reader.line_num
+        for record in reader:
+            line = reader.line_num
+            if not any(value.strip() for value in record):
+                continue
+            sku, name, unit, description = (pick(record, columns[f]) for f in HEADERS)
+            error = _validate(sku, name, unit, description)
+            if error is not None:
+                errors.append((line, error))
+                continue
+            rows.append((line, sku, name, unit or None, description or None))
+            if len(rows) >= batch_size:
+                yield ParsedBatch(rows, errors, line, binary.tell())
+                rows, errors = [], []
+        if rows or errors:
+            yield ParsedBatch(rows, errors, line, binary.tell())
+
+
+class ImportResult(NamedTuple):
+    staged: int
+    inserted: int
+    updated: int
+    invalid: int
+    errors: list[dict]
+
+    @property
+    def skipped(self) -> int:
+        """Valid rows that changed nothing: existing (or unchanged) SKUs, repeats in the file."""
+        return self.staged - self.inserted - self.updated
+
+    def as_dict(self) -> dict:
+        return {
+            "status": "ok",
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "invalid": self.invalid,
+            "errors": self.errors,
+        }
+
+
+def _latest_rows():
+    """One row per SKU from the stage: the last occurrence in the file wins."""
+    return (
+        select(stage.c.sku, stage.c.name, stage.c.unit, stage.c.description)
+        .ext(distinct_on(stage.c.sku))
+        .order_by(stage.c.sku, stage.c.line.desc())
+        .cte("latest")
+    )
+
+
+def merge_statement(mode: ImportMode = "insert"):
+    """Set-based merge of the stage into product; selects (inserted, updated) counts.
+
+    New SKUs are inserted with DEFAULT_UNIT for a blank unit. ``upsert`` also updates
+    existing SKUs in the same statement: a blank unit or description (or a column
+    missing from the file) keeps the current value, and a row is rewritten only when
+    something actually differs (IS DISTINCT FROM, NULL-safe), so unchanged rows
+    produce no new tuple, no WAL and keep their updated_at.
+    """
+    latest = _latest_rows()
+    inserted = (
+        insert(_product)
+        .from_select(
+            ["id", "sku", "name", "unit", "description"],
+            select(
+                func.gen_random_uuid(),
+                latest.c.sku,
+                latest.c.name,
+                func.coalesce(latest.c.unit, DEFAULT_UNIT),
+                latest.c.description,
+            ),
+            # server defaults: Python-side ones are not rendered inside a CTE
+            include_defaults=False,
+        )
+        # existing SKUs: left alone here, updated below in upsert mode
+        .on_conflict_do_nothing(index_elements=[_product.c.sku])
+        .returning(_product.c.id)
+        .cte("inserted")
+    )
+    counts = [select(func.count()).select_from(inserted).scalar_subquery()]
+    if mode == "upsert":
+        new = {
+            "name": latest.c.name,
+            "unit": func.coalesce(latest.c.unit, _product.c.unit),
+            "description": func.coalesce(latest.c.description, _product.c.description),
+        }
+        updated = (
+            update(_product)
+            .where(
+                _product.c.sku == latest.c.sku,
+                tuple_(*(_product.c[f] for f in new)).is_distinct_from(tuple_(*new.values())),
+            )
+            .values(**new, updated_at=func.now())
+            .returning(_product.c.id)
+            .cte("updated")
+        )
+        counts.append(select(func.count()).select_from(updated).scalar_subquery())
+    else:
+        counts.append(literal(0))
+    return select(*counts)
+
+
+async def import_products(
+    session: AsyncSession,
+    binary: BinaryIO,
+    *,
+    mode: ImportMode = "insert",
+    encoding: str | None = None,
+    batch_size: int | None = None,
+    on_batch: OnBatch | None = None,
+) -> ImportResult:
+    """Stream a product CSV through COPY into a stage table, then merge it in one statement.
+
+    ``insert`` adds new SKUs and leaves existing ones untouched; ``upsert`` also
+    updates existing SKUs whose content changed. Everything runs in one
+    transaction: a file that fails half-way imports nothing.
+    """
+    batches = iter_batches(binary, encoding, batch_size)
+    async with session.begin():
+        staged, invalid, errors = await stage_batches(session, stage, batches, on_batch)
+        res = await session.execute(merge_statement(mode))
+        inserted, updated = res.one()
+        return ImportResult(staged, inserted, updated, invalid, errors)
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from typing import Sequence
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
+
+from app.models import POStatus, PurchaseOrder, PurchaseOrderLine
+from app.schemas.purchase import PurchaseReceiveLine
+from app.services.inventory import _run_cas, adjust_many
+
+
+async def receive_purchase_order(
+    session: AsyncSession, po_id, lines: Sequence[PurchaseReceiveLine]
+) -> PurchaseOrder | None:
+    """Book received quantities and the matching stock in one transaction.
+
+    The PO row is locked first, so concurrent receipts of the same PO are applied
+    one after another and cannot both pass the remaining-qty check.
+    Returns None when the PO does not exist.
+    """
+
+    async def attempt():
+        async with session.begin():
+            res = await session.execute(
+                select(PurchaseOrder)
+                .where(PurchaseOrder.id == po_id)
+                .options(raiseload("*"))
+                .with_for_update()
+            )
+            po = res.scalars().first()
+            if po is None:
+                return None
+            if po.status in (POStatus.CANCELLED, POStatus.RECEIVED):
+                raise ValueError("PO closed")
+
+            res = await session.execute(
+                select(PurchaseOrderLine)
+                .where(PurchaseOrderLine.purchase_order_id == po.id)
+                .options(raiseload("*"))
+            )
+            po_lines = {line.id: line for line in res.scalars()}
+            adjustments = []
+            for line_in in lines:
+                line = po_lines.get(line_in.line_id)
+                if line is None:
+                    raise ValueError(f"Line {line_in.line_id} invalid")
+                remaining = line.qty_ordered - line.qty_received
+                if line_in.qty > remaining:
+                    raise ValueError("Receive qty exceeds remaining")
+                line.qty_received += line_in.qty
+                adjustments.append(
+                    (line.product_id, line_in.location_id, line_in.qty, f"PO {po.id}")
+                )
+            await adjust_many(session, adjustments)
+
+            if all(line.qty_received >= line.qty_ordered for line in po_lines.values()):
+                po.status = POStatus.RECEIVED
+            return po
+
+    return await _run_cas(attempt)
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from decimal import Decimal
+from typing import Literal
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.db.session import AsyncSessionMaker
+from app.models import InventoryItem, InventoryReservation, InventoryTxn
+from app.services.inventory import (
+    _apply_release,
+    _apply_ship,
+    _key,
+    _lock_items,
+    _release_txn,
+    _run_cas,
+    _ship_txn,
+)
+
+_res = InventoryReservation.__table__
+
+
+async def expire_batch(session: AsyncSession, limit: int) -> int:
+    """Release up to ``limit`` expired reservations in one short transaction.
+
+    Rows are claimed through the partial expires_at index with SKIP LOCKED, so two
+    sweepers (or a release of the same reference) never wait on each other's rows.
+    Returns the number of ledger rows claimed.
+    """
+    async with session.begin():
+        # MATERIALIZED: as an IN subquery the LIMIT could be rerun per row and claim more
+        claim = (
+            select(_res.c.id)
+            .where(_res.c.expires_at.is_not(None), _res.c.expires_at <= func.now())
+            .order_by(_res.c.expires_at, _res.c.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .cte("claim")
+            .prefix_with("MATERIALIZED")
+        )
+        res = await session.execute(
+            delete(_res)
+            .where(_res.c.id == claim.c.id)
+            .returning(_res.c.product_id, _res.c.location_id, _res.c.reference, _res.c.qty)
+        )
+        expired = res.all()
+        if not expired:
+            return 0
+        items = await _lock_items(
+            session, [(r.product_id, r.location_id) for r in expired], lock=True
+        )
+        for r in expired:
+            item = items[_key(r.product_id, r.location_id)]
+            # never release more than is still held, e.g. after a release without reference
+            qty = min(Decimal(r.qty), Decimal(item.reserved))
+            if qty <= 0:
+                continue
+            _apply_release(item, qty)
+            txn = _release_txn(r.product_id, r.location_id, qty, r.reference)
+            session.add(InventoryTxn(**txn, reason="reservation expired"))
+        return len(expired)
+
+
+async def expire_reservations(
+    session_factory: async_sessionmaker[AsyncSession] = AsyncSessionMaker,
+) -> int:
+    """One sweeper pass; returns the number of expired reservations released.
+
+    Work per pass is capped at RESERVATION_SWEEP_MAX_BATCHES batches of
+    RESERVATION_SWEEP_BATCH_SIZE rows; a backlog is worked off over several passes.
+    """
+    released = 0
+    async with session_factory() as session:
+        for _ in range(settings.RESERVATION_SWEEP_MAX_BATCHES):
+            n = await expire_batch(session, settings.RESERVATION_SWEEP_BATCH_SIZE)
+            released += n
+            if n < settings.RESERVATION_SWEEP_BATCH_SIZE:
+                break
+    return released
+
+
+async def _settle_reference(
+    session: AsyncSession, reference: str, action: Literal["release", "ship"]
+) -> list[InventoryItem]:
+    async def attempt():
+        async with session.begin():
+            res = await session.execute(
+                delete(_res)
+                .where(_res.c.reference == reference)
+                .returning(_res.c.product_id, _res.c.location_id, _res.c.qty)
+            )
+            held: dict[tuple, Decimal] = defaultdict(Decimal)
+            for r in res:
+                held[_key(r.product_id, r.location_id)] += Decimal(r.qty)
+            if not held:
+                return []
+            items = await _lock_items(session, held)
+            for (product_id, location_id), qty in held.items():
+                item = items[(product_id, location_id)]
+                if action == "ship":
+                    _apply_ship(item, qty)
+                    txn = _ship_txn(product_id, location_id, qty, reference)
+                else:
+                    # a line may have been released by hand already; release what is left
+                    qty = min(qty, Decimal(item.reserved))
+                    if qty <= 0:
+                        continue
+                    _apply_release(item, qty)
+                    txn = _release_txn(product_id, location_id, qty, reference)
+                session.add(InventoryTxn(**txn))
+            await session.flush()
+            return [items[k] for k in sorted(held)]
+
+    return await _run_cas(attempt)
+
+
+async def release_reference(session: AsyncSession, reference: str) -> list[InventoryItem]:
+    """Release everything still reserved under ``reference`` in one transaction.
+
+    Returns the affected items; an empty list means nothing is held for it.
+    """
+    return await _settle_reference(session, reference, "release")
+
+
+async def ship_reference(session: AsyncSession, reference: str) -> list[InventoryItem]:
+    """Ship everything reserved under ``reference``, all-or-nothing."""
+    return await _settle_reference(session, reference, "ship")
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from decimal import Decimal
+from typing import NamedTuple, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.db.session import engine as default_engine
+from app.services.inventory import product_levels
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "inventory_changed"
+
+
+class ProductLevels(NamedTuple):
+    sku: str
+    # (location_id, on_hand, reserved) for every location holding a row
+    levels: tuple[tuple[uuid.UUID, Decimal, Decimal], ...]
+
+
+class StockCache:
+    """Per-product stock levels kept in process memory.
+
+    Entries are dropped by NOTIFY events that the inventory tables' triggers send
+    on every change, so all worker processes stay coherent; the TTL is only a safety
+    net. The cache serves reads only while the LISTEN connection is up — without
+    it changes made elsewhere could go unnoticed.
+    """
+
+    # how many recent invalidations are remembered to reject racing fills
+    _RECENT = 10_000
+
+    def __init__(self, maxsize: int, ttl_seconds: float) -> None:
+        self._lru: LRUCache[ProductLevels] = LRUCache(maxsize, ttl_seconds)
+        self.active = False
+        self.invalidations = 0
+        self._generation = 0
+        self._recent: OrderedDict[uuid.UUID, int] = OrderedDict()
+        self._forgotten = 0
+
+    def invalidate(self, product_id: uuid.UUID) -> None:
+        self.invalidations += 1
+        self._generation += 1
+        self._lru.pop(product_id)
+        self._recent[product_id] = self._generation
+        self._recent.move_to_end(product_id)
+        if len(self._recent) > self._RECENT:
+            _, self._forgotten = self._recent.popitem(last=False)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._forgotten = self._generation
+        self._recent.clear()
+        self._lru.clear()
+
+    def _changed_since(self, product_id: uuid.UUID, generation: int) -> bool:
+        return self._forgotten > generation or self._recent.get(product_id, 0) > generation
+
+    async def get_many(
+        self, session: AsyncSession, product_ids: Sequence[uuid.UUID]
+    ) -> dict[uuid.UUID, ProductLevels]:
+        """Levels for the given products; unknown products are absent from the result.
+
+        Misses are loaded with one query. A loaded value is cached only if no
+        invalidation for that product arrived while the query was running.
+        """
+        found: dict[uuid.UUID, ProductLevels] = {}
+        missing = []
+        for pid in dict.fromkeys(product_ids):
+            value = self._lru.get(pid) if self.active else None
+            if value is None:
+                missing.append(pid)
+            else:
+                found[pid] = value
+        if not missing:
+            return found
+
+        generation = self._generation
+        res = await session.execute(product_levels(missing))
+        loaded: dict[uuid.UUID, tuple[str, list]] = {}
+        for product_id, sku, location_id, on_hand, reserved in res:
+            _, levels = loaded.setdefault(product_id, (sku, []))
+            if location_id is not None:
+                levels.append((location_id, on_hand, reserved))
+        for pid, (sku, levels) in loaded.items():
+            value = found[pid] = ProductLevels(sku, tuple(levels))
+            if self.active and not self._changed_since(pid, generation):
+                self._lru.set(pid, value)
+        return found
+
+    def stats(self) -> dict:
+        return {**self._lru.stats(), "active": self.active, "invalidations": self.invalidations}
+
+
+stock_cache = StockCache(settings.STOCK_CACHE_SIZE, settings.STOCK_CACHE_TTL_SECONDS)
+
+
+async def listen_for_changes(
+    engine: AsyncEngine = default_engine, cache: StockCache = stock_cache
+) -> None:
+    """Keep a LISTEN connection open and invalidate ``cache`` on every notification.
+
+    Runs until cancelled; a lost connection is re-established, and the cache is
+    cleared each time since notifications may have been missed meanwhile.
+    """
+
+    def on_notify(_conn, _pid, _channel, payload: str) -> None:
+        cache.invalidate(uuid.UUID(payload))
+
+    while True:
+        try:
+            async with engine.connect() as conn:
+                raw = (await conn.get_raw_connection()).driver_connection
+                closed = asyncio.Event()
+                raw.add_termination_listener(lambda _c: closed.set())
+                await raw.add_listener(CHANNEL, on_notify)
+                cache.clear()
+                cache.active = True
+                try:
+                    await closed.wait()
+                finally:
+                    cache.active = False
+                    if not raw.is_closed():
+                        await raw.remove_listener(CHANNEL, on_notify)
+            logger.warning("Stock cache listener connection lost, reconnecting")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Stock cache listener failed")
+        await asyncio.sleep(1)
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.core.config import settings
+from app.db.session import AsyncSessionMaker
+from app.models import ProductStockDelta, ProductStockTotal
+
+_total = ProductStockTotal.__table__
+_delta = ProductStockDelta.__table__
+
+
+async def compact_batch(session: AsyncSession, limit: int) -> int:
+    """Fold up to ``limit`` of the oldest deltas into product_stock_total.
+
+    One statement: the deltas are deleted and added to their totals atomically, so a
+    reader sees each change exactly once. SKIP LOCKED keeps several compactors apart;
+    totals are upserted in (product, slot) order, so they cannot deadlock either.
+    Returns the number of deltas folded.
+    """
+    claim = (
+        select(_delta.c.id)
+        .order_by(_delta.c.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    moved = (
+        delete(_delta)
+        .where(_delta.c.id.in_(claim.scalar_subquery()))
+        .returning(_delta.c.product_id, _delta.c.slot, _delta.c.on_hand, _delta.c.reserved)
+        .cte("moved")
+    )
+    on_hand = func.sum(moved.c.on_hand)
+    reserved = func.sum(moved.c.reserved)
+    merge = insert(_total).from_select(
+        ["product_id", "slot", "on_hand", "reserved"],
+        select(moved.c.product_id, moved.c.slot, on_hand, reserved)
+        .group_by(moved.c.product_id, moved.c.slot)
+        .having(or_(on_hand != 0, reserved != 0))
+        .order_by(moved.c.product_id, moved.c.slot),
+    )
+    merged = (
+        merge.on_conflict_do_update(
+            index_elements=[_total.c.product_id, _total.c.slot],
+            set_={
+                "on_hand": _total.c.on_hand + merge.excluded.on_hand,
+                "reserved": _total.c.reserved + merge.excluded.reserved,
+                "version": _total.c.version + 1,
+            },
+        )
+        .returning(_total.c.product_id)
+        .cte("merged")
+    )
+    # "merged" has to be referenced, or it would not be part of the statement
+    stmt = select(
+        select(func.count()).select_from(moved).scalar_subquery(),
+        select(func.count()).select_from(merged).scalar_subquery(),
+    )
+    async with session.begin():
+        folded, _totals = (await session.execute(stmt)).one()
+    return folded
+
+
+async def compact_stock_totals(
+    session_factory: async_sessionmaker[AsyncSession] = AsyncSessionMaker,
+) -> int:
+    """One compaction pass; returns the number of deltas folded into the totals.
+
+    Work per pass is capped at STOCK_TOTALS_COMPACT_MAX_BATCHES batches of
+    STOCK_TOTALS_COMPACT_BATCH_SIZE rows, like the reservation sweeper.
+    """
+    folded = 0
+    async with session_factory() as session:
+        for _ in range(settings.STOCK_TOTALS_COMPACT_MAX_BATCHES):
+            n = await compact_batch(session, settings.STOCK_TOTALS_COMPACT_BATCH_SIZE)
+            folded += n
+            if n < settings.STOCK_TOTALS_COMPACT_BATCH_SIZE:
+                break
+    return folded
@@ -0,0 +1,429 @@
+from __future__ import annotations
+
+import io
+import json
+from decimal import Decimal, InvalidOperation
+from typing import BinaryIO, Iterator, Literal
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    Numeric,
+    Table,
+    Text,
+    and_,
+    case,
+    func,
+    literal,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import UUID, distinct_on, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.schema import CreateTable
+
+from app.core.config import settings
+from app.core.ids import uuid7_sql
+from app.models import (
+    InventoryItem,
+    InventoryStripe,
+    InventoryTxn,
+    InventoryTxnType,
+    Location,
+    Product,
+)
+from app.services.csv_stream import (
+    MAX_REPORTED_ERRORS,
+    OnBatch,
+    ParsedBatch,
+    header_index,
+    open_csv,
+    pick,
+    stage_batches,
+)
+from app.services.inventory import _stripe_totals
+
+_item = InventoryItem.__table__
+_stripe = InventoryStripe.__table__
+_txn = InventoryTxn.__table__
+_product = Product.__table__
+_location = Location.__table__
+
+StocktakeFormat = Literal["csv", "ndjson"]
+
+HEADERS = {
+    "sku": ("sku", "SKU", "артикул", "Артикул", "код", "Код", "Код товара"),
+    "location_code": (
+        "location_code", "location", "Location", "склад", "Склад", "локация", "Локация",
+        "Код склада",
+    ),
+    "qty": ("qty", "counted", "quantity", "Qty", "количество", "Количество", "факт", "Факт"),
+}
+# NDJSON keys, first present wins
+_JSON_KEYS = {
+    "sku": ("sku",),
+    "location_code": ("location_code", "location"),
+    "qty": ("qty", "counted"),
+}
+
+_QTY_TYPE = _item.c.on_hand.type
+_MAX_QTY = Decimal(10) ** (_QTY_TYPE.precision - _QTY_TYPE.scale)
+_QUANTUM = Decimal(1).scaleb(-_QTY_TYPE.scale)
+
+DEFAULT_REASON = "stocktake"
+
+# counted quantities as they come from the file
+stage = Table(
+    "stocktake_stage",
+    MetaData(),
+    Column("line", Integer, nullable=False),
+    Column("sku", Text, nullable=False),
+    Column("location_code", Text, nullable=False),
+    Column("counted", Numeric(14, 4), nullable=False),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+
+# one row per resolved (product, location): the count against the book stock
+counts = Table(
+    "stocktake_count",
+    MetaData(),
+    Column("product_id", UUID(as_uuid=True), nullable=False),
+    Column("location_id", UUID(as_uuid=True), nullable=False),
+    Column("counted", Numeric(14, 4), nullable=False),
+    Column("on_hand", Numeric(18, 4)),
+    Column("reserved", Numeric(18, 4)),
+    Column("delta", Numeric(18, 4)),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+
+
+def _parse_qty(value: object) -> Decimal:
+    if isinstance(value, str):
+        # "1 234,5" from spreadsheets with a Russian locale
+        value = value.replace(" ", "").replace(" ", "")
+        if "," in value and "." not in value:
+            value = value.replace(",", ".")
+    elif isinstance(value, float):
+        value = repr(value)
+    elif isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError("qty must be a number")
+    try:
+        qty = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"qty {value!r} is not a number") from None
+    if not qty.is_finite() or qty < 0:
+        raise ValueError("qty must be a non-negative number")
+    if qty >= _MAX_QTY or qty != qty.quantize(_QUANTUM):
+        raise ValueError(f"qty must be below {_MAX_QTY} with at most {_QTY_TYPE.scale} decimals")
+    return qty
+
+
+def _csv_records(binary: BinaryIO, encoding: str | None):
+    with open_csv(binary, encoding) as reader:
+        header = next(reader, None)
+        if header is None:
+            return
+        columns = header_index(header, HEADERS)
+        missing = [field for field, positions in columns.items() if not positions]
+        if missing:
+            raise ValueError(f"CSV header must contain {', '.join(missing)} columns")
+        for record in reader:
+            if any(value.strip() for value in record):
+                yield reader.line_num, *(pick(record, columns[f]) for f in HEADERS)
+
+
+def _ndjson_records(binary: BinaryIO):
+    # JSON text is UTF-8 (RFC 8259); a BOM is tolerated
+    stream = io.TextIOWrapper(binary, encoding="utf-8-sig")
+    try:
+        for line, text in enumerate(stream, 1):
+            if not text.strip():
+                continue
+            try:
+                obj = json.loads(text)
+            except ValueError:
+                yield line, None, None, "invalid JSON"
+                continue
+            if not isinstance(obj, dict):
+                yield line, None, None, "expected a JSON object"
+                continue
+            yield line, *(
+                next((obj[k] for k in keys if obj.get(k) is not None), "")
+                for keys in _JSON_KEYS.values()
+            )
+    except UnicodeDecodeError:
+        raise ValueError("NDJSON must be UTF-8") from None
+    finally:
+        stream.detach()
+
+
+def iter_batches(
+    binary: BinaryIO,
+    fmt: StocktakeFormat = "csv",
+    encoding: str | None = None,
+    batch_size: int | None = None,
+) -> Iterator[ParsedBatch]:
+    """Parse counted quantities (sku, location code, qty) into stage batches.
+
+    Blocking; meant to be advanced off the event loop. For NDJSON an unparsable
+    line is reported in place of the qty, so it lands among the invalid rows.
+    """
+    if batch_size is None:
+        batch_size = settings.PRODUCT_IMPORT_BATCH_ROWS
+    records = _csv_records(binary, encoding) if fmt == "csv" else _ndjson_records(binary)
+    rows: list[tuple] = []
+    errors: list[tuple[int, str]] = []
+    line = 0
+    for line, sku, code, qty in records:
+        if sku is None:
+            errors.append((line, qty))
+            continue
+        sku, code = str(sku).strip(), str(code).strip()
+        if not sku or not code:
+            errors.append((line, "sku and location code are required"))
+            continue
+        try:
+            rows.append((line, sku, code, _parse_qty(qty)))
+        except ValueError as exc:
+            errors.append((line, str(exc)))
+            continue
+        if len(rows) >= batch_size:
+            yield ParsedBatch(rows, errors, line, binary.tell())
+            rows, errors = [], []
+    if rows or errors:
+        yield ParsedBatch(rows, errors, line, binary.tell())
+
+
+def _pair(table) -> list:
+    return [table.c.product_id == counts.c.product_id, table.c.location_id == counts.c.location_id]
+
+
+async def _resolve(session: AsyncSession, room: int) -> tuple[int, list[dict]]:
+    """Fill ``counts`` from the stage (last line per pair wins); report unknown codes."""
+    resolved = (
+        select(_product.c.id, _location.c.id, stage.c.counted)
+        .select_from(
+            stage.join(_product, _product.c.sku == stage.c.sku).join(
+                _location, _location.c.code == stage.c.location_code
+            )
+        )
+        .ext(distinct_on(_product.c.id, _location.c.id))
+        .order_by(_product.c.id, _location.c.id, stage.c.line.desc())
+    )
+    await session.execute(
+        insert(counts).from_select(["product_id", "location_id", "counted"], resolved)
+    )
+    unresolved = (
+        select(
+            stage.c.line,
+            stage.c.sku,
+            stage.c.location_code,
+            _product.c.id.is_(None).label("no_product"),
+            func.count().over().label("total"),
+        )
+        .select_from(
+            stage.outerjoin(_product, _product.c.sku == stage.c.sku).outerjoin(
+                _location, _location.c.code == stage.c.location_code
+            )
+        )
+        .where(_product.c.id.is_(None) | _location.c.id.is_(None))
+        .order_by(stage.c.line)
+        .limit(max(room, 1))
+    )
+    rows = (await session.execute(unresolved)).all()
+    errors = [
+        {
+            "line": r.line,
+            "error": (
+                f"unknown sku {r.sku}" if r.no_product else f"unknown location {r.location_code}"
+            ),
+        }
+        for r in rows[:room]
+    ]
+    return (rows[0].total if rows else 0), errors
+
+
+async def _lock_counted(session: AsyncSession) -> None:
+    """Create missing item rows and lock items and their stripes in canonical order.
+
+    Same order as ``_lock_items`` (product_id, location_id), so a stocktake and the
+    regular write paths cannot deadlock; locking also holds off CAS writers, whose
+    version check then fails and retries after the stocktake commits.
+    """
+    await session.execute(
+        insert(_item)
+        .from_select(
+            ["id", "product_id", "location_id", "on_hand", "reserved", "version"],
+            select(
+                func.gen_random_uuid(), counts.c.product_id, counts.c.location_id, 0, 0, 1
+            )
+            .where(counts.c.counted != 0)
+            .order_by(counts.c.product_id, counts.c.location_id),
+        )
+        .on_conflict_do_nothing(index_elements=[_item.c.product_id, _item.c.location_id])
+    )
+    for table, order in ((_item, ()), (_stripe, (_stripe.c.stripe,))):
+        locked = (
+            select(table.c.id)
+            .join(counts, and_(*_pair(table)))
+            .order_by(table.c.product_id, table.c.location_id, *order)
+            .with_for_update(of=table)
+            .subquery()
+        )
+        await session.execute(select(func.count()).select_from(locked))
+
+
+async def _compute_deltas(session: AsyncSession) -> None:
+    stripes = _stripe_totals()
+    book = (
+        select(
+            counts.c.product_id,
+            counts.c.location_id,
+            (func.coalesce(_item.c.on_hand, 0) + func.coalesce(stripes.c.on_hand, 0)).label(
+                "on_hand"
+            ),
+            (func.coalesce(_item.c.reserved, 0) + func.coalesce(stripes.c.reserved, 0)).label(
+                "reserved"
+            ),
+        )
+        .select_from(
+            counts.outerjoin(_item, and_(*_pair(_item))).outerjoin(
+                stripes, and_(*_pair(stripes))
+            )
+        )
+        .subquery("book")
+    )
+    await session.execute(
+        update(counts)
+        .where(counts.c.product_id == book.c.product_id, counts.c.location_id == book.c.location_id)
+        .values(
+            on_hand=book.c.on_hand,
+            reserved=book.c.reserved,
+            delta=counts.c.counted - book.c.on_hand,
+        )
+    )
+
+
+async def _apply(session: AsyncSession, reason: str, reference: str | None) -> None:
+    """Set counted stock and write one ADJUSTMENT journal row per changed pair.
+
+    Stock held in stripes is folded into the base row (as ``_lock_items`` does);
+    the rebalancer spreads it out again. Three statements for any number of rows.
+    """
+    changed = counts.c.delta != 0
+    await session.execute(
+        update(_item)
+        .where(*_pair(_item), changed)
+        .values(
+            on_hand=counts.c.counted,
+            reserved=counts.c.reserved,
+            version=_item.c.version + 1,
+        )
+    )
+    await session.execute(
+        update(_stripe)
+        .where(*_pair(_stripe), changed, (_stripe.c.on_hand != 0) | (_stripe.c.reserved != 0))
+        .values(on_hand=0, reserved=0, version=_stripe.c.version + 1)
+    )
+    location = counts.c.location_id
+    await session.execute(
+        insert(_txn).from_select(
+            [
+                "id", "product_id", "from_location_id", "to_location_id", "qty", "txn_type",
+                "reason", "reference",
+            ],
+            select(
+                uuid7_sql(),
+                counts.c.product_id,
+                case((counts.c.delta < 0, location)),
+                case((counts.c.delta > 0, location)),
+                func.abs(counts.c.delta),
+                literal(InventoryTxnType.ADJUSTMENT, _txn.c.txn_type.type),
+                literal(reason, _txn.c.reason.type),
+                literal(reference, _txn.c.reference.type),
+            ).where(changed),
+        )
+    )
+
+
+def _variances(limit: int):
+    return (
+        select(
+            _product.c.sku,
+            _location.c.code.label("location_code"),
+            counts.c.on_hand,
+            counts.c.counted,
+            counts.c.delta,
+            counts.c.reserved,
+        )
+        .select_from(
+            counts.join(_product, _product.c.id == counts.c.product_id).join(
+                _location, _location.c.id == counts.c.location_id
+            )
+        )
+        .where(counts.c.delta != 0)
+        .order_by(func.abs(counts.c.delta).desc(), _product.c.sku, _location.c.code)
+        .limit(limit)
+    )
+
+
+def _summary():
+    return select(
+        func.count().label("pairs"),
+        func.count().filter(counts.c.delta != 0).label("changed"),
+        func.coalesce(func.sum(counts.c.delta).filter(counts.c.delta > 0), 0).label("increase"),
+        func.coalesce(-func.sum(counts.c.delta).filter(counts.c.delta < 0), 0).label("decrease"),
+        func.count().filter(counts.c.counted < counts.c.reserved).label("below_reserved"),
+    )
+
+
+async def import_stocktake(
+    session: AsyncSession,
+    binary: BinaryIO,
+    *,
+    fmt: StocktakeFormat = "csv",
+    dry_run: bool = False,
+    reason: str = DEFAULT_REASON,
+    reference: str | None = None,
+    encoding: str | None = None,
+    report_limit: int = 1000,
+    batch_size: int | None = None,
+    on_batch: OnBatch | None = None,
+) -> dict:
+    """Set on_hand to counted quantities by (sku, location code), set-based.
+
+    Rows are COPYed into a stage table and resolved against product and location;
+    deltas against the book stock (items plus stripes) are computed in SQL after the
+    affected rows are locked. ``dry_run`` returns the same variance report and rolls
+    everything back. Counts below reserved are applied but flagged in the report.
+    """
+    batches = iter_batches(binary, fmt, encoding, batch_size)
+    async with session.begin():
+        staged, invalid, errors = await stage_batches(session, stage, batches, on_batch)
+        await session.execute(CreateTable(counts))
+        unresolved, more_errors = await _resolve(session, MAX_REPORTED_ERRORS - len(errors))
+        if not dry_run:
+            await _lock_counted(session)
+        await _compute_deltas(session)
+        summary = (await session.execute(_summary())).one()
+        variances = (await session.execute(_variances(report_limit))).all()
+        if dry_run:
+            await session.rollback()
+        else:
+            await _apply(session, reason, reference)
+    return {
+        "status": "dry_run" if dry_run else "applied",
+        "rows": staged,
+        "invalid": invalid + unresolved,
+        "errors": errors + more_errors,
+        "pairs": summary.pairs,
+        "changed": summary.changed,
+        "increase": str(summary.increase),
+        "decrease": str(summary.decrease),
+        "below_reserved": summary.below_reserved,
+        "variances": [{k: str(v) for k, v in row._mapping.items()} for row in variances],
+        "variances_truncated": summary.changed > len(variances),
+    }
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from decimal import ROUND_FLOOR, Decimal
+
+from sqlalchemy import select, union
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import raiseload
+
+from app.db.session import AsyncSessionMaker
+from app.models import InventoryItem, InventoryStripe, Product
+
+
+async def rebalance_item(session: AsyncSession, product_id, location_id, stripes: int) -> bool:
+    """Spread free stock of one (product, location) evenly over ``stripes`` stripes.
+
+    Stripe 0 is the inventory_item row itself. Reserved quantities stay where they
+    are; stripes beyond the configured count are folded into stripe 0 and removed.
+    Returns False when the base row is busy (it is skipped until the next pass).
+    """
+    async with session.begin():
+        res = await session.execute(
+            select(InventoryItem)
+            .where(InventoryItem.product_id == product_id, InventoryItem.location_id == location_id)
+            .options(raiseload("*"))
+            .with_for_update(skip_locked=True)
+        )
+        item = res.scalars().first()
+        if item is None:
+            return False
+        res = await session.execute(
+            select(InventoryStripe)
+            .where(
+                InventoryStripe.product_id == product_id,
+                InventoryStripe.location_id == location_id,
+            )
+            .order_by(InventoryStripe.stripe)
+            .with_for_update()
+        )
+        existing = {s.stripe: s for s in res.scalars()}
+
+        cells: list[InventoryItem | InventoryStripe] = [item]
+        for n in range(1, stripes):
+            stripe = existing.pop(n, None)
+            if stripe is None:
+                stripe = InventoryStripe(
+                    product_id=product_id, location_id=location_id, stripe=n,
+                    on_hand=Decimal("0"), reserved=Decimal("0"), version=1,
+                )
+                session.add(stripe)
+            cells.append(stripe)
+        surplus = list(existing.values())
+
+        total_on_hand = sum(Decimal(c.on_hand) for c in cells + surplus)
+        reserved = [Decimal(c.reserved) for c in cells]
+        reserved[0] += sum(Decimal(s.reserved) for s in surplus)
+        free = total_on_hand - sum(reserved)
+        if free < 0:
+            # reserved exceeds on_hand — leave the data as is for manual review
+            return True
+        share = (free / stripes).to_integral_value(rounding=ROUND_FLOOR)
+        remainder = free - share * stripes
+
+        for n, cell in enumerate(cells):
+            on_hand = reserved[n] + share + (remainder if n == 0 else 0)
+            if Decimal(cell.on_hand) != on_hand or Decimal(cell.reserved) != reserved[n]:
+                cell.on_hand = on_hand
+                cell.reserved = reserved[n]
+                cell.version += 1
+        for stripe in surplus:
+            await session.delete(stripe)
+        return True
+
+
+async def rebalance_stripes(
+    session_factory: async_sessionmaker[AsyncSession] = AsyncSessionMaker,
+) -> int:
+    """One pass of the background rebalancer; returns the number of items rebalanced.
+
+    Covers every item of a striped product, plus items whose product was switched
+    back to fewer stripes and still has leftover stripe rows.
+    """
+    striped = (
+        select(InventoryItem.product_id, InventoryItem.location_id, Product.stock_stripes)
+        .join(Product, Product.id == InventoryItem.product_id)
+        .where(Product.stock_stripes > 1)
+    )
+    leftover = (
+        select(InventoryStripe.product_id, InventoryStripe.location_id, Product.stock_stripes)
+        .join(Product, Product.id == InventoryStripe.product_id)
+        .where(InventoryStripe.stripe >= Product.stock_stripes)
+    )
+    async with session_factory() as session:
+        async with session.begin():
+            targets = (await session.execute(union(striped, leftover))).all()
+        done = 0
+        for product_id, location_id, stripes in targets:
+            if await rebalance_item(session, product_id, location_id, stripes):
+                done += 1
+        return done
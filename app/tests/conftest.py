@@ -7,7 +7,7 @@ import sys
 import pytest
 import pytest_asyncio
 from httpx import ASGITransport, AsyncClient
-from sqlalchemy import delete
+from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.pool import NullPool
 
@@ -15,7 +15,7 @@ from app.api.deps import get_db
 from app.core.config import settings
 from app.db.session import get_session  # <-- ВАЖНО: тоже переопределим!
 from app.main import app
-from app.models import Product
+from app.models import InventoryTxn, Location, Product
 from app.models.user import User
 
 if sys.platform.startswith("win"):
@@ -96,10 +96,27 @@ async def cleanup_products(TestSession, created_skus: list[str]):
     yield
     if created_skus:
         async with TestSession() as s:
+            # журнал ссылается на товар с ON DELETE RESTRICT — чистим его первым
+            product_ids = select(Product.id).where(Product.sku.in_(created_skus))
+            await s.execute(delete(InventoryTxn).where(InventoryTxn.product_id.in_(product_ids)))
             await s.execute(delete(Product).where(Product.sku.in_(created_skus)))
             await s.commit()
 
 
+@pytest.fixture()
+def created_location_codes() -> list[str]:
+    return []
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def cleanup_locations(TestSession, created_location_codes: list[str]):
+    yield
+    if created_location_codes:
+        async with TestSession() as s:
+            await s.execute(delete(Location).where(Location.code.in_(created_location_codes)))
+            await s.commit()
+
+
 # ---- хелперы токенов/регистрации как у тебя было ----
 def _admin_header() -> dict:
     return {"X-Admin-Secret": settings.APP_SECRET} if settings.APP_SECRET else {}
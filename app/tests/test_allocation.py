@@ -0,0 +1,44 @@
+# app/tests/test_allocation.py
+from __future__ import annotations
+
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from app.services.allocation import plan_allocation
+
+P1, P2 = uuid.uuid4(), uuid.uuid4()
+A, B, C = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+
+# A держит понемногу всего, B — много P1, C — только P2
+AVAILABLE = {
+    P1: {A: Decimal("5"), B: Decimal("20")},
+    P2: {A: Decimal("5"), C: Decimal("2")},
+}
+
+
+def _by_location(plan) -> dict:
+    out: dict = {}
+    for product_id, location_id, qty in plan:
+        out[(product_id, location_id)] = qty
+    return out
+
+
+def test_fewest_locations_prefers_location_covering_whole_order():
+    plan = plan_allocation({P1: Decimal("4"), P2: Decimal("3")}, AVAILABLE, "fewest_locations")
+    assert _by_location(plan) == {(P1, A): 4, (P2, A): 3}
+
+
+def test_largest_first_and_preferred_order():
+    wanted = {P1: Decimal("8"), P2: Decimal("6")}
+    plan = plan_allocation(wanted, AVAILABLE, "largest_first")
+    assert _by_location(plan) == {(P1, B): 8, (P2, A): 5, (P2, C): 1}
+
+    plan = plan_allocation(wanted, AVAILABLE, "preferred_order", preferred=[C, A])
+    assert _by_location(plan) == {(P1, A): 5, (P1, B): 3, (P2, C): 2, (P2, A): 4}
+
+
+def test_shortage_is_reported():
+    with pytest.raises(ValueError, match="Not enough available stock"):
+        plan_allocation({P2: Decimal("8")}, AVAILABLE, "largest_first")
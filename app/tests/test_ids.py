@@ -0,0 +1,23 @@
+# app/tests/test_ids.py
+from __future__ import annotations
+
+import time
+import uuid
+
+from app.core.ids import uuid7
+from app.models import InventoryTxn, Product
+
+
+def test_uuid7_layout_and_order():
+    before = time.time_ns() // 1_000_000
+    ids = [uuid7() for _ in range(10_000)]
+
+    assert all(u.version == 7 and u.variant == uuid.RFC_4122 for u in ids)
+    # в пределах процесса строго возрастают, в том числе внутри одной миллисекунды
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+    assert ids[0].int >> 80 >= before
+
+
+def test_uuid_factory_is_per_model():
+    assert InventoryTxn.__table__.c.id.default.arg.__name__ == "uuid7"
+    assert Product.__table__.c.id.default.arg.__name__ == "uuid4"
@@ -0,0 +1,1094 @@
+# app/tests/test_inventory.py
+from __future__ import annotations
+
+import asyncio
+import json
+import uuid
+
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from sqlalchemy import func, select, update
+
+from app.api import idempotency as idempotency_api
+from app.core.config import settings
+from app.models import (
+    IdempotencyKey,
+    InventoryItem,
+    InventoryReservation,
+    InventoryStripe,
+    InventoryTxn,
+    Location,
+    Product,
+)
+from app.services.history import take_checkpoint
+from app.services.inventory import availability_version
+from app.services.reservations import expire_batch, expire_reservations
+from app.services.stock_cache import listen_for_changes, stock_cache
+from app.services.stock_totals import compact_stock_totals
+from app.services.stripes import rebalance_stripes
+
+
+def _bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest_asyncio.fixture()
+async def product_id(
+    client: AsyncClient, admin_token: str, created_skus: list[str]
+) -> str:
+    sku = f"SKU-INV-{uuid.uuid4().hex[:8]}"
+    r = await client.post(
+        "/products", json={"sku": sku, "name": "Inventory test"}, headers=_bearer(admin_token)
+    )
+    assert r.status_code in (200, 201), r.text
+    created_skus.append(sku)
+    return r.json()["id"]
+
+
+async def _location(
+    client: AsyncClient, admin_token: str, created_location_codes: list[str]
+) -> str:
+    code = f"LOC-{uuid.uuid4().hex[:8]}"
+    r = await client.post(
+        "/locations", json={"code": code, "name": "Test bin"}, headers=_bearer(admin_token)
+    )
+    assert r.status_code in (200, 201), r.text
+    created_location_codes.append(code)
+    return r.json()["id"]
+
+
+@pytest_asyncio.fixture()
+async def location_id(
+    client: AsyncClient, admin_token: str, created_location_codes: list[str]
+) -> str:
+    return await _location(client, admin_token, created_location_codes)
+
+
+async def _snapshot(client: AsyncClient, product_id: str, location_id: str) -> dict:
+    r = await client.get(
+        "/inventory/snapshot", params={"product_id": product_id, "location_id": location_id}
+    )
+    assert r.status_code == 200, r.text
+    rows = r.json()
+    assert len(rows) == 1, rows
+    return rows[0]
+
+
+@pytest.mark.asyncio
+async def test_reserve_release_ship_roundtrip(
+    client: AsyncClient, admin_token: str, product_id: str, location_id: str
+):
+    key = {"product_id": product_id, "location_id": location_id}
+    h = _bearer(admin_token)
+
+    # первая корректировка создаёт строку остатка (медленный путь)
+    r = await client.post("/inventory/adjust", json={**key, "delta": "10"}, headers=h)
+    assert r.status_code == 200, r.text
+    assert float(r.json()["on_hand"]) == 10
+
+    # последующие операции идут одним условным UPDATE
+    r = await client.post("/inventory/adjust", json={**key, "delta": "5"}, headers=h)
+    assert r.status_code == 200, r.text
+    assert float(r.json()["on_hand"]) == 15
+
+    r = await client.post("/inventory/reserve", json={**key, "qty": "6"}, headers=h)
+    assert r.status_code == 200, r.text
+    assert float(r.json()["reserved"]) == 6
+
+    r = await client.post("/inventory/release", json={**key, "qty": "2"}, headers=h)
+    assert r.status_code == 200, r.text
+    assert float(r.json()["reserved"]) == 4
+
+    r = await client.post("/inventory/ship", json={**key, "qty": "4"}, headers=h)
+    assert r.status_code == 200, r.text
+    assert float(r.json()["on_hand"]) == 11
+    assert float(r.json()["reserved"]) == 0
+
+    snap = await _snapshot(client, product_id, location_id)
+    assert float(snap["available"]) == 11
+
+
+@pytest.mark.asyncio
+async def test_guarded_operations_reject_overdraw(
+    client: AsyncClient, admin_token: str, product_id: str, location_id: str
+):
+    key = {"product_id": product_id, "location_id": location_id}
+    h = _bearer(admin_token)
+
+    r = await client.post("/inventory/adjust", json={**key, "delta": "3"}, headers=h)
+    assert r.status_code == 200, r.text
+
+    r = await client.post("/inventory/reserve", json={**key, "qty": "4"}, headers=h)
+    assert r.status_code == 400, r.text
+    assert r.json()["detail"] == "Not enough available to reserve"
+
+    r = await client.post("/inventory/release", json={**key, "qty": "1"}, headers=h)
+    assert r.status_code == 400, r.text
+    assert r.json()["detail"] == "Cannot release more than reserved"
+
+    r = await client.post("/inventory/ship", json={**key, "qty": "1"}, headers=h)
+    assert r.status_code == 400, r.text
+    assert r.json()["detail"] == "Not enough reserved to ship"
+
+    r = await client.post("/inventory/adjust", json={**key, "delta": "-4"}, headers=h)
+    assert r.status_code == 400, r.text
+
+    snap = await _snapshot(client, product_id, location_id)
+    assert float(snap["on_hand"]) == 3
+    assert float(snap["reserved"]) == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_applies_all_or_nothing(
+    client: AsyncClient,
+    admin_token: str,
+    product_id: str,
+    location_id: str,
+    created_location_codes: list[str],
+):
+    other = await _location(client, admin_token, created_location_codes)
+    h = _bearer(admin_token)
+    ops = [
+        {"op": "adjust", "product_id": product_id, "location_id": location_id, "delta": "10"},
+        {
+            "op": "move", "product_id": product_id,
+            "from_location_id": location_id, "to_location_id": other, "qty": "4",
+        },
+        {"op": "reserve", "product_id": product_id, "location_id": other, "qty": "3"},
+        {"op": "ship", "product_id": product_id, "location_id": other, "qty": "1"},
+        {"op": "release", "product_id": product_id, "location_id": other, "qty": "2"},
+    ]
+    r = await client.post("/inventory/batch", json={"operations": ops}, headers=h)
+    assert r.status_code == 200, r.text
+    assert r.json()["applied"] == 5
+
+    assert float((await _snapshot(client, product_id, location_id))["on_hand"]) == 6
+    snap = await _snapshot(client, product_id, other)
+    assert float(snap["on_hand"]) == 3
+    assert float(snap["reserved"]) == 0
+
+    # последняя операция падает — не применяется ничего
+    bad = [
+        {"op": "adjust", "product_id": product_id, "location_id": location_id, "delta": "1"},
+        {"op": "reserve", "product_id": product_id, "location_id": other, "qty": "100"},
+    ]
+    r = await client.post("/inventory/batch", json={"operations": bad}, headers=h)
+    assert r.status_code == 400, r.text
+    assert r.json()["detail"].startswith("Operation #2 (reserve)")
+    assert float((await _snapshot(client, product_id, location_id))["on_hand"]) == 6
+
+
+@pytest.mark.asyncio
+async def test_batch_at_schema_cap_of_distinct_items(
+    client: AsyncClient,
+    admin_token: str,
+    created_skus: list[str],
+    created_location_codes: list[str],
+    TestSession,
+):
+    # 100 товаров x 100 локаций = 10 000 разных строк остатка в одном запросе
+    tag = uuid.uuid4().hex[:8]
+    products = [Product(sku=f"SKU-CAP-{tag}-{i}", name="Cap") for i in range(100)]
+    locations = [Location(code=f"LOC-CAP-{tag}-{i}", name="Cap") for i in range(100)]
+    created_skus += [p.sku for p in products]
+    created_location_codes += [loc.code for loc in locations]
+    async with TestSession() as s:
+        s.add_all(products + locations)
+        await s.commit()
+
+    ops = [
+        {"op": "adjust", "product_id": str(p.id), "location_id": str(loc.id), "delta": "1"}
+        for p in products
+        for loc in locations
+    ]
+    h = _bearer(admin_token)
+    r = await client.post("/inventory/batch", json={"operations": ops}, headers=h)
+    assert r.status_code == 200, r.text
+    assert r.json()["applied"] == 10_000
+    r = await client.get("/inventory/totals", params={"product_id": [str(products[0].id)]})
+    assert float(r.json()[0]["on_hand"]) == 100
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["pessimistic", "optimistic"])
+async def test_opposite_moves_do_not_deadlock(
+    client: AsyncClient,
+    admin_token: str,
+    product_id: str,
+    location_id: str,
+    created_location_codes: list[str],
+    monkeypatch: pytest.MonkeyPatch,
+    mode: str,
+):
+    monkeypatch.setattr(settings, "INVENTORY_CONCURRENCY", mode)
+    monkeypatch.setattr(settings, "INVENTORY_CAS_MAX_RETRIES", 50)
+    other = await _location(client, admin_token, created_location_codes)
+    h = _bearer(admin_token)
+    for loc in (location_id, other):
+        r = await client.post(
+            "/inventory/adjust",
+            json={"product_id": product_id, "location_id": loc, "delta": "50"},
+            headers=h,
+        )
+        assert r.status_code == 200, r.text
+
+    def _move(src: str, dst: str):
+        return client.post(
+            "/inventory/move",
+            json={
+                "product_id": product_id, "from_location_id": src,
+                "to_location_id": dst, "qty": "1",
+            },
+            headers=h,
+        )
+
+    responses = await asyncio.gather(
+        *(_move(location_id, other) if i % 2 else _move(other, location_id) for i in range(20))
+    )
+    assert all(r.status_code == 200 for r in responses), [r.text for r in responses]
+    assert float((await _snapshot(client, product_id, location_id))["on_hand"]) == 50
+    assert float((await _snapshot(client, product_id, other))["on_hand"]) == 50
+
+
+@pytest.mark.asyncio
+async def test_coalesced_reservations_are_settled_individually(
+    client: AsyncClient,
+    admin_token: str,
+    product_id: str,
+    location_id: str,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    key = {"product_id": product_id, "location_id": location_id}
+    h = _bearer(admin_token)
+    r = await client.post("/inventory/adjust", json={**key, "delta": "15"}, headers=h)
+    assert r.status_code == 200, r.text
+
+    monkeypatch.setattr(settings, "RESERVE_COALESCE_ENABLED", True)
+    before = (await client.get("/inventory/stats", headers=h)).json()["reserve_coalescer"]
+
+    responses = await asyncio.gather(
+        *(client.post("/inventory/reserve", json={**key, "qty": "1"}, headers=h) for _ in range(20))
+    )
+    codes = sorted(r.status_code for r in responses)
+    assert codes == [200] * 15 + [400] * 5, [r.text for r in responses]
+
+    after = (await client.get("/inventory/stats", headers=h)).json()["reserve_coalescer"]
+    assert after["requests"] - before["requests"] == 20
+    assert after["rejected"] - before["rejected"] == 5
+    assert after["batches"] - before["batches"] < 20
+    assert float((await _snapshot(client, product_id, location_id))["reserved"]) == 15
+
+
+@pytest.mark.asyncio
+async def test_striped_item_spreads_and_folds_stock(
+    client: AsyncClient,
+    admin_token: str,
+    product_id: str,
+    location_id: str,
+    TestSession,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    key = {"product_id": product_id, "location_id": location_id}
+    h = _bearer(admin_token)
+    r = await client.put(
+        f"/products/{product_id}/stock-stripes", json={"stripes": 4}, headers=h
+    )
+    assert r.status_code == 200, r.text
+    r = await client.post("/inventory/adjust", json={**key, "delta": "100"}, headers=h)
+    assert r.status_code == 200, r.text
+
+    assert await rebalance_stripes(TestSession) >= 1
+    async with TestSession() as s:
+        res = await s.execute(
+            select(InventoryStripe.on_hand).where(InventoryStripe.product_id == product_id)
+        )
+        assert sorted(float(v) for v in res.scalars()) == [25, 25, 25]
+
+    monkeypatch.setattr(settings, "INVENTORY_STRIPING_ENABLED", True)
+    for _ in range(10):
+        r = await client.post("/inventory/reserve", json={**key, "qty": "5"}, headers=h)
+        assert r.status_code == 200, r.text
+    assert float(r.json()["reserved"]) == 50
+    async with TestSession() as s:
+        res = await s.execute(
+            select(InventoryStripe.reserved).where(InventoryStripe.product_id == product_id)
+        )
+        assert sum(res.scalars()) > 0
+
+    # ни одна полоса не вмещает 45 — медленный путь сворачивает полосы в базовую строку
+    r = await client.post("/inventory/reserve", json={**key, "qty": "45"}, headers=h)
+    assert r.status_code == 200, r.text
+    assert float(r.json()["reserved"]) == 95
+
+    snap = await _snapshot(client, product_id, location_id)
+    assert float(snap["on_hand"]) == 100
+    assert float(snap["available"]) == 5
+
+
+@pytest.mark.asyncio
+async def test_expired_reservations_are_released_by_sweeper(
+    client: AsyncClient, admin_token: str, product_id: str, location_id: str, TestSession
+):
+    key = {"product_id": product_id, "location_id": location_id}
+    h = _bearer(admin_token)
+    r = await client.post("/inventory/adjust", json={**key, "delta": "10"}, headers=h)
+    assert r.status_code == 200, r.text
+    r = await client.post(
+        "/inventory/reserve",
+        json={**key, "qty": "5", "reference": "cart-1", "ttl_seconds": 3600},
+        headers=h,
+    )
+    assert r.status_code == 200, r.text
+
+    # частичный release по reference уменьшает резерв в журнале резервов
+    r = await client.post(
+        "/inventory/release", json={**key, "qty": "2", "reference": "cart-1"}, headers=h
+    )
+    assert r.status_code == 200, r.text
+    async with TestSession() as s:
+        res = await s.execute(
+            select(InventoryReservation.qty).where(InventoryReservation.product_id == product_id)
+        )
+        assert [float(v) for v in res.scalars()] == [3]
+
+        # срок ещё не вышел — sweeper ничего не трогает
+        assert await expire_reservations(TestSession) == 0
+        await s.execute(
+            update(InventoryReservation)
+            .where(InventoryReservation.product_id == product_id)
+            .values(expires_at=func.now() - func.make_interval(0, 0, 0, 0, 0, 1))
+        )
+        await s.commit()
+
+    assert await expire_reservations(TestSession) >= 1
+    snap = await _snapshot(client, product_id, location_id)
+    assert float(snap["reserved"]) == 0
+    assert float(snap["available"]) == 10
+    async with TestSession() as s:
+        res = await s.execute(
+            select(InventoryTxn.qty).where(
+                InventoryTxn.product_id == product_id,
+                InventoryTxn.reason == "reservation expired",
+            )
+        )
+        assert [float(v) for v in res.scalars()] == [3]
+
+
+@pytest.mark.asyncio
+async def test_shipped_reservation_is_not_released_again_on_expiry(
+    client: AsyncClient, admin_token: str, product_id: str, location_id: str, TestSession
+):
+    key = {"product_id": product_id, "location_id": location_id}
+    h = _bearer(admin_token)
+    r = await client.post("/inventory/adjust", json={**key, "delta": "10"}, headers=h)
+    assert r.status_code == 200, r.text
+    # без reference истекающий резерв потом нечем снять с журнала резервов
+    r = await client.post(
+        "/inventory/reserve", json={**key, "qty": "2", "ttl_seconds": 60}, headers=h
+    )
+    assert r.status_code == 422, r.text
+
+    # заказ с TTL отгружен, рядом резерв другого заказа без срока
+    for path, body in (
+        ("/inventory/reserve", {**key, "qty": "2", "reference": "cart-ttl", "ttl_seconds": 60}),
+        ("/inventory/reserve", {**key, "qty": "3"}),
+        ("/inventory/ship", {**key, "qty": "2", "reference": "cart-ttl"}),
+    ):
+        r = await client.post(path, json=body, headers=h)
+        assert r.status_code == 200, r.text
+    async with TestSession() as s:
+        await s.execute(
+            update(InventoryReservation)
+            .where(InventoryReservation.product_id == product_id)
+            .values(expires_at=func.now() - func.make_interval(0, 0, 0, 0, 0, 1))
+        )
+        await s.commit()
+    await expire_reservations(TestSession)
+
+    snap = await _snapshot(client, product_id, location_id)
+    assert (float(snap["on_hand"]), float(snap["reserved"])) == (8, 3)
+
+
+@pytest.mark.asyncio
+async def test_sweeper_batches_see_writes_made_between_them(
+    client: AsyncClient, admin_token: str, product_id: str, location_id: str, TestSession
+):
+    key = {"product_id": product_id, "location_id": location_id}
+    h = _bearer(admin_token)
+    for path, body in (
+        ("/inventory/adjust", {**key, "delta": "10"}),
+        ("/inventory/reserve", {**key, "qty": "2", "reference": "sw-1", "ttl_seconds": 60}),
+        ("/inventory/reserve", {**key, "qty": "3", "reference": "sw-2", "ttl_seconds": 60}),
+    ):
+        r = await client.post(path, json=body, headers=h)
+        assert r.status_code == 200, r.text
+    async with TestSession() as s:
+        await s.execute(
+            update(InventoryReservation)
+            .where(InventoryReservation.product_id == product_id)
+            .values(expires_at=func.now() - func.make_interval(0, 0, 0, 0, 0, 1))
+        )
+        await s.commit()
+
+    # одна сессия на все пачки, как в expire_reservations; между пачками позицию меняют,
+    # а её объект остаётся в identity map сессии
+    async with TestSession() as s:
+        item = await s.scalar(
+            select(InventoryItem).where(
+                InventoryItem.product_id == product_id, InventoryItem.location_id == location_id
+            )
+        )
+        await s.commit()
+        assert await expire_batch(s, 1) == 1
+        r = await client.post("/inventory/adjust", json={**key, "delta": "5"}, headers=h)
+        assert r.status_code == 200, r.text
+        assert await expire_batch(s, 1) == 1
+        assert (float(item.on_hand), float(item.reserved)) == (15, 0)
+
+
+@pytest.mark.asyncio
+async def test_release_without_reference_cannot_take_referenced_stock(
+    client: AsyncClient, admin_token: str, product_id: str, location_id: str, TestSession
+):
+    key = {"product_id": product_id, "location_id": location_id}
+    h = _bearer(admin_token)
+    for path, body in (
+        ("/inventory/adjust", {**key, "delta": "10"}),
+        ("/inventory/reserve", {**key, "qty": "5", "reference": "A", "ttl_seconds": 60}),
+        ("/inventory/reserve", {**key, "qty": "5"}),
+    ):
+        r = await client.post(path, json=body, headers=h)
+        assert r.status_code == 200, r.text
+
+    # без reference снимается только резерв, которого нет в журнале резервов
+    for path, body in (
+        ("/inventory/release", {**key, "qty": "6"}),
+        ("/inventory/ship", {**key, "qty": "6"}),
+    ):
+        r = await client.post(path, json=body, headers=h)
+        assert r.status_code == 400, r.text
+    ops = [{"op": "release", **key, "qty": "3"}, {"op": "release", **key, "qty": "3"}]
+    r = await client.post("/inventory/batch", json={"operations": ops}, headers=h)
+    assert r.status_code == 400, r.text
+    r = await client.post("/inventory/release", json={**key, "qty": "5"}, headers=h)
+    assert r.status_code == 200, r.text
+    r = await client.post("/inventory/ship", json={**key, "qty": "1"}, headers=h)
+    assert r.status_code == 400, r.text
+
+    async with TestSession() as s:
+        await s.execute(
+            update(InventoryReservation)
+            .where(InventoryReservation.product_id == product_id)
+            .values(expires_at=func.now() - func.make_interval(0, 0, 0, 0, 0, 1))
+        )
+        await s.commit()
+    await expire_reservations(TestSession)
+
+    snap = await _snapshot(client, product_id, location_id)
+    assert (float(snap["on_hand"]), float(snap["reserved"])) == (10, 0)
+
+
+@pytest.mark.asyncio
+async def test_order_is_settled_by_reference(
+    client: AsyncClient,
+    admin_token: str,
+    product_id: str,
+    location_id: str,
+    created_location_codes: list[str],
+):
+    other = await _location(client, admin_token, created_location_codes)
+    h = _bearer(admin_token)
+    for loc in (location_id, other):
+        key = {"product_id": product_id, "location_id": loc}
+        r = await client.post("/inventory/adjust", json={**key, "delta": "10"}, headers=h)
+        assert r.status_code == 200, r.text
+        for ref in ("order-1", "order-2"):
+            r = await client.post(
+                "/inventory/reserve", json={**key, "qty": "2", "reference": ref}, headers=h
+            )
+            assert r.status_code == 200, r.text
+
+    r = await client.post("/inventory/reservations/order-1/ship", headers=h)
+    assert r.status_code == 200, r.text
+    assert len(r.json()["items"]) == 2
+    r = await client.post("/inventory/reservations/order-2/release", headers=h)
+    assert r.status_code == 200, r.text
+
+    for loc in (location_id, other):
+        snap = await _snapshot(client, product_id, loc)
+        assert float(snap["on_hand"]) == 8
+        assert float(snap["reserved"]) == 0
+
+    r = await client.post("/inventory/reservations/order-1/release", headers=h)
+    assert r.status_code == 404, r.text
+
+
+@pytest.mark.asyncio
+async def test_allocate_reserves_across_locations(
+    client: AsyncClient,
+    admin_token: str,
+    product_id: str,
+    location_id: str,
+    created_location_codes: list[str],
+):
+    other = await _location(client, admin_token, created_location_codes)
+    h = _bearer(admin_token)
+    for loc, qty in ((location_id, "3"), (other, "10")):
+        r = await client.post(
+            "/inventory/adjust",
+            json={"product_id": product_id, "location_id": loc, "delta": qty},
+            headers=h,
+        )
+        assert r.status_code == 200, r.text
+
+    body = {
+        "lines": [{"product_id": product_id, "qty": "5"}],
+        "policy": "preferred_order",
+        "preferred_location_ids": [location_id],
+        "reference": "alloc-1",
+    }
+    r = await client.post("/inventory/allocate", json=body, headers=h)
+    assert r.status_code == 200, r.text
+    got = {a["location_id"]: float(a["qty"]) for a in r.json()["allocations"]}
+    assert got == {location_id: 3, other: 2}
+
+    # остатка (8) не хватает — не резервируется ничего
+    r = await client.post(
+        "/inventory/allocate", json={**body, "lines": [{"product_id": product_id, "qty": "9"}]},
+        headers=h,
+    )
+    assert r.status_code == 400, r.text
+    assert float((await _snapshot(client, product_id, other))["reserved"]) == 2
+
+    r = await client.post("/inventory/reservations/alloc-1/release", headers=h)
+    assert r.status_code == 200, r.text
+    assert float((await _snapshot(client, product_id, location_id))["reserved"]) == 0
+
+
+@pytest.mark.asyncio
+async def test_snapshot_filters_by_id_lists_and_adds_codes(
+    client: AsyncClient,
+    admin_token: str,
+    product_id: str,
+    location_id: str,
+    created_location_codes: list[str],
+):
+    other = await _location(client, admin_token, created_location_codes)
+    h = _bearer(admin_token)
+    for loc in (location_id, other):
+        r = await client.post(
+            "/inventory/adjust",
+            json={"product_id": product_id, "location_id": loc, "delta": "2"},
+            headers=h,
+        )
+        assert r.status_code == 200, r.text
+
+    r = await client.get(
+        "/inventory/snapshot",
+        params={"product_id": [product_id], "location_id": [location_id, other],
+                "include_codes": "true"},
+    )
+    assert r.status_code == 200, r.text
+    rows = r.json()
+    assert {row["location_id"] for row in rows} == {location_id, other}
+    assert all(row["sku"].startswith("SKU-INV-") for row in rows)
+    assert {row["location_code"] for row in rows} == set(created_location_codes)
+    assert float(rows[0]["available"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_snapshot_keyset_pages_and_ndjson_stream(
+    client: AsyncClient,
+    admin_token: str,
+    product_id: str,
+    location_id: str,
+    created_location_codes: list[str],
+):
+    locations = [location_id] + [
+        await _location(client, admin_token, created_location_codes) for _ in range(2)
+    ]
+    h = _bearer(admin_token)
+    for loc in locations:
+        r = await client.post(
+            "/inventory/adjust",
+            json={"product_id": product_id, "location_id": loc, "delta": "1"},
+            headers=h,
+        )
+        assert r.status_code == 200, r.text
+
+    seen, cursor = [], None
+    while True:
+        params = {"product_id": product_id, "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        r = await client.get("/inventory/snapshot", params=params)
+        assert r.status_code == 200, r.text
+        seen += [row["location_id"] for row in r.json()]
+        cursor = r.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert seen == sorted(locations)
+
+    r = await client.get(
+        "/inventory/snapshot",
+        params={"product_id": product_id},
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert [row["location_id"] for row in lines] == sorted(locations)
+
+
+@pytest.mark.asyncio
+async def test_snapshot_conditional_get(
+    client: AsyncClient, admin_token: str, product_id: str, location_id: str
+):
+    h = _bearer(admin_token)
+    key = {"product_id": product_id, "location_id": location_id}
+    r = await client.post("/inventory/adjust", json={**key, "delta": "2"}, headers=h)
+    assert r.status_code == 200, r.text
+
+    r = await client.get("/inventory/snapshot", params=key)
+    etag = r.headers["ETag"]
+    r = await client.get("/inventory/snapshot", params=key, headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    # другой набор параметров — другое тело, значит и другой тег
+    r = await client.get(
+        "/inventory/snapshot", params={**key, "include_codes": "true"},
+        headers={"If-None-Match": etag},
+    )
+    assert r.status_code == 200
+
+    r = await client.post("/inventory/reserve", json={**key, "qty": "1"}, headers=h)
+    assert r.status_code == 200, r.text
+    r = await client.get("/inventory/snapshot", params=key, headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert float(r.json()[0]["reserved"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_product_totals_follow_every_write_path(
+    client: AsyncClient,
+    admin_token: str,
+    product_id: str,
+    location_id: str,
+    created_location_codes: list[str],
+    TestSession,
+):
+    other = await _location(client, admin_token, created_location_codes)
+    h = _bearer(admin_token)
+    key = {"product_id": product_id, "location_id": location_id}
+    r = await client.post("/inventory/adjust", json={**key, "delta": "10"}, headers=h)
+    assert r.status_code == 200, r.text
+    r = await client.post("/inventory/adjust", json={**key, "delta": "5"}, headers=h)
+    assert r.status_code == 200, r.text
+    r = await client.post(
+        "/inventory/move",
+        json={"product_id": product_id, "from_location_id": location_id,
+              "to_location_id": other, "qty": "6"},
+        headers=h,
+    )
+    assert r.status_code == 200, r.text
+    r = await client.post("/inventory/reserve", json={**key, "qty": "4"}, headers=h)
+    assert r.status_code == 200, r.text
+
+    # полосы: ребалансировщик перекладывает остаток, итог не меняется
+    r = await client.put(f"/products/{product_id}/stock-stripes", json={"stripes": 3}, headers=h)
+    assert r.status_code == 200, r.text
+    assert await rebalance_stripes(TestSession) >= 1
+
+    missing = str(uuid.uuid4())
+    r = await client.get("/inventory/totals", params={"product_id": [product_id, missing]})
+    assert r.status_code == 200, r.text
+    got = {row["product_id"]: row for row in r.json()}
+    assert float(got[product_id]["on_hand"]) == 15
+    assert float(got[product_id]["reserved"]) == 4
+    assert float(got[product_id]["available"]) == 11
+    assert float(got[missing]["on_hand"]) == 0
+
+
+@pytest.mark.asyncio
+async def test_availability_version_follows_writes_and_compaction(
+    client: AsyncClient, admin_token: str, product_id: str, location_id: str, TestSession
+):
+    # по этим токенам запрос присоединяется к уже идущему чтению итогов
+    key = {"product_id": product_id, "location_id": location_id}
+    h = _bearer(admin_token)
+    by_product = availability_version(product_ids=[uuid.UUID(product_id)])
+    by_location = availability_version(
+        product_ids=[uuid.UUID(product_id)], location_ids=[uuid.UUID(location_id)]
+    )
+
+    async def tokens() -> list[tuple]:
+        async with TestSession() as s:
+            return [tuple((await s.execute(q)).one()) for q in (by_product, by_location)]
+
+    seen = [await tokens()]
+    r = await client.post("/inventory/adjust", json={**key, "delta": "3"}, headers=h)
+    assert r.status_code == 200, r.text
+    seen.append(await tokens())
+    await compact_stock_totals(TestSession)
+    seen.append(await tokens())
+    r = await client.post("/inventory/reserve", json={**key, "qty": "1"}, headers=h)
+    assert r.status_code == 200, r.text
+    seen.append(await tokens())
+
+    totals_seen, levels_seen = zip(*seen)
+    assert len(set(totals_seen)) == 4
+    # свёртка не трогает позиции: токен по локациям меняют только записи
+    assert levels_seen[1] == levels_seen[2]
+    assert len(set(levels_seen)) == 3
+
+
+@pytest.mark.asyncio
+async def test_concurrent_batches_on_shared_products_do_not_deadlock(
+    client: AsyncClient,
+    admin_token: str,
+    product_id: str,
+    location_id: str,
+    created_skus: list[str],
+    created_location_codes: list[str],
+    TestSession,
+):
+    h = _bearer(admin_token)
+    sku = f"SKU-INV-{uuid.uuid4().hex[:8]}"
+    r = await client.post("/products", json={"sku": sku, "name": "Second"}, headers=h)
+    assert r.status_code in (200, 201), r.text
+    created_skus.append(sku)
+    products = (product_id, r.json()["id"])
+    other = await _location(client, admin_token, created_location_codes)
+
+    def _batch(loc: str):
+        # в одной транзакции товары P1, P2; итоги по товарам общие для обеих локаций
+        ops = [
+            {"op": "adjust", "product_id": p, "location_id": loc, "delta": "1"} for p in products
+        ]
+        return client.post("/inventory/batch", json={"operations": ops}, headers=h)
+
+    for _ in range(20):
+        responses = await asyncio.gather(_batch(location_id), _batch(other))
+        assert all(r.status_code == 200 for r in responses), [r.text for r in responses]
+
+    r = await client.get("/inventory/totals", params={"product_id": list(products)})
+    assert [float(row["on_hand"]) for row in r.json()] == [40, 40]
+    assert await compact_stock_totals(TestSession) > 0
+    r = await client.get("/inventory/totals", params={"product_id": list(products)})
+    assert [float(row["on_hand"]) for row in r.json()] == [40, 40]
+
+
+@pytest.mark.asyncio
+async def test_bulk_availability_is_columnar_and_conditional(
+    client: AsyncClient,
+    admin_token: str,
+    product_id: str,
+    location_id: str,
+    created_location_codes: list[str],
+):
+    other = await _location(client, admin_token, created_location_codes)
+    h = _bearer(admin_token)
+    for loc, qty in ((location_id, "4"), (other, "6")):
+        r = await client.post(
+            "/inventory/adjust",
+            json={"product_id": product_id, "location_id": loc, "delta": qty},
+            headers=h,
+        )
+        assert r.status_code == 200, r.text
+    sku = (await client.get("/inventory/snapshot", params={
+        "product_id": product_id, "location_id": location_id, "include_codes": "true",
+    })).json()[0]["sku"]
+
+    body = {"skus": [sku, "NO-SUCH-SKU"]}
+    r = await client.post("/inventory/availability", json=body)
+    assert r.status_code == 200, r.text
+    data = r.json()
+    assert data["product_id"] == [product_id]
+    assert [float(v) for v in data["available"]] == [10]
+    assert data["not_found"] == ["NO-SUCH-SKU"]
+
+    r2 = await client.post(
+        "/inventory/availability", json=body, headers={"If-None-Match": r.headers["ETag"]}
+    )
+    assert r2.status_code == 304
+
+    r = await client.post(
+        "/inventory/availability", json={"product_ids": [product_id], "location_ids": [other]}
+    )
+    assert [float(v) for v in r.json()["on_hand"]] == [6]
+
+
+@pytest.mark.asyncio
+async def test_stock_cache_is_invalidated_by_notify(
+    client: AsyncClient, admin_token: str, product_id: str, location_id: str, test_engine
+):
+    h = _bearer(admin_token)
+    key = {"product_id": product_id, "location_id": location_id}
+    r = await client.post("/inventory/adjust", json={**key, "delta": "7"}, headers=h)
+    assert r.status_code == 200, r.text
+
+    listener = asyncio.create_task(listen_for_changes(test_engine, stock_cache))
+    try:
+        for _ in range(100):
+            if stock_cache.active:
+                break
+            await asyncio.sleep(0.05)
+        assert stock_cache.active
+
+        hits = stock_cache.stats()["hits"]
+        for _ in range(2):
+            r = await client.get("/inventory/totals", params={"product_id": product_id})
+            assert float(r.json()[0]["on_hand"]) == 7
+        assert stock_cache.stats()["hits"] == hits + 1
+
+        # запись идёт мимо кэша; сброс приходит через NOTIFY из триггера
+        invalidations = stock_cache.invalidations
+        r = await client.post("/inventory/adjust", json={**key, "delta": "3"}, headers=h)
+        assert r.status_code == 200, r.text
+        for _ in range(100):
+            if stock_cache.invalidations > invalidations:
+                break
+            await asyncio.sleep(0.05)
+        assert stock_cache.invalidations > invalidations
+
+        r = await client.get("/inventory/totals", params={"product_id": product_id})
+        assert float(r.json()[0]["on_hand"]) == 10
+        r = await client.get("/inventory/snapshot", params={"product_id": product_id})
+        assert [float(row["available"]) for row in r.json()] == [10]
+    finally:
+        listener.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await listener
+    assert not stock_cache.active
+
+
+@pytest.mark.asyncio
+async def test_stock_as_of_replays_journal_from_checkpoint(
+    client: AsyncClient,
+    admin_token: str,
+    product_id: str,
+    location_id: str,
+    created_location_codes: list[str],
+    TestSession,
+):
+    async def db_now() -> str:
+        async with TestSession() as s:
+            return (await s.scalar(select(func.clock_timestamp()))).isoformat()
+
+    async def as_of(at: str) -> dict:
+        r = await client.get("/inventory/as-of", params={"at": at, "product_id": product_id})
+        assert r.status_code == 200, r.text
+        return {
+            row["location_id"]: (float(row["on_hand"]), float(row["reserved"]))
+            for row in r.json()
+        }
+
+    other = await _location(client, admin_token, created_location_codes)
+    h = _bearer(admin_token)
+    key = {"product_id": product_id, "location_id": location_id}
+    t0 = await db_now()
+    r = await client.post("/inventory/adjust", json={**key, "delta": "10"}, headers=h)
+    assert r.status_code == 200, r.text
+    t1 = await db_now()
+    assert await take_checkpoint(TestSession, lag_seconds=0) >= 1
+
+    r = await client.post(
+        "/inventory/move",
+        json={"product_id": product_id, "from_location_id": location_id,
+              "to_location_id": other, "qty": "3"},
+        headers=h,
+    )
+    assert r.status_code == 200, r.text
+    r = await client.post("/inventory/reserve", json={**key, "qty": "2"}, headers=h)
+    assert r.status_code == 200, r.text
+    r = await client.post(
+        "/inventory/adjust",
+        json={"product_id": product_id, "location_id": other, "delta": "-1"},
+        headers=h,
+    )
+    assert r.status_code == 200, r.text
+    t2 = await db_now()
+
+    expected = {location_id: (7, 2), other: (2, 0)}
+    assert await as_of(t0) == {}
+    assert await as_of(t1) == {location_id: (10, 0)}
+    # хвост после точки доигрывается из журнала...
+    assert await as_of(t2) == expected
+    # ...и после следующей точки ответ тот же
+    assert await take_checkpoint(TestSession, lag_seconds=0) >= 2
+    assert await as_of(t2) == expected
+    assert await as_of(t1) == {location_id: (10, 0)}
+
+    r = await client.get("/inventory/as-of", params={
+        "at": "2026-01-01T00:00:00", "product_id": product_id,
+    })
+    assert r.status_code == 400
+    # до базовой точки (снята миграцией с живых остатков) журнал не доигрывается
+    r = await client.get("/inventory/as-of", params={
+        "at": "2000-01-01T00:00:00+00:00", "product_id": product_id,
+    })
+    assert r.status_code == 400
+    assert r.json()["detail"].startswith("Stock history is available from")
+
+
+@pytest.mark.asyncio
+async def test_journal_is_paged_by_keyset_and_filtered(
+    client: AsyncClient,
+    admin_token: str,
+    product_id: str,
+    location_id: str,
+    created_location_codes: list[str],
+):
+    other = await _location(client, admin_token, created_location_codes)
+    h = _bearer(admin_token)
+    key = {"product_id": product_id, "location_id": location_id}
+    for path, body in (
+        ("/inventory/adjust", {**key, "delta": "5"}),
+        ("/inventory/reserve", {**key, "qty": "2", "reference": "ORD-TXN-1"}),
+        ("/inventory/release", {**key, "qty": "2"}),
+        ("/inventory/move", {"product_id": product_id, "from_location_id": location_id,
+                             "to_location_id": other, "qty": "1"}),
+    ):
+        r = await client.post(path, json=body, headers=h)
+        assert r.status_code == 200, r.text
+
+    seen, cursor = [], None
+    while True:
+        params = {"product_id": product_id, "limit": 3, **({"cursor": cursor} if cursor else {})}
+        r = await client.get("/inventory/txns", params=params, headers=h)
+        assert r.status_code == 200, r.text
+        seen += [row["txn_type"] for row in r.json()]
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == ["TRANSFER", "RELEASE", "RESERVE", "ADJUSTMENT"]
+
+    r = await client.get(
+        "/inventory/txns", params={"product_id": product_id, "order": "asc", "limit": 1}, headers=h
+    )
+    assert [row["txn_type"] for row in r.json()] == ["ADJUSTMENT"]
+    r = await client.get("/inventory/txns", params={"reference": "ORD-TXN-1"}, headers=h)
+    assert [row["txn_type"] for row in r.json()] == ["RESERVE"]
+    r = await client.get(
+        "/inventory/txns",
+        params={"location_id": other, "txn_type": ["TRANSFER", "OUT"]},
+        headers=h,
+    )
+    assert [row["to_location_id"] for row in r.json()] == [other]
+
+    r = await client.get("/inventory/txns", params={"cursor": "bogus"}, headers=h)
+    assert r.status_code == 400
+    r = await client.get("/inventory/txns")
+    assert r.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_applied_idempotent_request_is_never_run_again(
+    client: AsyncClient,
+    admin_token: str,
+    product_id: str,
+    location_id: str,
+    created_skus: list[str],
+    created_location_codes: list[str],
+    monkeypatch: pytest.MonkeyPatch,
+    TestSession,
+):
+    key = {"product_id": product_id, "location_id": location_id}
+    retry = {**_bearer(admin_token), "Idempotency-Key": str(uuid.uuid4())}
+
+    # изменение закоммичено, а ответ сохранить не удалось (упала БД или процесс)
+    async def lost(*args, **kwargs):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(idempotency_api, "complete_key", lost)
+    with pytest.raises(RuntimeError):
+        await client.post("/inventory/adjust", json={**key, "delta": "5"}, headers=retry)
+    monkeypatch.undo()
+
+    # ключ не освобождается и не перехватывается даже через час: повтор не применяется
+    for _ in range(2):
+        r = await client.post("/inventory/adjust", json={**key, "delta": "5"}, headers=retry)
+        assert r.status_code == 409, r.text
+        async with TestSession() as s:
+            await s.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.status_code.is_(None))
+                .values(created_at=func.now() - func.make_interval(0, 0, 0, 0, 1))
+            )
+            await s.commit()
+    assert (await _snapshot(client, product_id, location_id))["on_hand"] == "5.0000"
+
+    # загрузка multipart не читается целиком ради хэша, но повтор всё равно отдаётся
+    body = f"sku;location_code;qty\n{created_skus[-1]};{created_location_codes[-1]};8\n"
+    files = {"file": ("count.csv", body.encode(), "text/csv")}
+    retry["Idempotency-Key"] = str(uuid.uuid4())
+    first = await client.post("/inventory/stocktake", files=files, headers=retry)
+    assert first.status_code == 200, first.text
+    again = await client.post("/inventory/stocktake", files=files, headers=retry)
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.json() == first.json()
+
+
+@pytest.mark.asyncio
+async def test_stocktake_dry_run_reports_variance_and_apply_writes_adjustment(
+    client: AsyncClient,
+    admin_token: str,
+    product_id: str,
+    location_id: str,
+    created_skus: list[str],
+    created_location_codes: list[str],
+):
+    h = _bearer(admin_token)
+    key = {"product_id": product_id, "location_id": location_id}
+    sku, code = created_skus[-1], created_location_codes[-1]
+    r = await client.post("/inventory/adjust", json={**key, "delta": "10"}, headers=h)
+    assert r.status_code == 200, r.text
+    r = await client.post(
+        "/inventory/reserve", json={**key, "qty": "3", "reference": "ORD-STK-1"}, headers=h
+    )
+    assert r.status_code == 200, r.text
+
+    # пересчёт: 7 вместо 10, неизвестный SKU и кривое количество идут в ошибки
+    body = f"Артикул;Склад;Количество\n{sku};{code};7\nNO-SUCH-{sku};{code};1\n{sku};{code};x\n"
+    files = {"file": ("count.csv", body.encode("cp1251"), "text/csv")}
+    r = await client.post("/inventory/stocktake", params={"dry_run": True}, files=files, headers=h)
+    assert r.status_code == 200, r.text
+    report = r.json()
+    assert report["status"] == "dry_run"
+    assert (report["rows"], report["invalid"], report["pairs"], report["changed"]) == (2, 2, 1, 1)
+    assert [e["line"] for e in report["errors"]] == [4, 3]
+    assert report["errors"][1]["error"].startswith("unknown sku")
+    assert report["variances"] == [
+        {"sku": sku, "location_code": code, "on_hand": "10.0000", "counted": "7.0000",
+         "delta": "-3.0000", "reserved": "3.0000"}
+    ]
+    assert (await _snapshot(client, product_id, location_id))["on_hand"] == "10.0000"
+
+    # NDJSON, последняя строка по паре побеждает; ниже резерва — применяется, но в отчёте
+    lines = [{"sku": sku, "location": code, "qty": 1}, {"sku": sku, "location": code, "qty": 2}]
+    body = "\n".join(json.dumps(line) for line in lines)
+    files = {"file": ("count.ndjson", body.encode(), "application/x-ndjson")}
+    r = await client.post(
+        "/inventory/stocktake", params={"reference": "STK-1"}, files=files, headers=h
+    )
+    assert r.status_code == 200, r.text
+    report = r.json()
+    assert report["status"] == "applied"
+    assert (report["decrease"], report["below_reserved"]) == ("8.0000", 1)
+    snap = await _snapshot(client, product_id, location_id)
+    assert (snap["on_hand"], snap["reserved"]) == ("2.0000", "3.0000")
+
+    r = await client.get("/inventory/txns", params={"reference": "STK-1"}, headers=h)
+    rows = r.json()
+    assert [(t["txn_type"], t["qty"], t["from_location_id"]) for t in rows] == [
+        ("ADJUSTMENT", "8.0000", location_id)
+    ]
+    assert rows[0]["reason"] == "stocktake"
+
+    # повторная инвентаризация с тем же итогом ничего не меняет
+    r = await client.post("/inventory/stocktake", files=files, headers=h)
+    assert r.json()["changed"] == 0
+
+    files = {"file": ("count.xlsx", b"", "application/octet-stream")}
+    r = await client.post("/inventory/stocktake", files=files, headers=h)
+    assert r.status_code == 400
@@ -0,0 +1,94 @@
+# app/tests/test_partitions.py
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import pytest
+
+from app.models import InventoryCheckpoint, Location, Product
+from app.services.history import history_start
+from app.services.partitions import (
+    Partition,
+    advance_history_start,
+    ensure_partitions,
+    expired_partitions,
+    list_partitions,
+    missing_months,
+)
+
+
+def _utc(year: int, month: int, day: int = 1) -> datetime:
+    return datetime(year, month, day, tzinfo=timezone.utc)
+
+
+# старая таблица до ноября 2026 включительно, дальше помесячно, плюс DEFAULT
+PARTITIONS = [
+    Partition("inventory_txn_legacy", None, _utc(2026, 11)),
+    Partition("inventory_txn_p2026_11", _utc(2026, 11), _utc(2026, 12)),
+    Partition("inventory_txn_p2026_12", _utc(2026, 12), _utc(2027, 1)),
+    Partition("inventory_txn_default", None, None, default=True),
+]
+
+
+def test_missing_months_skip_covered_ranges_and_cross_years():
+    assert missing_months(PARTITIONS, _utc(2026, 10, 18), 3) == [_utc(2027, 1)]
+    assert missing_months(PARTITIONS, _utc(2026, 12, 31), 2) == [_utc(2027, 1), _utc(2027, 2)]
+
+
+def _names(parts) -> list[str]:
+    return [p.name for p in parts]
+
+
+def test_expired_partitions_respect_retention_and_last_checkpoint():
+    now = _utc(2027, 3, 15)
+    assert _names(expired_partitions(PARTITIONS, now, 3, _utc(2027, 3, 14))) == [
+        "inventory_txn_legacy", "inventory_txn_p2026_11",
+    ]
+    # журнал после последней контрольной точки нужен для запросов «на дату»
+    assert _names(expired_partitions(PARTITIONS, now, 3, _utc(2026, 11, 20))) == [
+        "inventory_txn_legacy",
+    ]
+    assert expired_partitions(PARTITIONS, now, 3, None) == []
+    assert expired_partitions(PARTITIONS, now, 0, _utc(2027, 3, 14)) == []
+
+
+@pytest.mark.asyncio
+async def test_ensure_partitions_is_idempotent(TestSession):
+    await ensure_partitions(TestSession, months_ahead=2)
+    assert await ensure_partitions(TestSession, months_ahead=2) == []
+    async with TestSession() as session:
+        partitions = await list_partitions(session)
+    assert sum(p.default for p in partitions) == 1
+    ranges = sorted((p.lower, p.upper) for p in partitions if p.lower and p.upper)
+    # соседние месяцы стыкуются без дыр
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+
+
+@pytest.mark.asyncio
+async def test_removed_partitions_move_history_start_to_next_checkpoint(TestSession):
+    tag = uuid4().hex[:8]
+    async with TestSession() as session:
+        # всё в одной транзакции с откатом: общая тестовая база не меняется
+        async with session.begin():
+            product = Product(sku=f"SKU-HS-{tag}", name="History")
+            location = Location(code=f"LOC-HS-{tag}", name="History")
+            session.add_all([product, location])
+            await session.flush()
+            session.add_all([
+                InventoryCheckpoint(
+                    product_id=product.id, location_id=location.id,
+                    taken_at=taken_at, on_hand=0, reserved=0,
+                )
+                for taken_at in (_utc(2030, 11, 10), _utc(2030, 11, 20), _utc(2030, 12, 5))
+            ])
+            await session.flush()
+            removed = [
+                Partition("inventory_txn_legacy", None, _utc(2030, 11)),
+                Partition("inventory_txn_p2030_11", _utc(2030, 11), _utc(2030, 11, 15)),
+            ]
+            # журнал до 15.11 удалён: ответ «на дату» полон только с точки 20.11
+            starts_at = await advance_history_start(session, removed, _utc(2030, 12, 5))
+            assert starts_at == _utc(2030, 11, 20)
+            assert await history_start(session) == _utc(2030, 11, 20)
+            await session.rollback()
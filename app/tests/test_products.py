@@ -1,8 +1,16 @@
 # app/tests/test_products.py
 from __future__ import annotations
 
+import uuid
+from pathlib import Path
+
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import delete, select
+
+from app.core.config import settings
+from app.models import ImportJob, Product
+from app.services.import_jobs import run_import_jobs
 
 
 def _bearer(token: str) -> dict:
@@ -68,3 +76,221 @@ async def test_create_product_unauthorized(client: AsyncClient):
     r = await client.post("/products", json=payload)  # без токена
     # get_current_user в итоге вернёт 401
     assert r.status_code == 401, r.text
+
+
+@pytest.mark.asyncio
+async def test_list_products_conditional_get(
+    client: AsyncClient, admin_token: str, created_skus: list[str]
+):
+    r = await client.get("/products")
+    assert r.status_code == 200, r.text
+    etag = r.headers["ETag"]
+
+    r = await client.get("/products", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+
+    sku = "SKU-ETAG-001"
+    r = await client.post(
+        "/products", json={"sku": sku, "name": "ETag", "unit": "pcs"},
+        headers=_bearer(admin_token),
+    )
+    assert r.status_code in (200, 201), r.text
+    created_skus.append(sku)
+
+    r = await client.get("/products", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    assert sku in {p["sku"] for p in r.json()}
+
+
+@pytest.mark.asyncio
+async def test_list_products_etag_sees_late_commit_of_long_transaction(
+    client: AsyncClient, admin_token: str, created_skus: list[str], TestSession
+):
+    h = _bearer(admin_token)
+    skus = [f"SKU-ETAG-{uuid.uuid4().hex[:8]}" for _ in range(2)]
+    for sku in skus:
+        r = await client.post("/products", json={"sku": sku, "name": "ETag"}, headers=h)
+        assert r.status_code in (200, 201), r.text
+        created_skus.append(sku)
+
+    async with TestSession() as s:
+        # долгая транзакция (как фоновый импорт): now() в ней раньше следующей записи
+        async with s.begin():
+            res = await s.execute(select(Product).where(Product.sku.in_(skus)))
+            long_lived, other = sorted(res.scalars(), key=lambda p: skus.index(p.sku))
+            r = await client.put(
+                f"/products/{other.id}/stock-stripes", json={"stripes": 2}, headers=h
+            )
+            assert r.status_code == 200, r.text
+            r = await client.get("/products")
+            etag = r.headers["ETag"]
+            long_lived.name = "Renamed in a long transaction"
+
+    r = await client.get("/products", headers={"If-None-Match": etag})
+    assert r.status_code == 200, r.text
+    assert r.headers["ETag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_import_csv_streams_batches_and_reports_counts(
+    client: AsyncClient, admin_token: str, created_skus: list[str], monkeypatch
+):
+    # несколько пачек COPY даже на маленьком файле
+    monkeypatch.setattr(settings, "PRODUCT_IMPORT_BATCH_ROWS", 2)
+    r = await client.post(
+        "/products", json={"sku": "SKU-IMP-001", "name": "Old", "unit": "pcs"},
+        headers=_bearer(admin_token),
+    )
+    assert r.status_code in (200, 201), r.text
+    created_skus.extend(["SKU-IMP-001", "SKU-IMP-002", "SKU-IMP-003"])
+
+    body = (
+        "Артикул;Наименование;Ед;Описание\n"
+        "SKU-IMP-001;Уже есть;шт;\n"
+        "SKU-IMP-002;Первый;шт;\n"
+        ";Без артикула;;\n"
+        "SKU-IMP-003;Второй;;\"две\nстроки\"\n"
+        "SKU-IMP-002;Повтор в файле;кг;\n"
+    ).encode("cp1251")
+    r = await client.post(
+        "/products/import-csv",
+        files={"file": ("catalog.csv", body, "text/csv")},
+        headers=_bearer(admin_token),
+    )
+    assert r.status_code == 200, r.text
+    result = r.json()
+    assert (result["inserted"], result["skipped"], result["invalid"]) == (2, 2, 1)
+    assert result["errors"] == [{"line": 4, "error": "sku and name are required"}]
+
+    r = await client.get("/products")
+    by_sku = {p["sku"]: p for p in r.json()}
+    assert by_sku["SKU-IMP-001"]["name"] == "Old"
+    # последнее вхождение SKU в файле побеждает
+    assert by_sku["SKU-IMP-002"]["name"] == "Повтор в файле"
+    assert by_sku["SKU-IMP-002"]["unit"] == "кг"
+    assert by_sku["SKU-IMP-003"]["unit"] == "pcs"
+
+
+@pytest.mark.asyncio
+async def test_import_csv_upsert_touches_only_changed_rows(
+    client: AsyncClient, admin_token: str, created_skus: list[str], TestSession
+):
+    skus = ["SKU-UPS-001", "SKU-UPS-002"]
+    created_skus.extend([*skus, "SKU-UPS-003"])
+    first = "sku,name,unit,description\nSKU-UPS-001,Same,pcs,\nSKU-UPS-002,Before,kg,Old text\n"
+    r = await client.post(
+        "/products/import-csv",
+        files={"file": ("a.csv", first.encode(), "text/csv")},
+        headers=_bearer(admin_token),
+    )
+    assert r.json()["inserted"] == 2, r.text
+
+    async def stamps() -> dict:
+        async with TestSession() as s:
+            res = await s.execute(
+                select(Product.sku, Product.name, Product.updated_at).where(Product.sku.in_(skus))
+            )
+            return {sku: (name, updated_at) for sku, name, updated_at in res}
+
+    before = await stamps()
+    # пустая ячейка и отсутствующая колонка не затирают данные каталога
+    second = "sku,name,unit\nSKU-UPS-001,Same,\nSKU-UPS-002,After,\nSKU-UPS-003,New,\n"
+    r = await client.post(
+        "/products/import-csv?mode=upsert",
+        files={"file": ("b.csv", second.encode(), "text/csv")},
+        headers=_bearer(admin_token),
+    )
+    assert r.status_code == 200, r.text
+    result = r.json()
+    assert (result["inserted"], result["updated"], result["skipped"]) == (1, 1, 1)
+
+    after = await stamps()
+    # неизменённая строка не переписана: updated_at прежний
+    assert after["SKU-UPS-001"] == before["SKU-UPS-001"]
+    assert after["SKU-UPS-002"][0] == "After"
+    assert after["SKU-UPS-002"][1] > before["SKU-UPS-002"][1]
+    async with TestSession() as s:
+        res = await s.execute(
+            select(Product.sku, Product.unit, Product.description)
+            .where(Product.sku.in_([*skus, "SKU-UPS-003"]))
+            .order_by(Product.sku)
+        )
+        assert [tuple(row) for row in res] == [
+            ("SKU-UPS-001", "pcs", None),
+            ("SKU-UPS-002", "kg", "Old text"),
+            ("SKU-UPS-003", "pcs", None),
+        ]
+
+
+@pytest.mark.asyncio
+async def test_import_csv_background_job_reports_progress(
+    client: AsyncClient, admin_token: str, created_skus: list[str], TestSession
+):
+    skus = [f"SKU-JOB-{n:03d}" for n in range(5)]
+    created_skus.extend(skus)
+    body = "sku,name\n" + "".join(f"{sku},Job item\n" for sku in skus) + ",no sku\n"
+    r = await client.post(
+        "/products/import-csv?background=true",
+        files={"file": ("job.csv", body.encode(), "text/csv")},
+        headers=_bearer(admin_token),
+    )
+    assert r.status_code == 202, r.text
+    job_id = r.json()["job_id"]
+    assert r.headers["Location"] == f"/jobs/{job_id}"
+
+    try:
+        r = await client.get(f"/jobs/{job_id}", headers=_bearer(admin_token))
+        assert r.json()["status"] == "QUEUED"
+
+        # в тестах lifespan не запускается: очередь разбираем сами
+        assert await run_import_jobs(TestSession) >= 1
+
+        r = await client.get(f"/jobs/{job_id}", headers=_bearer(admin_token))
+        job = r.json()
+        assert job["status"] == "DONE", job
+        assert (job["rows_processed"], job["rows_invalid"], job["progress"]) == (6, 1, 1.0)
+        assert job["result"]["inserted"] == 5
+        assert job["rows_per_second"] > 0
+        assert not Path((await _job_row(TestSession, job_id)).spool_path).exists()
+    finally:
+        async with TestSession() as s:
+            await s.execute(delete(ImportJob).where(ImportJob.id == job_id))
+            await s.commit()
+
+
+async def _job_row(session_factory, job_id) -> ImportJob:
+    async with session_factory() as s:
+        return await s.get(ImportJob, uuid.UUID(job_id))
+
+
+@pytest.mark.asyncio
+async def test_export_csv_streams_encoded_and_gzipped(
+    client: AsyncClient, admin_token: str, created_skus: list[str]
+):
+    sku = "SKU-EXP-001"
+    r = await client.post(
+        "/products",
+        json={"sku": sku, "name": "Выгрузка", "unit": "шт", "description": "две\nстроки"},
+        headers=_bearer(admin_token),
+    )
+    assert r.status_code in (200, 201), r.text
+    created_skus.append(sku)
+
+    r = await client.get(
+        "/products/export-csv",
+        params={"delimiter": ";", "encoding": "cp1251", "gzip": "true"},
+        headers={**_bearer(admin_token), "Accept-Encoding": "gzip"},
+    )
+    assert r.status_code == 200, r.text
+    assert r.headers["content-encoding"] == "gzip"
+    # httpx уже распаковал тело
+    lines = r.content.decode("cp1251").splitlines()
+    assert lines[0] == "sku;name;unit;description"
+    assert f"{sku};Выгрузка;шт;две строки" in lines
+
+    r = await client.get(
+        "/products/export-csv", params={"encoding": "no-such"}, headers=_bearer(admin_token)
+    )
+    assert r.status_code == 400
@@ -0,0 +1,88 @@
+# app/tests/test_purchase.py
+from __future__ import annotations
+
+import uuid
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import delete
+
+from app.models import PurchaseOrder, Supplier
+
+
+def _bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def _create(client: AsyncClient, url: str, payload: dict, h: dict) -> str:
+    r = await client.post(url, json=payload, headers=h)
+    assert r.status_code in (200, 201), r.text
+    return r.json()["id"]
+
+
+@pytest.mark.asyncio
+async def test_receive_po_is_idempotent(
+    client: AsyncClient,
+    admin_token: str,
+    viewer_token: str,
+    created_skus: list[str],
+    created_location_codes: list[str],
+    TestSession,
+):
+    h = _bearer(admin_token)
+    sku, code = f"SKU-PO-{uuid.uuid4().hex[:8]}", f"LOC-{uuid.uuid4().hex[:8]}"
+    product_id = await _create(client, "/products", {"sku": sku, "name": "PO test"}, h)
+    created_skus.append(sku)
+    location_id = await _create(client, "/locations", {"code": code, "name": "Dock"}, h)
+    created_location_codes.append(code)
+    supplier_id = await _create(client, "/purchase/suppliers", {"name": "Test supplier"}, h)
+    po_id = await _create(client, "/purchase/orders", {"supplier_id": supplier_id}, h)
+    try:
+        r = await client.post(
+            f"/purchase/orders/{po_id}/lines",
+            json={"product_id": product_id, "qty_ordered": "10"},
+            headers=h,
+        )
+        assert r.status_code == 200, r.text
+        line_id = r.json()["line_id"]
+
+        body = {"lines": [{"line_id": line_id, "qty": "4", "location_id": location_id}]}
+        retry = {**h, "Idempotency-Key": str(uuid.uuid4())}
+        first = await client.post(f"/purchase/orders/{po_id}/receive", json=body, headers=retry)
+        assert first.status_code == 200, first.text
+        # повтор после таймаута клиента не принимает товар второй раз
+        again = await client.post(f"/purchase/orders/{po_id}/receive", json=body, headers=retry)
+        assert again.status_code == 200, again.text
+        assert again.headers["Idempotent-Replayed"] == "true"
+        assert again.json() == first.json()
+        # ключ принадлежит вызывающему: без токена и с чужим токеном ответ не отдаётся
+        anonymous = {"Idempotency-Key": retry["Idempotency-Key"]}
+        r = await client.post(f"/purchase/orders/{po_id}/receive", json=body, headers=anonymous)
+        assert r.status_code == 401, r.text
+        r = await client.post(
+            f"/purchase/orders/{po_id}/receive",
+            json=body,
+            headers={**_bearer(viewer_token), **anonymous},
+        )
+        assert r.status_code == 403, r.text
+        assert "Idempotent-Replayed" not in r.headers
+
+        r = await client.get(
+            "/inventory/snapshot", params={"product_id": product_id, "location_id": location_id}
+        )
+        assert float(r.json()[0]["on_hand"]) == 4
+
+        # тот же ключ с другим телом — ошибка клиента, а не повтор
+        body["lines"][0]["qty"] = "5"
+        r = await client.post(f"/purchase/orders/{po_id}/receive", json=body, headers=retry)
+        assert r.status_code == 422, r.text
+
+        body["lines"][0]["qty"] = "7"
+        r = await client.post(f"/purchase/orders/{po_id}/receive", json=body, headers=h)
+        assert r.status_code == 400, r.text
+        assert r.json()["detail"] == "Receive qty exceeds remaining"
+    finally:
+        async with TestSession() as s:
+            await s.execute(delete(PurchaseOrder).where(PurchaseOrder.id == uuid.UUID(po_id)))
+            await s.execute(delete(Supplier).where(Supplier.id == uuid.UUID(supplier_id)))
+            await s.commit()
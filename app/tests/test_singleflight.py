@@ -0,0 +1,54 @@
+# app/tests/test_singleflight.py
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from app.core.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight: SingleFlight[int] = SingleFlight()
+    release = asyncio.Event()
+    calls = 0
+
+    async def load() -> int:
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return 42
+
+    waiters = [asyncio.create_task(flight.do("k", load)) for _ in range(5)]
+    await asyncio.sleep(0)
+    # ушедший клиент не отменяет запрос для остальных
+    waiters[0].cancel()
+    release.set()
+    results = await asyncio.gather(*waiters[1:])
+
+    assert results == [42] * 4
+    assert calls == 1
+    assert flight.stats()["executions"] == 1
+    assert flight.stats()["collapsed"] == 4
+    assert flight.stats()["in_flight"] == 0
+
+    # после завершения результат не хранится: следующий вызов идёт в БД заново
+    assert await flight.do("k", load) == 42
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_error_is_shared_and_counted():
+    flight: SingleFlight[int] = SingleFlight()
+
+    async def fail() -> int:
+        await asyncio.sleep(0)
+        raise RuntimeError("db down")
+
+    results = await asyncio.gather(
+        flight.do("k", fail), flight.do("k", fail), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flight.stats()["failures"] == 1
+    assert flight.stats()["collapsed"] == 1
@@ -0,0 +1,120 @@
+"""Pessimistic vs optimistic (version CAS) inventory concurrency benchmark.
+
+Concurrent workers run ``move_stock`` (always the read-modify-write path) between
+random locations of one product. Contention is set by how many locations the
+workers pick from: 2 locations means nearly every pair of calls collides.
+
+    python benchmarks/bench_concurrency.py --workers 32 --ops 100 --locations 2 8 64
+
+Needs a migrated database reachable with the regular settings (.env / env vars).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+import uuid
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import delete  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.db.session import AsyncSessionMaker, engine  # noqa: E402
+from app.errors import ConcurrencyConflictError  # noqa: E402
+from app.models import InventoryTxn, Location, Product  # noqa: E402
+from app.services.inventory import adjust_stock, cas_stats, move_stock  # noqa: E402
+
+
+async def _setup(locations: int) -> tuple[uuid.UUID, list[uuid.UUID]]:
+    async with AsyncSessionMaker() as s:
+        tag = uuid.uuid4().hex[:8]
+        product = Product(sku=f"BENCH-{tag}", name="bench")
+        locs = [Location(code=f"BENCH-{tag}-{n}", name="bench") for n in range(locations)]
+        s.add_all([product, *locs])
+        await s.commit()
+        product_id, location_ids = product.id, [loc.id for loc in locs]
+    for loc in location_ids:
+        async with AsyncSessionMaker() as s:
+            await adjust_stock(
+                s, product_id=product_id, location_id=loc, delta=Decimal("1000000"), reason="bench"
+            )
+    return product_id, location_ids
+
+
+async def _teardown(product_id: uuid.UUID, location_ids: list[uuid.UUID]) -> None:
+    async with AsyncSessionMaker() as s:
+        await s.execute(delete(InventoryTxn).where(InventoryTxn.product_id == product_id))
+        await s.execute(delete(Product).where(Product.id == product_id))
+        await s.execute(delete(Location).where(Location.id.in_(location_ids)))
+        await s.commit()
+
+
+async def _worker(product_id, location_ids, ops: int, latencies: list[float]) -> int:
+    failed = 0
+    for _ in range(ops):
+        src, dst = random.sample(location_ids, 2)
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionMaker() as s:
+                await move_stock(
+                    s, product_id=product_id, from_location_id=src, to_location_id=dst,
+                    qty=Decimal("1"), reason="bench",
+                )
+        except ConcurrencyConflictError:
+            failed += 1
+        latencies.append(time.perf_counter() - started)
+    return failed
+
+
+async def run(mode: str, locations: int, workers: int, ops: int) -> dict:
+    settings.INVENTORY_CONCURRENCY = mode
+    product_id, location_ids = await _setup(locations)
+    before = dict(cas_stats)
+    latencies: list[float] = []
+    started = time.perf_counter()
+    try:
+        failed = await asyncio.gather(
+            *(_worker(product_id, location_ids, ops, latencies) for _ in range(workers))
+        )
+    finally:
+        elapsed = time.perf_counter() - started
+        await _teardown(product_id, location_ids)
+    latencies.sort()
+    return {
+        "mode": mode,
+        "locations": locations,
+        "ops_per_s": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "retries": cas_stats["retries"] - before["retries"],
+        "failed": sum(failed),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--ops", type=int, default=100, help="moves per worker")
+    parser.add_argument("--locations", type=int, nargs="+", default=[2, 8, 64])
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}{'locs':>6}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+          f"{'retries':>9}{'failed':>8}")
+    try:
+        for locations in args.locations:
+            for mode in ("pessimistic", "optimistic"):
+                r = await run(mode, locations, args.workers, args.ops)
+                print(f"{r['mode']:<12}{r['locations']:>6}{r['ops_per_s']:>10.0f}"
+                      f"{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['retries']:>9}{r['failed']:>8}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+"""UUIDv4 vs UUIDv7 primary keys: insert throughput and index size.
+
+Each key kind gets a scratch table shaped like the journal (uuid PK plus a
+``(product_id, created_at)`` index); concurrent workers insert batches of rows with
+ids from the generator and the table is measured afterwards. Random v4 keys split
+pages all over the PK index, so it ends up larger (half-full leaves) and every
+insert touches a cold page once the index outgrows shared_buffers; v7 keys append
+at the right edge.
+
+    python benchmarks/bench_uuid_keys.py --rows 1000000 --batch 1000 --workers 8
+
+Needs a database reachable with the regular settings (.env / env vars); the
+scratch tables are dropped afterwards.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import text  # noqa: E402
+
+from app.core.ids import uuid7  # noqa: E402
+from app.db.session import engine  # noqa: E402
+
+GENERATORS = {"uuid4": uuid.uuid4, "uuid7": uuid7}
+
+
+async def _create(table: str) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        await conn.execute(
+            text(
+                f"CREATE TABLE {table} ("
+                "id uuid PRIMARY KEY, product_id uuid NOT NULL, qty numeric(14, 4) NOT NULL, "
+                "created_at timestamptz NOT NULL DEFAULT now())"
+            )
+        )
+        await conn.execute(
+            text(f"CREATE INDEX {table}_product ON {table} (product_id, created_at)")
+        )
+
+
+async def _worker(table: str, generator, products: list[uuid.UUID], batches: int, batch: int):
+    stmt = text(f"INSERT INTO {table} (id, product_id, qty) VALUES (:id, :product_id, :qty)")
+    for _ in range(batches):
+        rows = [
+            {"id": generator(), "product_id": random.choice(products), "qty": 1}
+            for _ in range(batch)
+        ]
+        async with engine.begin() as conn:
+            await conn.execute(stmt, rows)
+
+
+async def _sizes(table: str) -> dict:
+    async with engine.connect() as conn:
+        res = await conn.execute(
+            text(
+                "SELECT pg_relation_size(CAST(:pkey AS regclass)), "
+                "pg_relation_size(CAST(:table AS regclass))"
+            ),
+            {"pkey": f"{table}_pkey", "table": table},
+        )
+        pkey, heap = res.one()
+    return {"pkey_mb": pkey / 2**20, "heap_mb": heap / 2**20}
+
+
+async def run(kind: str, rows: int, batch: int, workers: int, products: int) -> dict:
+    table = f"bench_pk_{kind}"
+    await _create(table)
+    product_ids = [uuid.uuid4() for _ in range(products)]
+    batches = max(rows // (batch * workers), 1)
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(
+            *(
+                _worker(table, GENERATORS[kind], product_ids, batches, batch)
+                for _ in range(workers)
+            )
+        )
+        elapsed = time.perf_counter() - started
+        sizes = await _sizes(table)
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+    inserted = batches * batch * workers
+    return {"kind": kind, "rows": inserted, "rows_per_s": inserted / elapsed, **sizes}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=500, help="rows per transaction")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--products", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'key':<8}{'rows':>10}{'rows/s':>10}{'pkey MB':>10}{'heap MB':>10}")
+    try:
+        for kind in GENERATORS:
+            r = await run(kind, args.rows, args.batch, args.workers, args.products)
+            print(f"{r['kind']:<8}{r['rows']:>10}{r['rows_per_s']:>10.0f}"
+                  f"{r['pkey_mb']:>10.1f}{r['heap_mb']:>10.1f}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())